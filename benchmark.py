@@ -0,0 +1,331 @@
+# benchmark.py
+import argparse
+import importlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import Config
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "lottolyzer")
+
+BENCHMARKS = []
+# (object, attribute, original value) of state that benchmarks point at their workdir
+_OVERRIDES = []
+
+
+def override(obj, attribute, value):
+    """Set an attribute for the benchmark run; restore_overrides() puts the original back"""
+    _OVERRIDES.append((obj, attribute, getattr(obj, attribute)))
+    setattr(obj, attribute, value)
+
+
+def restore_overrides():
+    while _OVERRIDES:
+        obj, attribute, value = _OVERRIDES.pop()
+        setattr(obj, attribute, value)
+
+
+def benchmark(name, ops_per_call=1, max_calls=Config.BENCH_MAX_CALLS):
+    """Register a benchmark. The decorated function does the setup and returns the callable to time"""
+    def register(setup):
+        BENCHMARKS.append({'name': name, 'setup': setup, 'ops_per_call': ops_per_call, 'max_calls': max_calls})
+        return setup
+    return register
+
+
+class _OkHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Generator
+
+@benchmark("generate_toto_numbers")
+def bench_generate_toto_numbers(workdir):
+    from toto_generator import TotoGenerator
+    generator = TotoGenerator()
+    return generator.generate_toto_numbers
+
+
+@benchmark("generate_multiple_sets[10]", ops_per_call=10)
+def bench_generate_multiple_sets(workdir):
+    from toto_generator import TotoGenerator
+    generator = TotoGenerator()
+    return lambda: generator.generate_multiple_sets(10, unique=False)
+
+
+@benchmark("generate_bulk[100k]", ops_per_call=100000)
+def bench_generate_bulk(workdir):
+    from toto_generator import TotoGenerator
+    generator = TotoGenerator()
+    return lambda: generator.generate_bulk(100000)
+
+
+@benchmark("seeded.generate_bulk[100k]", ops_per_call=100000)
+def bench_seeded_generate_bulk(workdir):
+    from toto_seeded import SeededGenerator
+    generator = SeededGenerator("bench")
+    return lambda: generator.generate_bulk("bench", 100000)
+
+
+@benchmark("seeded.numbers[random access]")
+def bench_seeded_numbers(workdir):
+    from toto_seeded import SeededGenerator
+    generator = SeededGenerator("bench")
+    return lambda: generator.numbers("bench", 123456789)
+
+
+@benchmark("parse_user_input", ops_per_call=6)
+def bench_parse_user_input(workdir):
+    from toto_generator import TotoGenerator
+    generator = TotoGenerator()
+    inputs = ["5", "3 7", "10 12", "hello", "11", "2 x"]
+
+    def run():
+        for text in inputs:
+            generator.parse_user_input(text)
+    return run
+
+
+# Formatter
+
+@benchmark("format_telegram_message[10]")
+def bench_format_telegram_message(workdir):
+    import update_ledger
+    from telegram_listener import TelegramListener
+    from toto_generator import TotoGenerator
+    override(update_ledger, '_ledger', update_ledger.UpdateLedger(os.path.join(workdir, "ledger.db")))
+    listener = TelegramListener()
+    result = TotoGenerator().generate_multiple_sets(10, 7, unique=False)
+    return lambda: listener.format_telegram_message(result)
+
+
+# Persistence
+
+@benchmark("save_generated_numbers[10]", ops_per_call=10)
+def bench_save_generated_numbers(workdir):
+    from save_file import save_generated_numbers
+    from toto_generator import TotoGenerator
+    override(Config, 'GENERATED_NUMBERS_FILE', os.path.join(workdir, "generated_numbers.csv"))
+    sets = [s['numbers'] for s in TotoGenerator().generate_multiple_sets(10, unique=False)['sets']]
+    return lambda: save_generated_numbers(sets, user_id="bench", message_id=1)
+
+
+@benchmark("save_compact_tickets[100k]", ops_per_call=100000)
+def bench_save_compact_tickets(workdir):
+    from save_file import load_compact_tickets, save_compact_tickets
+    from toto_generator import TotoGenerator
+    tickets = TotoGenerator().generate_bulk(100000)
+    path = os.path.join(workdir, "tickets.bin")
+
+    def run():
+        save_compact_tickets(tickets, path)
+        load_compact_tickets(path)
+    return run
+
+
+# Bounded so the background writer can drain the queued rows quickly afterwards
+@benchmark("save_to_google_sheets[10]", ops_per_call=10, max_calls=200)
+def bench_save_to_google_sheets(workdir):
+    import save_file
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _OkHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    override(save_file, '_sheets_writer', save_file.SheetsWriter(
+        webhook_url=f"http://127.0.0.1:{server.server_port}/",
+        spill_file=os.path.join(workdir, "sheets_spill.jsonl")
+    ))
+    save_file._sheets_writer.start()
+    formatted = [f"{i} - 2 - 3 - 4 - 5 - 6" for i in range(10)]
+    return lambda: save_file.save_to_google_sheets(formatted, "bench", 1)
+
+
+@benchmark("ticket_store.add_tickets[10k]", ops_per_call=10000)
+def bench_ticket_store(workdir):
+    from ticket_store import TicketStore
+    from toto_generator import TotoGenerator
+    store = TicketStore(os.path.join(workdir, "bench.db"))
+    tickets = TotoGenerator().generate_bulk(10000)
+    return lambda: store.add_tickets(tickets, user_id="bench")
+
+
+# Instrumentation
+
+@benchmark("metrics.time[stage]")
+def bench_metrics_time(workdir):
+    from toto_metrics import Metrics
+    metrics = Metrics(os.path.join(workdir, "metrics.json"), os.path.join(workdir, "metrics.prom"), enabled=True)
+
+    def run():
+        with metrics.time('bench'):
+            pass
+    return run
+
+
+# Scraper parsing
+
+@benchmark("parse_draws[fixture page]", ops_per_call=50)
+def bench_parse_draws(workdir):
+    from toto_scraper import parse_draws
+    with open(os.path.join(FIXTURE_DIR, "page_1.html"), encoding='utf-8') as f:
+        html = f.read()
+    return lambda: parse_draws(html)
+
+
+@benchmark("ResultBot.web_scraper_tool[fixtures]")
+def bench_web_scraper_tool(workdir):
+    import ticket_store
+    from toto_stats import DrawStatistics
+    result_bot = importlib.import_module("web-scraper")
+
+    class OfflineResultBot(result_bot.ResultBot):
+        def send_telegram_message(self, message, chat_id=None):
+            return True
+
+        def broadcast_message(self, message):
+            return 1
+
+    bot = OfflineResultBot(fixture_dir=FIXTURE_DIR)
+    # The snapshot path is a default argument, bound when toto_stats was imported
+    stats_path = os.path.join(workdir, "stats.json")
+    override(DrawStatistics.save, '__defaults__', (stats_path,))
+    override(DrawStatistics.load.__func__, '__defaults__', (stats_path,))
+    override(DrawStatistics.from_store.__func__, '__defaults__', (stats_path,))
+    override(ticket_store, '_store', ticket_store._store)
+
+    def run():
+        # A fresh store each time, so every run parses and stores the fixture page
+        ticket_store._store = ticket_store.TicketStore(os.path.join(workdir, f"scrape-{time.perf_counter_ns()}.db"))
+        bot.web_scraper_tool()
+    return run
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_benchmark(entry, workdir, min_time=Config.BENCH_MIN_TIME):
+    """Time one benchmark. Returns ops/sec, per-call latency percentiles (ms) and peak memory (KiB)"""
+    max_calls = entry['max_calls']
+    func = entry['setup'](workdir)
+    func()  # warm-up
+
+    latencies = []
+    start = time.perf_counter()
+    while len(latencies) < max_calls and (time.perf_counter() - start) < min_time:
+        call_start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - call_start)
+    elapsed = sum(latencies)
+
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        'ops_per_sec': entry['ops_per_call'] * len(latencies) / elapsed if elapsed else 0.0,
+        'calls': len(latencies),
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'peak_kib': peak / 1024,
+    }
+
+
+def compare(results, baseline, threshold=Config.BENCH_REGRESSION_THRESHOLD):
+    """Names and reasons of benchmarks that regressed beyond threshold against the baseline"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or 'error' in result:
+            continue
+        if result['ops_per_sec'] < base['ops_per_sec'] * (1 - threshold):
+            regressions.append((name, f"ops/sec {result['ops_per_sec']:,.0f} < baseline {base['ops_per_sec']:,.0f}"))
+        if result['peak_kib'] > base['peak_kib'] * (1 + threshold) + 64:
+            regressions.append((name, f"peak memory {result['peak_kib']:,.0f} KiB > baseline {base['peak_kib']:,.0f} KiB"))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the TOTO generator, parser, formatter, persistence and scraper")
+    parser.add_argument("--filter", help="Only run benchmarks whose name contains this text")
+    parser.add_argument("--save-baseline", action="store_true", help=f"Write results to {BASELINE_FILE}")
+    parser.add_argument("--check", action="store_true", help="Exit with status 1 on regressions against the baseline")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    parser.add_argument("--min-time", type=float, default=Config.BENCH_MIN_TIME, help="Seconds per benchmark")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as f:
+            baseline = json.load(f)
+
+    # Keep benchmark runs out of the production metrics files
+    from toto_metrics import get_metrics
+    get_metrics().enabled = False
+
+    workdir = tempfile.mkdtemp(prefix="toto-bench-")
+    results = {}
+    try:
+        print(f"{'benchmark':38} {'ops/sec':>14} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak KiB':>10}")
+        for entry in BENCHMARKS:
+            if args.filter and args.filter not in entry['name']:
+                continue
+            try:
+                result = run_benchmark(entry, workdir, min_time=args.min_time)
+            except ImportError as e:
+                results[entry['name']] = {'error': f"skipped: {e}"}
+                print(f"{entry['name']:38} skipped ({e})")
+                continue
+            results[entry['name']] = result
+            base = baseline.get(entry['name'])
+            change = f"  {result['ops_per_sec'] / base['ops_per_sec'] - 1:+.0%}" if base else ""
+            print(f"{entry['name']:38} {result['ops_per_sec']:>14,.0f} {result['p50_ms']:>9.3f} "
+                  f"{result['p95_ms']:>9.3f} {result['p99_ms']:>9.3f} {result['peak_kib']:>10,.0f}{change}")
+    finally:
+        save_file = sys.modules.get('save_file')
+        if save_file and save_file._sheets_writer is not None:
+            save_file._sheets_writer.flush()
+        restore_overrides()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        measured = {name: result for name, result in results.items() if 'error' not in result}
+        baseline.update(measured)
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline saved to {BASELINE_FILE}")
+
+    if args.check:
+        regressions = compare(results, baseline)
+        for name, reason in regressions:
+            print(f"REGRESSION {name}: {reason}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
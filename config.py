@@ -1,5 +1,5 @@
 import os
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 try:
     # Load environment variables from .env file (for local development)
     from dotenv import load_dotenv
@@ -14,33 +14,173 @@ class Config:
     # Telegram settings
     BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
     CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
+    # Comma-separated extra chats the listener may answer (CHAT_ID is always allowed)
+    ALLOWED_CHAT_IDS = os.getenv('TELEGRAM_ALLOWED_CHAT_IDS', '')
+    # Comma-separated chats that receive draw results (defaults to CHAT_ID)
+    SUBSCRIBER_CHAT_IDS = os.getenv('TELEGRAM_SUBSCRIBER_CHAT_IDS', '')
 
     # File paths
-    LAST_UPDATE_FILE = "/tmp/last_update_id.txt"
+    GENERATED_NUMBERS_FILE = "generated_numbers.csv"
+    DATA_DIR = os.getenv('TOTO_DATA_DIR', 'data')
+    STORE_FILE = os.path.join(DATA_DIR, "toto.db")
+    STORE_BUSY_TIMEOUT = 30
+    STATS_SNAPSHOT_FILE = os.path.join(DATA_DIR, "stats.json")
+    STATS_WINDOWS = (10, 50, 100)
+    # Never hand out the same 6-number set twice (across users and runs)
+    UNIQUE_ACROSS_HISTORY = os.getenv('TOTO_UNIQUE_ACROSS_HISTORY', '').lower() in ('1', 'true', 'yes')
+    UNIQUE_BITMAP_FILE = os.path.join(DATA_DIR, "used_combinations.bin")
+    UNIQUE_REJECTION_MAX_FILL = 0.9
+    # Constrained generation (toto_constraints.py): precomputed index of all 6-number sets
+    COMBINATION_INDEX_FILE = os.path.join(DATA_DIR, "combination_index.bin")
+    CONSTRAINT_HIGH_FROM = 25  # 25-49 count as high numbers, 1-24 as low
+    CONSTRAINT_ENUMERATE_MAX = 50000
+    # Rejected draws per set before include/exclude matches are listed exactly instead
+    CONSTRAINT_MAX_REJECTIONS = 10000
+    CONSTRAINT_CHUNK_ROWS = 1 << 20
+    CONSTRAINT_CLAIM_ROUNDS = 10  # Resampling rounds for unique constrained sets; only few matches are listed
+    # Secret seed for reproducible, counter-based generation (toto_seeded.py); unset = random.sample
+    GENERATOR_SEED = os.getenv('TOTO_GENERATOR_SEED') or None
+    TICKETS_FILE = "tickets.bin"
+    # Columnar (.npy) export of tickets and draws (toto_columnar.py)
+    EXPORT_DIR = os.path.join(DATA_DIR, "export")
+    EXPORT_BATCH_ROWS = 50000
+    EXPORT_CHUNK_ROWS = 1 << 20
+    # Per-stage timings and counters (set TOTO_METRICS=0 to turn off)
+    METRICS_ENABLED = os.getenv('TOTO_METRICS', '1').lower() not in ('0', 'false', 'no')
+    METRICS_JSON_FILE = os.path.join(DATA_DIR, "metrics.json")
+    METRICS_PROM_FILE = os.path.join(DATA_DIR, "metrics.prom")
+    METRICS_FLUSH_INTERVAL = 60
 
     # API settings
+    # Point at a local fake (see fake_services.py) for offline testing
+    TELEGRAM_API_BASE = os.getenv('TELEGRAM_API_BASE', 'https://api.telegram.org')
     TELEGRAM_TIMEOUT = 10
     MESSAGE_MAX_AGE_MINUTES = 30
     MESSAGE_LIMIT = 5
-    CURRENT_DATE_TIME = datetime.now().strftime("%Y-%m-%d")
+    LONG_POLL_TIMEOUT = 25
+    DAEMON_MAX_CONCURRENCY = int(os.getenv('TOTO_DAEMON_CONCURRENCY', 16))
+    DAEMON_ERROR_BACKOFF = 5
+    # Processed-update ledger (update_ledger.py)
+    LEDGER_CLAIM_TIMEOUT = 600
+    LEDGER_RETENTION_HOURS = 48
+    LEDGER_COMPACT_INTERVAL = 3600
+
+    # Webhook mode (telegram_webhook.py); Telegram sends the secret in X-Telegram-Bot-Api-Secret-Token
+    WEBHOOK_URL = os.getenv('TELEGRAM_WEBHOOK_URL')
+    WEBHOOK_SECRET = os.getenv('TELEGRAM_WEBHOOK_SECRET')
+    WEBHOOK_HOST = os.getenv('TOTO_WEBHOOK_HOST', '0.0.0.0')
+    WEBHOOK_PORT = int(os.getenv('TOTO_WEBHOOK_PORT', 8080))
+    WEBHOOK_PATH = os.getenv('TOTO_WEBHOOK_PATH', '/telegram')
+    WEBHOOK_WORKERS = int(os.getenv('TOTO_WEBHOOK_WORKERS', 16))
+    WEBHOOK_QUEUE_SIZE = 4096
+    WEBHOOK_MAX_CONNECTIONS = 40
+    WEBHOOK_MAX_BODY_BYTES = 256 * 1024  # Message updates are a few KB; bigger bodies get 413
+
+    # Outbound delivery settings (Telegram limits)
+    DELIVERY_WORKERS = 8
+    # Connections kept alive; covers the daemon and webhook workers sending in parallel
+    DELIVERY_POOL_SIZE = 32
+    DELIVERY_MAX_RETRIES = 3
+    DELIVERY_BACKOFF_BASE = 1.0
+    DELIVERY_LATENCY_SAMPLES = 1000
+    # Overridable for bots with raised limits and for load tests against fake_services.py
+    TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', 30))
+    TELEGRAM_CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE', 1))
+    TELEGRAM_CHAT_BURST = 3
+    TELEGRAM_GROUP_RATE = 20 / 60
+    TELEGRAM_GROUP_BURST = 3
+    # Long replies are split into messages of at most this many characters; above the
+    # threshold, sets are sent as one gzip CSV document instead (telegram_format.py)
+    TELEGRAM_MESSAGE_LIMIT = 4096
+    TELEGRAM_DOCUMENT_THRESHOLD_SETS = 300
+    TELEGRAM_DOCUMENT_FLUSH_BYTES = 64 * 1024
+    TELEGRAM_DOCUMENT_SPOOL_BYTES = 4 * 1024 * 1024
+    TELEGRAM_DOCUMENT_MAX_BYTES = 50 * 1024 * 1024
+    TIMEZONE_OFFSET_HOURS = 8  # Singapore time, used for draw days
 
     # TOTO settings
     MIN_SETS = 1
     MAX_SETS = 10
     NUMBERS_PER_SET = 6
     NUMBER_RANGE = (1, 49)
+    MAX_SYSTEM_SIZE = 12
+    TICKET_PRICE = 1  # SGD per line
+    WHEEL_DEFAULT_TICKETS = 10
+    WHEEL_MAX_TELEGRAM_TICKETS = 50
+    WHEEL_TIME_LIMIT = 5
+    # Typical payout per winning line; groups 1-4 share the prize pool, groups 5-7 are fixed
+    PRIZE_AMOUNTS = {1: 1000000, 2: 90000, 3: 1500, 4: 400, 5: 50, 6: 25, 7: 10}
+
+    # Benchmark settings
+    BENCH_MIN_TIME = 1.0
+    BENCH_MAX_CALLS = 100000
+    BENCH_REGRESSION_THRESHOLD = 0.25
+
+    # Simulation settings
+    SIM_WORKERS = os.cpu_count() or 1
+    SIM_CHUNK_SIZE = 200000
+    SIM_PROGRESS_INTERVAL = 2
+    # Backtest settings
+    BACKTEST_CHUNK_DRAWS = 10000
+    BACKTEST_MAX_LISTED = 20  # More strategies than this print summary statistics only
+    BULK_BATCH_SIZE = 65536
+    # Tickets created this many days before a draw are checked when the previous draw is unknown
+    PRIZE_CHECK_MAX_DAYS = 7
 
     # Toto-scraping settings
     url = "https://en.lottolyzer.com/history/singapore/toto"
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
     }
-    FILENAME_URL = "https://script.google.com/macros/s/AKfycbxXRy1vcj0h4jsrdXy8g6BzAx1Tb27Ihsq3kK-PUFiqZCPsTGq7H3HB7bReNMREcQC3vg/exec"
+    SCRAPER_PAGE_URL = "https://en.lottolyzer.com/history/singapore/toto/page/{page}/per-page/50/summary-view"
+    SCRAPER_CACHE_DIR = os.path.join(DATA_DIR, "scraper_cache")
+    # Directory of saved page_<n>.html files to scrape offline instead of fetching
+    SCRAPER_FIXTURE_DIR = os.getenv('TOTO_SCRAPER_FIXTURES')
+    SCRAPER_MAX_WORKERS = 4
+    SCRAPER_MIN_INTERVAL = 0.5
+    SCRAPER_TIMEOUT = 15
+    SCRAPER_MAX_PAGES = 200
+    FILENAME_URL = os.getenv('TOTO_SHEETS_URL', "https://script.google.com/macros/s/AKfycbxXRy1vcj0h4jsrdXy8g6BzAx1Tb27Ihsq3kK-PUFiqZCPsTGq7H3HB7bReNMREcQC3vg/exec")
+
+    # Google Sheets writer settings
+    # Opt in once the Apps Script's doPost appends every entry of {"rows": [...]}; it takes one row per POST
+    SHEETS_BATCH_PAYLOAD = os.getenv('TOTO_SHEETS_BATCH_PAYLOAD', '').lower() in ('1', 'true', 'yes')
+    SHEETS_BATCH_SIZE = 100
+    SHEETS_BATCH_WAIT = 0.5
+    SHEETS_QUEUE_SIZE = 10000
+    SHEETS_POOL_SIZE = 4
+    SHEETS_TIMEOUT = 10
+    SHEETS_MAX_RETRIES = 3
+    SHEETS_BACKOFF_BASE = 1.0
+    SHEETS_FLUSH_TIMEOUT = 30
+    SHEETS_SPILL_FILE = "sheets_spill.jsonl"
+
+    @classmethod
+    def current_date(cls):
+        """Today's date in Singapore time, evaluated on each call (not frozen at import)"""
+        sg_tz = timezone(timedelta(hours=cls.TIMEZONE_OFFSET_HOURS))
+        return datetime.now(sg_tz).strftime("%Y-%m-%d")
 
     @classmethod
     def get_telegram_api_url(cls):
         """Get Telegram API URL"""
-        return f"https://api.telegram.org/bot{cls.BOT_TOKEN}"
+        return f"{cls.TELEGRAM_API_BASE}/bot{cls.BOT_TOKEN}"
+
+    @classmethod
+    def get_allowed_chat_ids(cls):
+        """Chats the listener answers: CHAT_ID plus TELEGRAM_ALLOWED_CHAT_IDS"""
+        chat_ids = {chat_id.strip() for chat_id in cls.ALLOWED_CHAT_IDS.split(',') if chat_id.strip()}
+        if cls.CHAT_ID:
+            chat_ids.add(str(cls.CHAT_ID))
+        return chat_ids
+
+    @classmethod
+    def get_subscriber_chat_ids(cls):
+        """Chats that receive draw results: TELEGRAM_SUBSCRIBER_CHAT_IDS, or CHAT_ID if unset"""
+        chat_ids = [chat_id.strip() for chat_id in cls.SUBSCRIBER_CHAT_IDS.split(',') if chat_id.strip()]
+        if not chat_ids and cls.CHAT_ID:
+            chat_ids.append(str(cls.CHAT_ID))
+        return chat_ids
 
     @classmethod
     def validate_credentials(cls):
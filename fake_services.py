@@ -0,0 +1,237 @@
+# fake_services.py
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class FakeServices:
+    """Offline stand-ins for the Telegram Bot API and the Google Sheets webhook, on one local port.
+
+    Telegram methods live under /bot<token>/<method>: getUpdates honours offset, limit and
+    long-poll timeout, and confirmed updates are dropped like Telegram does. sendMessage
+    waits `send_latency` seconds, and every `rate_limit_every`-th call gets a 429 with
+    retry_after. Other methods just succeed. The Sheets webhook is POST /sheets.
+    Updates are injected with add_update(); on_message is called with each delivered message."""
+
+    def __init__(self, host='127.0.0.1', port=0, send_latency=0.0, rate_limit_every=0, retry_after=1,
+                 on_message=None):
+        self.send_latency = send_latency
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.on_message = on_message
+        self.condition = threading.Condition()
+        self.updates = []
+        self.next_update_id = 1
+        self.message_ids = {}
+        self.polls = 0
+        self.send_calls = 0
+        self.rate_limited = 0
+        self.messages = []
+        self.documents = []
+        self.sheets_requests = 0
+        self.sheets_rows = 0
+        self.server = _Server((host, port), _Handler, self)
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def sheets_url(self):
+        return f"{self.url}/sheets"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="fake-services", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        with self.condition:
+            self.condition.notify_all()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def add_update(self, chat_id, text, user_id=None):
+        """Queue a text message update from a private chat for getUpdates; returns the update"""
+        with self.condition:
+            update = self.new_update(chat_id, text, user_id)
+            self.updates.append(update)
+            self.condition.notify_all()
+            return update
+
+    def new_update(self, chat_id, text, user_id=None):
+        """A text message update from a private chat, with the next update and message ids"""
+        with self.condition:
+            message_id = self.message_ids.get(chat_id, 0) + 1
+            self.message_ids[chat_id] = message_id
+            update = {
+                'update_id': self.next_update_id,
+                'message': {
+                    'message_id': message_id,
+                    'date': int(time.time()),
+                    'chat': {'id': chat_id, 'type': 'private'},
+                    'from': {'id': user_id or chat_id, 'first_name': f"User{chat_id}"},
+                    'text': text,
+                }
+            }
+            self.next_update_id += 1
+            return update
+
+    def get_updates(self, offset=0, limit=100, timeout=0):
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            self.polls += 1
+            # Asking for an offset confirms every earlier update
+            if offset:
+                self.updates = [update for update in self.updates if update['update_id'] >= offset]
+            while not self.updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            return self.updates[:limit]
+
+    def send_message(self, payload):
+        """Returns (status, response body)"""
+        with self.condition:
+            self.send_calls += 1
+            limited = self.rate_limit_every and self.send_calls % self.rate_limit_every == 0
+            if limited:
+                self.rate_limited += 1
+        if limited:
+            return 429, {
+                'ok': False,
+                'error_code': 429,
+                'description': f"Too Many Requests: retry after {self.retry_after}",
+                'parameters': {'retry_after': self.retry_after}
+            }
+
+        if self.send_latency:
+            time.sleep(self.send_latency)
+        received_at = time.perf_counter()
+        with self.condition:
+            self.messages.append(payload)
+        if self.on_message:
+            self.on_message(payload, received_at)
+        return 200, {'ok': True, 'result': {'message_id': len(self.messages), 'chat': {'id': payload.get('chat_id')}}}
+
+    def send_document(self, fields, body):
+        received_at = time.perf_counter()
+        with self.condition:
+            self.documents.append({'fields': fields, 'bytes': len(body)})
+        if self.on_message:
+            self.on_message(fields, received_at)
+        return 200, {'ok': True, 'result': {'document': {'file_size': len(body)}}}
+
+    def sheets_webhook(self, payload):
+        rows = payload.get('rows', [payload]) if isinstance(payload, dict) else payload
+        with self.condition:
+            self.sheets_requests += 1
+            self.sheets_rows += len(rows)
+        return 200, {'result': 'success'}
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 makes connection bursts wait for SYN retransmits
+    request_queue_size = 1024
+
+    def __init__(self, address, handler, services):
+        self.services = services
+        super().__init__(address, handler)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self._dispatch(b'')
+
+    def do_POST(self):
+        self._dispatch(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+
+    def _dispatch(self, body):
+        services = self.server.services
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        content_type = self.headers.get('Content-Type', '')
+        payload = {}
+        if body and content_type.startswith('application/json'):
+            payload = json.loads(body)
+        elif body and content_type.startswith('application/x-www-form-urlencoded'):
+            payload = {key: values[-1] for key, values in parse_qs(body.decode()).items()}
+        payload = {**params, **payload} if isinstance(payload, dict) else payload
+
+        if url.path == '/sheets':
+            status, response = services.sheets_webhook(payload)
+        elif url.path.startswith('/bot') and url.path.count('/') == 2:
+            method = url.path.rsplit('/', 1)[1]
+            if method == 'getUpdates':
+                updates = services.get_updates(int(payload.get('offset', 0)), int(payload.get('limit', 100)),
+                                               float(payload.get('timeout', 0)))
+                status, response = 200, {'ok': True, 'result': updates}
+            elif method == 'sendMessage':
+                status, response = services.send_message(payload)
+            elif method == 'sendDocument':
+                status, response = services.send_document(_multipart_fields(content_type, body), body)
+            else:
+                status, response = 200, {'ok': True, 'result': True}
+        else:
+            status, response = 404, {'ok': False, 'error_code': 404, 'description': 'Not Found'}
+
+        data = json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _multipart_fields(content_type, body):
+    """Plain text fields of a multipart/form-data body (file parts are skipped)"""
+    if 'boundary=' not in content_type:
+        return {}
+    boundary = content_type.split('boundary=', 1)[1].strip('"').encode()
+    fields = {}
+    for part in body.split(b'--' + boundary):
+        headers, _, value = part.partition(b'\r\n\r\n')
+        if b'name="' not in headers or b'filename="' in headers:
+            continue
+        name = headers.split(b'name="', 1)[1].split(b'"', 1)[0].decode()
+        fields[name] = value.rstrip(b'\r\n').decode()
+    return fields
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the fake Telegram Bot API and Sheets webhook")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds each sendMessage takes")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="Answer every Nth sendMessage with 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    services = FakeServices(port=args.port, send_latency=args.latency, rate_limit_every=args.rate_limit_every,
+                            retry_after=args.retry_after)
+    print(f"Fake services listening on {services.url}")
+    print(f"  TELEGRAM_API_BASE={services.url}")
+    print(f"  TOTO_SHEETS_URL={services.sheets_url}")
+    try:
+        services.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        services.server.server_close()
+        print(f"Sent {len(services.messages)} messages ({services.rate_limited} rate limited), "
+              f"{services.sheets_rows} Sheets rows")
+
+
+if __name__ == "__main__":
+    main()
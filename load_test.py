@@ -0,0 +1,315 @@
+# load_test.py
+import argparse
+import http.client
+import json
+import os
+import random
+import secrets
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from fake_services import FakeServices
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+REQUEST_TEXTS = ["1", "3", "5", "10", "2 7", "1 8"]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {'p50': 0.0, 'p90': 0.0, 'p99': 0.0, 'max': 0.0}
+    pick = lambda fraction: values[min(len(values) - 1, int(fraction * len(values)))]
+    return {'p50': pick(0.50), 'p90': pick(0.90), 'p99': pick(0.99), 'max': values[-1]}
+
+
+class LoadTest:
+    """Drives a real listener process against fake_services.py: `toto.py listen --daemon`
+    polling getUpdates, or `toto.py listen --webhook` with updates POSTed to it the way
+    Telegram pushes them.
+
+    Synthetic requests are spread over `chats` private chats. A request is done when its
+    second reply arrives: the "Got it" acknowledgement, then the numbers. The test measures
+    the latency of both replies from injection, and overall throughput."""
+
+    def __init__(self, updates=1000, chats=100, latency=0.0, rate_limit_every=0, retry_after=1,
+                 concurrency=Config.DAEMON_MAX_CONCURRENCY, respect_limits=False, rate=0.0, seed=0,
+                 timeout=300, verbose=False, mode='daemon', injectors=8):
+        self.mode = mode
+        self.injectors = injectors
+        self.webhook_port = free_port() if mode == 'webhook' else None
+        self.webhook_secret = secrets.token_urlsafe(16)
+        self.webhook_retries = 0
+        self.local = threading.local()
+        self.updates = updates
+        self.chats = [100000 + i for i in range(chats)]
+        self.concurrency = concurrency
+        self.respect_limits = respect_limits
+        self.rate = rate
+        self.rng = random.Random(seed)
+        self.timeout = timeout
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.injected = {}
+        self.replies = {}
+        self.done = threading.Event()
+        self.completed = 0
+        self.last_reply_at = None
+        self.services = FakeServices(send_latency=latency, rate_limit_every=rate_limit_every,
+                                     retry_after=retry_after, on_message=self._on_message)
+
+    def _on_message(self, payload, received_at):
+        key = (int(payload.get('chat_id', 0)), int(payload.get('reply_to_message_id') or 0))
+        with self.lock:
+            if key not in self.injected:
+                return
+            times = self.replies.setdefault(key, [])
+            times.append(received_at)
+            if len(times) == 2:
+                self.completed += 1
+                self.last_reply_at = received_at
+                if self.completed == self.updates:
+                    self.done.set()
+
+    def _listener_env(self, data_dir):
+        env = dict(os.environ)
+        env.update({
+            'TELEGRAM_BOT_TOKEN': 'load-test',
+            'TELEGRAM_CHAT_ID': str(self.chats[0]),
+            'TELEGRAM_ALLOWED_CHAT_IDS': ",".join(map(str, self.chats)),
+            'TELEGRAM_API_BASE': self.services.url,
+            'TOTO_SHEETS_URL': self.services.sheets_url,
+            'TOTO_DATA_DIR': data_dir,
+            'TOTO_DAEMON_CONCURRENCY': str(self.concurrency),
+            'PYTHONUNBUFFERED': '1',
+        })
+        if self.mode == 'webhook':
+            env.update({
+                'TELEGRAM_WEBHOOK_SECRET': self.webhook_secret,
+                'TOTO_WEBHOOK_HOST': '127.0.0.1',
+                'TOTO_WEBHOOK_PORT': str(self.webhook_port),
+                'TOTO_WEBHOOK_WORKERS': str(self.concurrency),
+            })
+            env.pop('TELEGRAM_WEBHOOK_URL', None)
+        if not self.respect_limits:
+            # Measure the listener, not Telegram's rate limits
+            env['TELEGRAM_GLOBAL_RATE'] = '1000000'
+            env['TELEGRAM_CHAT_RATE'] = '1000000'
+        return env
+
+    def start_listener(self, data_dir, log_file):
+        command = [sys.executable, os.path.join(REPO_DIR, "toto.py"), "listen", f"--{self.mode}"]
+        return subprocess.Popen(command, env=self._listener_env(data_dir), cwd=data_dir,
+                                stdout=log_file, stderr=subprocess.STDOUT)
+
+    def listener_ready(self):
+        if self.mode == 'daemon':
+            return self.services.polls > 0
+        try:
+            socket.create_connection(('127.0.0.1', self.webhook_port), timeout=1).close()
+            return True
+        except OSError:
+            return False
+
+    def inject(self):
+        if self.mode == 'webhook':
+            self.inject_webhook()
+            return
+        for i in range(self.updates):
+            chat_id = self.chats[i % len(self.chats)]
+            with self.lock:
+                update = self.services.add_update(chat_id, self.rng.choice(REQUEST_TEXTS))
+                self.injected[(chat_id, update['message']['message_id'])] = time.perf_counter()
+            if self.rate:
+                time.sleep(1 / self.rate)
+
+    def inject_webhook(self):
+        def post(i):
+            chat_id = self.chats[i % len(self.chats)]
+            with self.lock:
+                update = self.services.new_update(chat_id, self.rng.choice(REQUEST_TEXTS))
+                self.injected[(chat_id, update['message']['message_id'])] = time.perf_counter()
+            body = json.dumps(update)
+            headers = {'Content-Type': 'application/json', 'X-Telegram-Bot-Api-Secret-Token': self.webhook_secret}
+            # Like Telegram, retry until the webhook accepts the update
+            while True:
+                if getattr(self.local, 'connection', None) is None:
+                    self.local.connection = http.client.HTTPConnection('127.0.0.1', self.webhook_port, timeout=30)
+                try:
+                    self.local.connection.request('POST', '/telegram', body, headers)
+                    response = self.local.connection.getresponse()
+                    response.read()
+                except (OSError, http.client.HTTPException):
+                    self.local.connection = None
+                    continue
+                if response.status == 200:
+                    break
+                with self.lock:
+                    self.webhook_retries += 1
+                time.sleep(0.1)
+            if self.rate:
+                time.sleep(self.injectors / self.rate)
+
+        with ThreadPoolExecutor(max_workers=self.injectors) as executor:
+            list(executor.map(post, range(self.updates)))
+
+    def run(self):
+        data_dir = tempfile.mkdtemp(prefix="toto-load-")
+        log_path = os.path.join(data_dir, "listener.log")
+        self.services.start()
+        listener = None
+        try:
+            with open(log_path, 'w') as log_file:
+                listener = self.start_listener(data_dir, log_file)
+                deadline = time.monotonic() + 30
+                while not self.listener_ready():
+                    if listener.poll() is not None or time.monotonic() > deadline:
+                        raise RuntimeError(f"Listener did not start, see {log_path}")
+                    time.sleep(0.05)
+
+                start = time.perf_counter()
+                self.inject()
+                injected_seconds = time.perf_counter() - start
+                finished = self.done.wait(self.timeout)
+
+                listener.send_signal(signal.SIGTERM)
+                listener.wait(timeout=60)
+            return self.report(start, injected_seconds, finished, data_dir, log_path)
+        finally:
+            if listener and listener.poll() is None:
+                listener.kill()
+            self.services.stop()
+            if self.verbose:
+                with open(log_path) as f:
+                    print(f.read())
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    def report(self, start, injected_seconds, finished, data_dir, log_path):
+        from toto_metrics import load_totals
+
+        with self.lock:
+            ack = [times[0] - self.injected[key] for key, times in self.replies.items()]
+            reply = [times[1] - self.injected[key] for key, times in self.replies.items() if len(times) > 1]
+            elapsed = (self.last_reply_at or time.perf_counter()) - start
+        stages = load_totals(os.path.join(data_dir, "metrics.json"))['histograms']
+        return {
+            'requests': self.updates,
+            'completed': self.completed,
+            'finished': finished,
+            'inject_seconds': injected_seconds,
+            'seconds': elapsed,
+            'requests_per_second': self.completed / elapsed if elapsed else 0.0,
+            'ack_latency': percentiles(ack),
+            'reply_latency': percentiles(reply),
+            'messages': len(self.services.messages),
+            'rate_limited': self.services.rate_limited,
+            'webhook_retries': self.webhook_retries,
+            'sheets_rows': self.services.sheets_rows,
+            'sheets_requests': self.services.sheets_requests,
+            'stages': {stage: histogram.summary() for stage, histogram in sorted(stages.items())},
+        }
+
+
+def print_report(result):
+    status = "" if result['finished'] else "  (timed out)"
+    print(f"Requests: {result['completed']}/{result['requests']} in {result['seconds']:.2f}s "
+          f"({result['requests_per_second']:,.0f} req/s){status}")
+    print(f"Injected in {result['inject_seconds']:.2f}s "
+          f"({result['requests'] / result['inject_seconds']:,.0f} updates/s accepted)")
+    for name in ('ack_latency', 'reply_latency'):
+        latency = result[name]
+        print(f"{name.replace('_', ' ').capitalize():14} " + "  ".join(
+            f"{key} {latency[key] * 1000:8.1f} ms" for key in ('p50', 'p90', 'p99', 'max')))
+    print(f"Telegram: {result['messages']} messages, {result['rate_limited']} rate limited (429)")
+    if result['webhook_retries']:
+        print(f"Webhook: {result['webhook_retries']} updates refused while the queue was full")
+    print(f"Sheets: {result['sheets_rows']} rows in {result['sheets_requests']} requests")
+    if result['stages']:
+        print(f"\n{'stage':24} {'count':>8} {'p50 ms':>9} {'p99 ms':>9}")
+        for stage, summary in result['stages'].items():
+            print(f"{stage:24} {summary['count']:>8} {summary['p50'] * 1000:>9.2f} {summary['p99'] * 1000:>9.2f}")
+
+
+def check_prize_send(verbose=False):
+    """End-to-end check of `toto.py check --send`: a store with one draw and a ticket that
+    wins it, and the prize summary must reach the ticket's chat through the fake Bot API"""
+    from datetime import datetime, timedelta, timezone
+    from ticket_store import TicketStore
+
+    chat_id = 100000
+    data_dir = tempfile.mkdtemp(prefix="toto-check-")
+    services = FakeServices().start()
+    try:
+        draw_date = (datetime.now(timezone.utc) + timedelta(hours=Config.TIMEZONE_OFFSET_HOURS)).strftime('%Y-%m-%d')
+        store = TicketStore(os.path.join(data_dir, "toto.db"))
+        store.add_draws([(draw_date, [3, 11, 19, 27, 35, 43], 49)])
+        store.add_tickets([[3, 11, 19, 28, 36, 44]], user_id=chat_id, chat_id=chat_id)
+        store.close()
+
+        env = dict(os.environ)
+        env.update({
+            'TELEGRAM_BOT_TOKEN': 'load-test',
+            'TELEGRAM_CHAT_ID': str(chat_id),
+            'TELEGRAM_API_BASE': services.url,
+            'TOTO_DATA_DIR': data_dir,
+        })
+        completed = subprocess.run([sys.executable, os.path.join(REPO_DIR, "toto.py"), "check", "--send"],
+                                   env=env, cwd=data_dir, capture_output=True, text=True, timeout=60)
+        if verbose or completed.returncode:
+            print(completed.stdout + completed.stderr)
+        summaries = [message for message in services.messages
+                     if int(message.get('chat_id', 0)) == chat_id and 'TOTO results' in message.get('text', '')]
+        passed = completed.returncode == 0 and len(summaries) == 1
+        print(f"check --send: {'ok' if passed else 'FAILED'} (exit {completed.returncode}, "
+              f"{len(summaries)} prize summary message(s))")
+        return passed
+    finally:
+        services.stop()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline end-to-end load test of the Telegram listener")
+    parser.add_argument("--mode", choices=['daemon', 'webhook'], default='daemon',
+                        help="Listener mode: long-polling daemon or webhook server")
+    parser.add_argument("--updates", type=int, default=1000, help="Number of synthetic requests")
+    parser.add_argument("--chats", type=int, default=100, help="Number of chats the requests come from")
+    parser.add_argument("--rate", type=float, default=0.0, help="Requests injected per second (0 = all at once)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds each fake sendMessage takes")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="Answer every Nth sendMessage with 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=Config.DAEMON_MAX_CONCURRENCY)
+    parser.add_argument("--respect-limits", action="store_true", help="Keep Telegram's real send rate limits")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="Print the listener's output")
+    parser.add_argument("--check-send", action="store_true",
+                        help="Instead of the load test, check that 'toto.py check --send' delivers a prize summary")
+    args = parser.parse_args(argv)
+
+    if args.check_send:
+        sys.exit(0 if check_prize_send(args.verbose) else 1)
+
+    load_test = LoadTest(args.updates, args.chats, args.latency, args.rate_limit_every, args.retry_after,
+                         args.concurrency, args.respect_limits, args.rate, args.seed, args.timeout, args.verbose,
+                         args.mode)
+    result = load_test.run()
+    print_report(result)
+    if not result['finished']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,90 @@
 import sys
 import os
-import requests
+import time
 from save_file import save_to_google_sheets  # Import Google Sheets save function
+from ticket_store import get_ticket_store
 import json
 
 from config import Config
+from telegram_delivery import get_delivery
+from telegram_format import send_sets
 from toto_generator import TotoGenerator
+from toto_system import SYSTEM_SIZES, system_cost, system_lines
 
-def main():
-    """Main function for standalone command line use"""
+
+def send_bulk(generator, count, numbers_per_set, chat_id):
+    """Generate any number of sets and send them to Telegram (as a CSV document when there are many)"""
+    print(f"Generating {count} sets of {numbers_per_set} TOTO numbers...")
+    request_id = f"bulk:{time.time_ns()}"
+    tickets = generator.generate_bulk(count, numbers_per_set, request_id=request_id)
+
+    try:
+        store = get_ticket_store()
+        store.add_tickets(tickets, user_id="bulk_run", chat_id=chat_id)
+        if generator.seeded:
+            store.add_seeded_request(request_id, generator.seeded.fingerprint, count, numbers_per_set,
+                                     user_id="bulk_run", chat_id=chat_id)
+    except Exception as e:
+        print(f"Warning: Could not save to local store: {e}")
+
+    toto_data = {
+        "total_sets": count,
+        "numbers_per_set": numbers_per_set,
+        "lines_per_set": system_lines(numbers_per_set),
+        "total_cost": count * system_cost(numbers_per_set),
+        "date": Config.current_date(),
+        "sets": tickets.iter_sets()
+    }
+    if send_sets(get_delivery(), chat_id, toto_data):
+        print(f"Sent {count} sets to Telegram")
+    else:
+        print("Failed to send the sets to Telegram")
+
+
+def main(argv=None, bulk=None):
+    """Main function for standalone command line use.
+    bulk: generate that many sets (argv may then give just the numbers per set)"""
+    argv = sys.argv[1:] if argv is None else argv
     
     if not os.getenv('TELEGRAM_BOT_TOKEN') or not os.getenv('TELEGRAM_CHAT_ID'):
         print("Missing Telegram credentials")
         sys.exit(1)
 
-    bot_token = Config.BOT_TOKEN
     chat_id = Config.CHAT_ID
 
     generator = TotoGenerator()
 
-    if len(sys.argv) > 1:
-        count_input = sys.argv[1]
+    if bulk:
+        numbers_per_set = int(argv[0]) if argv and argv[0].isdigit() else Config.NUMBERS_PER_SET
+        if len(argv) > 1 or numbers_per_set not in SYSTEM_SIZES:
+            print(f"Invalid input '{' '.join(argv)}': expected '[numbers_per_set]' (6-12) with --bulk")
+            sys.exit(1)
+        send_bulk(generator, bulk, numbers_per_set, chat_id)
+        return
+
+    numbers_per_set = Config.NUMBERS_PER_SET
+    if argv:
+        count_input = " ".join(argv)
         print(f"Command line input: {count_input}")
-        count = generator.parse_user_input(count_input)
+        request = generator.parse_user_input(count_input)
+        if not request:
+            print(f"Invalid input '{count_input}': expected '<sets>' or '<sets> <numbers_per_set>'")
+            sys.exit(1)
+        count = request['sets']
+        numbers_per_set = request['numbers_per_set']
+        constraints = request.get('constraints')
     else:
         print("Scheduled run - generating 1 set")
         count = 1
+        constraints = None
 
     print(f"Generating {count} sets of TOTO numbers...")
-    result = generator.generate_multiple_sets(count)
+    try:
+        result = generator.generate_multiple_sets(count, numbers_per_set, request_id=f"scheduled:{time.time_ns()}",
+                                                  constraints=constraints)
+    except ValueError as e:
+        print(f"Could not generate sets: {e}")
+        sys.exit(1)
 
     print("Generated data:")
     print(json.dumps(result, indent=2))
@@ -37,35 +93,27 @@ def main():
     formatted_sets = [set_data['formatted'] for set_data in result['sets']]
     try:
         save_to_google_sheets(formatted_sets, user_id="scheduled_run", message_id=None)
-        print("Saved to Google Sheets successfully")
+        print("Queued for Google Sheets")
     except Exception as e:
         print(f"Warning: Could not save to Google Sheets: {e}")
 
-    # Send to Telegram
-    message = f"🎲 *Your TOTO Numbers*\n"
-    message += f"📅 Date: {result['date']}\n"
-    message += f"🎯 Total Sets: {result['total_sets']}\n\n"
-
-    for set_data in result['sets']:
-        message += f"*Set {set_data['set']}:* `{set_data['formatted']}`\n"
-
-    output_txt = 'sets' if result['total_sets'] > 1 else 'set'
-    message += f"\n🍀 Good luck with all {result['total_sets']} {output_txt}!"
+    try:
+        numbers_sets = [set_data['numbers'] for set_data in result['sets']]
+        store = get_ticket_store()
+        store.add_tickets(numbers_sets, user_id="scheduled_run", chat_id=chat_id)
+        if 'request_id' in result:
+            store.add_seeded_request(result['request_id'], result['seed'], result['total_sets'],
+                                     result['numbers_per_set'], user_id="scheduled_run", chat_id=chat_id)
+    except Exception as e:
+        print(f"Warning: Could not save to local store: {e}")
 
+    # Send to Telegram
     try:
-        url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-        payload = {
-            'chat_id': chat_id,
-            'text': message,
-            'parse_mode': 'Markdown'
-        }
-        response = requests.post(url, json=payload, timeout=10)
-
-        if response.status_code == 200:
+        if send_sets(get_delivery(), chat_id, result):
             print("Telegram message sent successfully")
             print("TOTO system completed successfully")
         else:
-            print(f"Failed to send Telegram message: {response.status_code}")
+            print("Failed to send Telegram message")
     except Exception as e:
         print(f"Error sending Telegram message: {e}")
 
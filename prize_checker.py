@@ -0,0 +1,219 @@
+# prize_checker.py
+import re
+import sys
+from array import array
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from config import Config
+from toto_sets import TicketMasks, to_bitmask
+from toto_system import match_probability, system_match_lines
+
+PRIZE_GROUPS = range(1, 8)
+GROUP_DESCRIPTIONS = {
+    1: "6 numbers",
+    2: "5 numbers + additional",
+    3: "5 numbers",
+    4: "4 numbers + additional",
+    5: "4 numbers",
+    6: "3 numbers + additional",
+    7: "3 numbers",
+}
+
+# For each byte value b, _BIT_TABLES[bit][b] == (b >> bit) & 1
+_BIT_TABLES = [bytes((value >> bit) & 1 for value in range(256)) for bit in range(8)]
+_HIT_PATTERN = re.compile(rb'[\x01-\x07]')
+
+
+def prize_group(matched, additional_matched):
+    """Singapore Toto prize group (1-7) for the best line of a ticket, or None"""
+    if matched >= 6:
+        return 1
+    if matched == 5:
+        return 2 if additional_matched else 3
+    if matched == 4:
+        return 4 if additional_matched else 5
+    if matched == 3:
+        return 6 if additional_matched else 7
+    return None
+
+
+def system_prize_lines(numbers_per_set, matched, additional_matched):
+    """Winning lines per prize group for one entry of numbers_per_set numbers (6 = ordinary ticket,
+    7-12 = System entry) that contains `matched` winning numbers and maybe the additional number"""
+    lines = {}
+    for (j, b), count in system_match_lines(numbers_per_set, matched, additional_matched).items():
+        group = prize_group(j, b)
+        if group:
+            lines[group] = lines.get(group, 0) + count
+    return lines
+
+
+def expected_prize_lines(numbers_per_set):
+    """Expected winning lines per prize group for one entry in a single draw"""
+    expected = {group: 0.0 for group in range(1, 8)}
+    for matched in range(7):
+        for additional_matched in (0, 1):
+            if matched + additional_matched > numbers_per_set:
+                continue
+            probability = match_probability(numbers_per_set, matched, additional_matched)
+            if not probability:
+                continue
+            for group, count in system_prize_lines(numbers_per_set, matched, additional_matched).items():
+                expected[group] += probability * count
+    return expected
+
+
+# Match code = 2 * matched + additional_matched, translated to the prize group (0 = no prize)
+_GROUP_TABLE = bytes(prize_group(code >> 1, code & 1) or 0 if code < 14 else 0 for code in range(256))
+
+
+def _mask_bytes(masks):
+    if isinstance(masks, memoryview) and masks.format == 'Q' and sys.byteorder == 'little':
+        # A slice of a memory-mapped export column: one copy of just this chunk
+        return masks.tobytes()
+    if not isinstance(masks, array) or masks.typecode != 'Q':
+        masks = array('Q', masks)
+    if sys.byteorder == 'big':
+        masks = array('Q', masks)
+        masks.byteswap()
+    return masks.tobytes()
+
+
+class TicketColumns:
+    """Byte-lane view of a ticket array: for each number, one big integer holding a
+    byte per ticket that is 1 if the ticket contains that number. Adding the columns of a
+    draw's winning numbers counts the matches of every ticket at once, in C."""
+
+    def __init__(self, masks):
+        self.mask_bytes = _mask_bytes(masks)
+        self.count = len(self.mask_bytes) // 8
+        self.columns = {}
+
+    def column(self, number):
+        value = self.columns.get(number)
+        if value is None:
+            bit = number - 1
+            lane = self.mask_bytes[bit >> 3::8].translate(_BIT_TABLES[bit & 7])
+            value = self.columns[number] = int.from_bytes(lane, 'little')
+        return value
+
+    def match_codes(self, winning_numbers, additional_number):
+        """Bytes with 2 * matched + additional_matched for every ticket"""
+        total = 0
+        for number in winning_numbers:
+            total += self.column(number)
+        total = (total << 1) + self.column(additional_number)
+        return total.to_bytes(self.count, 'little')
+
+    def groups(self, winning_numbers, additional_number):
+        """Bytes with the prize group (0 = no prize) of every ticket"""
+        return self.match_codes(winning_numbers, additional_number).translate(_GROUP_TABLE)
+
+
+def classify_tickets(tickets, winning_numbers, additional_number):
+    """Prize group (0 = no prize) of every ticket, as bytes.
+    tickets can be a TicketMasks/TicketRanks array, an array('Q') of bitmasks or a list of number lists"""
+    if hasattr(tickets, 'to_masks'):
+        tickets = tickets.to_masks()
+    if isinstance(tickets, TicketMasks):
+        masks = tickets.masks
+    elif isinstance(tickets, array):
+        masks = tickets
+    else:
+        masks = array('Q', [to_bitmask(numbers) for numbers in tickets])
+    return TicketColumns(masks).groups(winning_numbers, additional_number)
+
+
+def count_groups(groups):
+    """Number of tickets in each prize group"""
+    return {group: groups.count(group) for group in PRIZE_GROUPS}
+
+
+def iter_hits(groups):
+    """Yield (ticket_index, prize_group) for every winning ticket"""
+    for match in _HIT_PATTERN.finditer(groups):
+        yield match.start(), groups[match.start()]
+
+
+def draw_window(draw_date, previous_draw_date=None):
+    """Creation-time window of the tickets that take part in a draw: from the day after the
+    previous draw up to the end of the draw day (Singapore time)"""
+    sg_tz = timezone(timedelta(hours=Config.TIMEZONE_OFFSET_HOURS))
+    if isinstance(draw_date, str):
+        draw_date = datetime.strptime(draw_date[:10], '%Y-%m-%d')
+    until = datetime(draw_date.year, draw_date.month, draw_date.day, tzinfo=sg_tz) + timedelta(days=1)
+    if previous_draw_date is None:
+        return until - timedelta(days=Config.PRIZE_CHECK_MAX_DAYS), until
+    if isinstance(previous_draw_date, str):
+        previous_draw_date = datetime.strptime(previous_draw_date[:10], '%Y-%m-%d')
+    since = datetime(previous_draw_date.year, previous_draw_date.month, previous_draw_date.day,
+                     tzinfo=sg_tz) + timedelta(days=1)
+    return since, until
+
+
+class PrizeChecker:
+    """Checks the tickets stored for a draw and summarises the hits per user"""
+
+    def __init__(self, store, history=None):
+        self.store = store
+        # Optional ColumnarHistory: tickets are then streamed from the memory-mapped export
+        self.history = history
+
+    def check_draw(self, draw_date, winning_numbers, additional_number, previous_draw_date=None):
+        """Classify every ticket generated for a draw in one pass.
+        Returns a list of summaries, one per (chat_id, user_id) with tickets for the draw;
+        'groups' counts winning lines, so System entries contribute all their winning lines"""
+        since, until = draw_window(draw_date, previous_draw_date)
+        summaries = {}
+        if self.history is not None:
+            owners = self.history.owners
+            for _, chunk in self.history.iter_ticket_chunks(int(since.timestamp()), int(until.timestamp())):
+                self._add_tickets(summaries, owners, chunk['id'], chunk['owner'], chunk['mask'],
+                                  winning_numbers, additional_number)
+        else:
+            ticket_ids, owner_index, owners, masks = self.store.fetch_ticket_masks(since=since, until=until)
+            if masks:
+                self._add_tickets(summaries, owners, ticket_ids, owner_index, masks,
+                                  winning_numbers, additional_number)
+        return [summaries[owner] for owner in sorted(summaries)]
+
+    def _add_tickets(self, summaries, owners, ticket_ids, owner_index, masks, winning_numbers, additional_number):
+        codes = TicketColumns(masks).match_codes(winning_numbers, additional_number)
+        groups = codes.translate(_GROUP_TABLE)
+
+        for owner, tickets in Counter(owner_index).items():
+            summary = summaries.get(owner)
+            if summary is None:
+                user_id, chat_id = owners[owner]
+                summary = summaries[owner] = {
+                    'chat_id': chat_id, 'user_id': user_id, 'tickets': 0, 'groups': {}, 'hits': []
+                }
+            summary['tickets'] += tickets
+        for index, group in iter_hits(groups):
+            summary = summaries[owner_index[index]]
+            lines = system_prize_lines(masks[index].bit_count(), codes[index] >> 1, codes[index] & 1)
+            for line_group, count in lines.items():
+                summary['groups'][line_group] = summary['groups'].get(line_group, 0) + count
+            summary['hits'].append((ticket_ids[index], group))
+
+
+def format_summary_message(summary, draw_date, winning_numbers, additional_number):
+    """HTML Telegram message with a user's results for a draw"""
+    if isinstance(draw_date, datetime):
+        draw_date = draw_date.strftime("%Y-%m-%d")
+    user_id = summary['user_id']
+    who = f'<a href="tg://user?id={user_id}">Your</a>' if str(user_id).isdigit() else "Scheduled"
+    ticket_word = "ticket" if summary['tickets'] == 1 else "tickets"
+
+    message = f"🎯 <b>{who} TOTO results for {draw_date}</b>\n"
+    message += f"🎲 Winning: {', '.join(map(str, winning_numbers))} + {additional_number}\n"
+    message += f"🎟 Checked {summary['tickets']} {ticket_word}\n\n"
+
+    if not summary['groups']:
+        message += "No prizes this time. Good luck next draw! 🍀"
+        return message
+
+    for group in sorted(summary['groups']):
+        line_word = "line" if summary['groups'][group] == 1 else "lines"
+        message += f"🏆 Group {group} ({GROUP_DESCRIPTIONS[group]}): {summary['groups'][group]} {line_word}\n"
+    return message.rstrip()
@@ -1,15 +1,25 @@
 from datetime import datetime
 from config import Config
+import atexit
 import os
 import csv
+import json
+import queue
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from toto_metrics import get_metrics
+from toto_sets import read_tickets
 
 def save_generated_numbers(numbers_set, user_id="Unknown", message_id=None):
-    """Save generated numbers to CSV file with user ID and message ID"""
+    """Save generated numbers to CSV file with user ID and message ID.
+    numbers_set can be a list of number lists or a TicketMasks/TicketRanks array"""
 
-    file_exists = os.path.exists(Config.FILENAME_URL)
+    file_exists = os.path.exists(Config.GENERATED_NUMBERS_FILE)
+    date = datetime.now().strftime("%Y-%m-%d")
 
-    with open(Config.FILENAME_URL, 'a', newline='') as csvfile:
+    with open(Config.GENERATED_NUMBERS_FILE, 'a', newline='') as csvfile:
         writer = csv.writer(csvfile)
 
         if not file_exists:
@@ -20,29 +30,192 @@ def save_generated_numbers(numbers_set, user_id="Unknown", message_id=None):
         for numbers in numbers_set:
             numbers_str = ','.join(map(str, numbers))
             writer.writerow([
-                Config.CURRENT_DATE_TIME,
+                date,
                 user_id,
                 message_id,
                 numbers_str
             ])
 
 
+def save_compact_tickets(tickets, filename=Config.TICKETS_FILE):
+    """Save a TicketMasks/TicketRanks array to a compact binary file (4-8 bytes per set)"""
+    with open(filename, 'wb') as f:
+        tickets.tofile(f)
+
+
+def load_compact_tickets(filename=Config.TICKETS_FILE):
+    """Load a TicketMasks/TicketRanks array saved by save_compact_tickets"""
+    with open(filename, 'rb') as f:
+        return read_tickets(f)
+
+
+class SheetsWriter:
+    """Background writer for the Google Sheets webhook.
+    Rows are queued off the reply path, sent in batches over one pooled session,
+    retried with exponential backoff and spilled to a local file if the webhook stays down.
+
+    With Config.SHEETS_BATCH_PAYLOAD (TOTO_SHEETS_BATCH_PAYLOAD, off by default) the webhook
+    receives {"rows": [row, ...]} and its doPost must append every entry of "rows";
+    otherwise each row is posted on its own."""
+
+    def __init__(self, webhook_url=None, batch_size=Config.SHEETS_BATCH_SIZE,
+                 spill_file=Config.SHEETS_SPILL_FILE):
+        self.webhook_url = webhook_url or Config.FILENAME_URL
+        self.batch_size = batch_size
+        self.spill_file = spill_file
+        self.queue = queue.Queue(maxsize=Config.SHEETS_QUEUE_SIZE)
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=Config.SHEETS_POOL_SIZE))
+        self.spill_lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        """Start the background thread and requeue rows spilled by earlier runs"""
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self._run, name="sheets-writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+        self.replay_spill()
+
+    def submit(self, rows):
+        """Queue rows for writing; never blocks the caller"""
+        if self.thread is None:
+            self.start()
+        for row in rows:
+            try:
+                self.queue.put_nowait(row)
+            except queue.Full:
+                self._spill([row])
+
+    def flush(self, timeout=Config.SHEETS_FLUSH_TIMEOUT):
+        """Wait until every queued row has been written or spilled. Returns False on timeout"""
+        deadline = time.monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self):
+        """Drain the queue before exit; anything left over is spilled to disk"""
+        if not self.flush():
+            leftover = []
+            while True:
+                try:
+                    leftover.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+                self.queue.task_done()
+            self._spill(leftover)
+
+    def replay_spill(self):
+        """Requeue rows from the spill file left by a previous run"""
+        with self.spill_lock:
+            if not os.path.exists(self.spill_file):
+                return
+            with open(self.spill_file) as f:
+                rows = [json.loads(line) for line in f if line.strip()]
+            os.remove(self.spill_file)
+        if rows:
+            print(f"Replaying {len(rows)} spilled Google Sheets rows")
+            self.submit(rows)
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + Config.SHEETS_BATCH_WAIT
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                # Only the rows that never got through are spilled, so a replay can't duplicate any
+                self._spill(self._send_with_retries(batch))
+            except Exception as e:
+                print(f"Error saving to Google Sheets: {e}")
+                self._spill(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _send_with_retries(self, rows):
+        """Returns the rows that could not be written"""
+        metrics = get_metrics()
+        with metrics.time('sheets_write'):
+            failed = self._post_batches(rows)
+        metrics.inc('sheets_rows', len(rows) - len(failed))
+        if failed:
+            metrics.inc('sheets_rows_failed', len(failed))
+        return failed
+
+    def _post_batches(self, rows):
+        """Post the rows, retrying failed requests with backoff. Returns the rows still failing"""
+        payloads = [{'rows': rows}] if Config.SHEETS_BATCH_PAYLOAD else rows
+        pending = list(payloads)
+        for attempt in range(Config.SHEETS_MAX_RETRIES + 1):
+            if attempt:
+                time.sleep(Config.SHEETS_BACKOFF_BASE * 2 ** (attempt - 1))
+            failed = []
+            for payload in pending:
+                try:
+                    response = self.session.post(self.webhook_url, json=payload, timeout=Config.SHEETS_TIMEOUT)
+                    if response.status_code < 400:
+                        continue
+                    print(f"Google Sheets webhook returned {response.status_code}")
+                except requests.RequestException as e:
+                    print(f"Error saving to Google Sheets: {e}")
+                failed.append(payload)
+            if not failed:
+                print(f"Saved {len(rows)} rows to Google Sheets")
+                return []
+            pending = failed
+        return rows if Config.SHEETS_BATCH_PAYLOAD else pending
+
+    def _spill(self, rows):
+        if not rows:
+            return
+        with self.spill_lock:
+            with open(self.spill_file, 'a') as f:
+                for row in rows:
+                    f.write(json.dumps(row) + '\n')
+        print(f"Spilled {len(rows)} Google Sheets rows to {self.spill_file}")
+
+
+_sheets_writer = None
+_sheets_writer_lock = threading.Lock()
+
+
+def get_sheets_writer():
+    """Shared SheetsWriter for the process"""
+    global _sheets_writer
+    with _sheets_writer_lock:
+        if _sheets_writer is None:
+            _sheets_writer = SheetsWriter()
+            _sheets_writer.start()
+        return _sheets_writer
+
+
 def save_to_google_sheets(formatted_sets, user_id, message_id):
-    """Save formatted number sets to Google Sheets"""
-    webhook_url = Config.FILENAME_URL
+    """Queue formatted number sets for Google Sheets; returns without waiting for the webhook.
+    formatted_sets can be a list of formatted strings or a TicketMasks/TicketRanks array"""
+    if hasattr(formatted_sets, 'iter_formatted'):
+        formatted_sets = formatted_sets.iter_formatted()
 
-    for formatted_numbers in formatted_sets:  # Changed variable name for clarity
-        data = {
-            'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    rows = [
+        {
+            'date': date,
             'user_id': user_id,
             'message_id': message_id,
-            'numbers': formatted_numbers  # Use the formatted string directly
+            'numbers': formatted_numbers
         }
-
-        try:
-            print(f"Sending data to Google Sheets: {data}")
-            response = requests.post(webhook_url, json=data)
-            print(f"Response status: {response.status_code}")
-            print(f"Response text: {response.text}")
-        except Exception as e:
-            print(f"Error saving to Google Sheets: {e}")
\ No newline at end of file
+        for formatted_numbers in formatted_sets
+    ]
+    get_sheets_writer().submit(rows)
@@ -0,0 +1,196 @@
+# telegram_delivery.py
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from config import Config
+from toto_metrics import get_metrics
+
+
+class TokenBucket:
+    """Token bucket that hands out reservations: reserve() takes a token now (the balance may go
+    negative) and returns how long the caller must wait before using it"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def pause(self, now, seconds):
+        """Block the bucket for `seconds` (used for Telegram's retry_after)"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        # The next reserve() takes a token and then waits exactly `seconds`
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+
+class TelegramDelivery:
+    """Shared outbound Telegram sender: one keep-alive connection pool, a global token bucket plus
+    one per chat (Telegram allows about 30 messages/s overall, 1/s per private chat and 20/min
+    per group), retries that honour 429 retry_after, and fan-out to many chats. stats() reports
+    queue depth, send latency and counters."""
+
+    def __init__(self, api_url=None, workers=Config.DELIVERY_WORKERS):
+        self.api_url = api_url or Config.get_telegram_api_url()
+        self.session = requests.Session()
+        pool_size = max(workers, Config.DELIVERY_POOL_SIZE)
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="telegram-delivery")
+        self.lock = threading.Lock()
+        self.global_bucket = TokenBucket(Config.TELEGRAM_GLOBAL_RATE, Config.TELEGRAM_GLOBAL_RATE)
+        self.chat_buckets = {}
+        self.pending = 0
+        self.sent = 0
+        self.failed = 0
+        self.rate_limited = 0
+        self.latencies = deque(maxlen=Config.DELIVERY_LATENCY_SAMPLES)
+        self.metrics = get_metrics()
+
+    def _chat_bucket(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            # Group and channel ids are negative
+            if str(chat_id).startswith('-'):
+                bucket = TokenBucket(Config.TELEGRAM_GROUP_RATE, Config.TELEGRAM_GROUP_BURST)
+            else:
+                bucket = TokenBucket(Config.TELEGRAM_CHAT_RATE, Config.TELEGRAM_CHAT_BURST)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _wait_for_slot(self, chat_id):
+        with self.lock:
+            now = time.monotonic()
+            wait = max(self.global_bucket.reserve(now), self._chat_bucket(chat_id).reserve(now))
+        if wait > 0:
+            time.sleep(wait)
+
+    def call(self, method, payload, chat_id=None, files=None):
+        """Call a Bot API method through the rate limiters, retrying 429s and transient errors.
+        Returns the parsed JSON response, or None if it failed"""
+        chat_id = payload.get('chat_id') if chat_id is None else chat_id
+        url = f"{self.api_url}/{method}"
+        for attempt in range(Config.DELIVERY_MAX_RETRIES + 1):
+            self._wait_for_slot(chat_id)
+            start = time.monotonic()
+            try:
+                if files:
+                    _rewind(files)
+                    response = self.session.post(url, data=payload, files=files, timeout=Config.TELEGRAM_TIMEOUT)
+                else:
+                    response = self.session.post(url, json=payload, timeout=Config.TELEGRAM_TIMEOUT)
+            except requests.RequestException as e:
+                print(f"Error calling Telegram {method}: {e}")
+                time.sleep(Config.DELIVERY_BACKOFF_BASE * 2 ** attempt)
+                continue
+            finally:
+                elapsed = time.monotonic() - start
+                with self.lock:
+                    self.latencies.append(elapsed)
+                self.metrics.observe('telegram_send', elapsed)
+
+            if response.status_code == 200:
+                with self.lock:
+                    self.sent += 1
+                self.metrics.inc('telegram_sent')
+                return response.json()
+
+            if response.status_code == 429:
+                try:
+                    retry_after = response.json().get('parameters', {}).get('retry_after', 1)
+                except ValueError:
+                    retry_after = 1
+                print(f"Telegram rate limit for chat {chat_id}, retrying after {retry_after}s")
+                self.metrics.inc('telegram_rate_limited')
+                with self.lock:
+                    self.rate_limited += 1
+                    self._chat_bucket(chat_id).pause(time.monotonic(), retry_after)
+                continue
+
+            if response.status_code >= 500:
+                time.sleep(Config.DELIVERY_BACKOFF_BASE * 2 ** attempt)
+                continue
+
+            print(f"Telegram {method} failed: {response.status_code} {response.text}")
+            break
+
+        self.metrics.inc('telegram_send_failed')
+        with self.lock:
+            self.failed += 1
+        return None
+
+    def send(self, chat_id, text, parse_mode='Markdown', reply_to_message_id=None):
+        """Send a message and wait for the result. Returns True on success"""
+        payload = {
+            'chat_id': chat_id,
+            'text': text,
+            'parse_mode': parse_mode
+        }
+        if reply_to_message_id:
+            payload['reply_to_message_id'] = reply_to_message_id
+        return self.call('sendMessage', payload) is not None
+
+    def submit(self, chat_id, text, parse_mode='Markdown', reply_to_message_id=None):
+        """Queue a message for the worker pool. Returns a Future resolving to True on success"""
+        with self.lock:
+            self.pending += 1
+        future = self.executor.submit(self.send, chat_id, text, parse_mode, reply_to_message_id)
+        future.add_done_callback(self._done)
+        return future
+
+    def broadcast(self, chat_ids, text, parse_mode='Markdown'):
+        """Send the same message to many chats concurrently; returns the number delivered"""
+        futures = [self.submit(chat_id, text, parse_mode) for chat_id in chat_ids]
+        return sum(1 for future in futures if future.result())
+
+    def _done(self, future):
+        with self.lock:
+            self.pending -= 1
+
+    def stats(self):
+        with self.lock:
+            # Copied under the lock: workers append while this runs
+            latencies = sorted(list(self.latencies))
+
+        def percentile(fraction):
+            return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000 if latencies else 0.0
+
+        with self.lock:
+            return {
+                'queue_depth': self.pending,
+                'sent': self.sent,
+                'failed': self.failed,
+                'rate_limited': self.rate_limited,
+                'latency_p50_ms': percentile(0.50),
+                'latency_p95_ms': percentile(0.95),
+            }
+
+
+def _rewind(files):
+    """Seek file objects back to the start so a retried upload sends them in full"""
+    for value in files.values():
+        f = value[1] if isinstance(value, tuple) else value
+        if hasattr(f, 'seek'):
+            f.seek(0)
+
+
+_delivery = None
+_delivery_lock = threading.Lock()
+
+
+def get_delivery():
+    """Shared TelegramDelivery for the process"""
+    global _delivery
+    with _delivery_lock:
+        if _delivery is None:
+            _delivery = TelegramDelivery()
+        return _delivery
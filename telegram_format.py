@@ -0,0 +1,135 @@
+# telegram_format.py
+import csv
+import io
+import tempfile
+import zlib
+from config import Config
+from toto_metrics import get_metrics
+from toto_sets import format_numbers
+from toto_system import system_name
+
+
+def message_length(text):
+    """Length as Telegram counts it (UTF-16 code units), so emoji count double"""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def format_header(toto_data):
+    numbers_per_set = toto_data.get('numbers_per_set', Config.NUMBERS_PER_SET)
+    header = [
+        f"🎲 *Your TOTO Numbers* ({system_name(numbers_per_set)})\n",
+        f"📅 Date: {toto_data['date']}\n",
+        f"🎯 Total Sets: {toto_data['total_sets']}\n",
+    ]
+    if numbers_per_set > Config.NUMBERS_PER_SET:
+        header.append(f"🧾 {toto_data['lines_per_set']} lines per set, ${toto_data['total_cost']} in total\n")
+    if toto_data.get('constraints'):
+        header.append(f"🔎 {toto_data['constraints']}\n")
+    header.append("\n")
+    return "".join(header)
+
+
+def format_footer(total_sets):
+    output_txt = 'sets' if total_sets > 1 else 'set'
+    return f"\n🍀 Good luck with all {total_sets} {output_txt}!"
+
+
+def iter_message_parts(toto_data):
+    """Header, one line per set and footer of a generation result; 'sets' may be any iterable"""
+    yield format_header(toto_data)
+    for set_data in toto_data['sets']:
+        formatted = set_data.get('formatted') or format_numbers(set_data['numbers'])
+        yield f"*Set {set_data['set']}:* `{formatted}`\n"
+    yield format_footer(toto_data['total_sets'])
+
+
+def iter_message_chunks(parts, limit=Config.TELEGRAM_MESSAGE_LIMIT):
+    """Pack text parts into messages of at most `limit` characters. Parts are kept whole
+    unless a single part is longer than a message"""
+    chunk = []
+    size = 0
+    for part in parts:
+        length = message_length(part)
+        if chunk and size + length > limit:
+            yield "".join(chunk)
+            chunk = []
+            size = 0
+        while length > limit:
+            # Cut by UTF-16 units without splitting a surrogate pair
+            cut = limit
+            while message_length(part[:cut]) > limit:
+                cut -= 1
+            yield part[:cut]
+            part = part[cut:]
+            length = message_length(part)
+        if part:
+            chunk.append(part)
+            size += length
+    if chunk:
+        yield "".join(chunk)
+
+
+def iter_csv_gzip(header, rows, flush_bytes=Config.TELEGRAM_DOCUMENT_FLUSH_BYTES):
+    """Gzip-compressed CSV, built incrementally: yields compressed chunks while rows are
+    consumed, so memory stays bounded however many rows there are"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= flush_bytes:
+            data = compressor.compress(buffer.getvalue().encode())
+            buffer.seek(0)
+            buffer.truncate()
+            if data:
+                yield data
+    yield compressor.compress(buffer.getvalue().encode()) + compressor.flush()
+
+
+def sets_csv_rows(sets):
+    for set_data in sets:
+        yield (set_data['set'], *set_data['numbers'])
+
+
+def send_document(delivery, chat_id, filename, chunks, caption=None, reply_to_message_id=None,
+                  mime_type='application/gzip'):
+    """Upload a document built from byte chunks with sendDocument. The chunks are spooled to
+    a temporary file, in memory only while small. Returns True on success"""
+    with tempfile.SpooledTemporaryFile(max_size=Config.TELEGRAM_DOCUMENT_SPOOL_BYTES) as f:
+        for chunk in chunks:
+            f.write(chunk)
+        size = f.tell()
+        if size > Config.TELEGRAM_DOCUMENT_MAX_BYTES:
+            print(f"Document {filename} is {size:,} bytes, over Telegram's upload limit")
+            return False
+        f.seek(0)
+        payload = {'chat_id': chat_id}
+        if caption:
+            payload['caption'] = caption
+        if reply_to_message_id:
+            payload['reply_to_message_id'] = reply_to_message_id
+        result = delivery.call('sendDocument', payload, files={'document': (filename, f, mime_type)})
+    if result is not None:
+        get_metrics().inc('telegram_documents')
+    return result is not None
+
+
+def send_sets(delivery, chat_id, toto_data, reply_to_message_id=None):
+    """Send a generation result: as messages under Telegram's length limit or, above
+    TELEGRAM_DOCUMENT_THRESHOLD_SETS sets, as one gzip CSV document. 'sets' may be a generator
+    (e.g. TicketMasks.iter_sets()), so bulk results are never formatted in full.
+    Returns True if everything was delivered"""
+    if toto_data['total_sets'] > Config.TELEGRAM_DOCUMENT_THRESHOLD_SETS:
+        numbers_per_set = toto_data.get('numbers_per_set', Config.NUMBERS_PER_SET)
+        header = ['set'] + [f"n{i}" for i in range(1, numbers_per_set + 1)]
+        caption = (f"🎲 {toto_data['total_sets']:,} {system_name(numbers_per_set)} sets "
+                   f"for {toto_data['date']} (CSV)")
+        return send_document(delivery, chat_id, f"toto-{toto_data['date']}.csv.gz",
+                             iter_csv_gzip(header, sets_csv_rows(toto_data['sets'])), caption, reply_to_message_id)
+
+    delivered = True
+    for i, text in enumerate(iter_message_chunks(iter_message_parts(toto_data))):
+        # Only the first message replies to the request
+        delivered = delivery.send(chat_id, text, 'Markdown', None if i else reply_to_message_id) and delivered
+    return delivered
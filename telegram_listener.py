@@ -1,48 +1,81 @@
-import requests
 import os
-import subprocess
 import sys
 import json
 from datetime import datetime, timezone
 from config import Config
-from save_file import save_to_google_sheets
+from telegram_delivery import get_delivery
 from toto_generator import TotoGenerator
+from toto_metrics import get_metrics
+from update_ledger import get_update_ledger
+
+HELP_TEXT = """🎲 *TOTO Generator Bot*
+
+Send me a request in this format:
+\`<sets\>` or \`<sets\> \<6-12\>\`
+
+*Examples:*
+- \`1\` → 1 set of 6 numbers (standard)
+- \`3\` → 3 sets of 6 numbers
+- \`2 7\` → 2 sets of 7 numbers (System 7)
+- \`5 7\` → 5 sets of 7 numbers
+- \`1 12\` → 1 System 12 entry (924 lines)
+
+\`<sets\>`: 1-10 (how many sets)
+\`<6-12\>`: numbers per set, 7-12 for System entries (optional, default: 6)
+
+*Constraints* (6-number sets), after the set count:
+\`sum=100-150\` \`odd=3\` \`high=2-4\` \`maxrun=2\` \`include=7,13\` \`exclude=1,2\` \`nolast\`
+- \`5 odd=3 nolast\` → 5 sets with 3 odd numbers and none from the last draw
+
+\`/stats\` or \`/stats 50\` → number statistics (all draws or the last 10/50/100)
+\`/wheel <numbers...> [tickets=N] [t=3]\` → syndicate wheel covering your pool"""
+
+WHEEL_HELP_TEXT = """🎡 *Wheel designer*
+
+\`/wheel <numbers...> [tickets=N] [t=2|3|4]\`
+Picks N tickets from your pool that cover as many pairs (t=2), triples (t=3) or quads (t=4) as possible.
+
+*Example:* \`/wheel 3 7 12 18 21 25 30 33 38 41 45 tickets=8 t=3\`"""
 
 class TelegramListener:
     def __init__(self):
         self.bot_token = Config.BOT_TOKEN
         self.chat_id = Config.CHAT_ID
         self.api_url = Config.get_telegram_api_url()
-        self.last_update_file = Config.LAST_UPDATE_FILE
-        self.generator = TotoGenerator()
+        self.ledger = get_update_ledger()
+        # The combination index is built by 'toto.py count', never while a user waits
+        self.generator = TotoGenerator(build_index=False)
+        self.delivery = get_delivery()
+        self.metrics = get_metrics()
 
     def get_last_update_id(self):
-        """Get the last processed update ID"""
+        """Get the getUpdates offset: one past the last processed update ID"""
         try:
-            if os.path.exists(self.last_update_file):
-                with open(self.last_update_file, 'r') as f:
-                    return int(f.read().strip())
-        except:
-            pass
-        return 0
+            return self.ledger.get_offset()
+        except Exception as e:
+            print(f"Warning: Could not read update offset: {e}")
+            return 0
 
     def save_last_update_id(self, update_id):
-        """Save the last processed update ID"""
+        """Save the getUpdates offset, acknowledging every earlier update"""
         try:
-            with open(self.last_update_file, 'w') as f:
-                f.write(str(update_id))
+            self.ledger.ack(update_id)
         except Exception as e:
             print(f"Warning: Could not save update ID: {e}")
 
     def get_new_messages(self):
         try:
             url = f"{self.api_url}/getUpdates"
+            # Only updates after the acknowledged offset; don't wait when there are none
             params = {
+                'offset': self.get_last_update_id(),
                 'limit': 100,  # Increase to see more messages
-                'timeout': 10
+                'timeout': 0,
+                'allowed_updates': json.dumps(['message'])
             }
 
-            response = requests.get(url, params=params, timeout=15)
+            with self.metrics.time('telegram_get_updates'):
+                response = self.delivery.session.get(url, params=params, timeout=15)
 
             if response.status_code == 200:
                 data = response.json()
@@ -78,22 +111,10 @@ class TelegramListener:
             print(f"Error checking message age: {e}")
             return True
 
-    def send_response(self, text, reply_to_message_id=None):
-        """Send response message"""
+    def send_response(self, text, reply_to_message_id=None, chat_id=None):
+        """Send response message (to the configured chat unless chat_id is given)"""
         try:
-            payload = {
-                'chat_id': self.chat_id,
-                'text': text,
-                'parse_mode': 'Markdown'
-            }
-
-            if reply_to_message_id:
-                payload['reply_to_message_id'] = reply_to_message_id
-
-            url = f"{self.api_url}/sendMessage"
-            response = requests.post(url, json=payload, timeout=10)
-
-            return response.status_code == 200
+            return self.delivery.send(chat_id or self.chat_id, text, 'Markdown', reply_to_message_id)
         except Exception as e:
             print(f"Error sending response: {e}")
             return False
@@ -108,31 +129,43 @@ class TelegramListener:
         return False
 
     def format_telegram_message(self, toto_data):
-        """Format TOTO data as Telegram message"""
-        numbers_per_set = toto_data.get('numbers_per_set', 6)
-        system_type = "System 7" if numbers_per_set == 7 else "Standard"
-        message = f"🎲 *Your TOTO Numbers* ({system_type})\n"
-        message += f"📅 Date: {toto_data['date']}\n"
-        message += f"🎯 Total Sets: {toto_data['total_sets']}\n\n"
-
-        for set_data in toto_data['sets']:
-            message += f"*Set {set_data['set']}:* `{set_data['formatted']}`\n"
+        """Format TOTO data as one Telegram message (send_sets splits long results)"""
+        from telegram_format import iter_message_parts
+        return "".join(iter_message_parts(toto_data))
 
-        output_txt = 'sets' if toto_data['total_sets'] > 1 else 'set'
-        message += f"\n🍀 Good luck with all {toto_data['total_sets']} {output_txt}!"
-        return message
+    def send_sets(self, toto_data, reply_to_message_id=None, chat_id=None):
+        """Send generated sets as size-bounded messages, or as a CSV document when there are many"""
+        from telegram_format import send_sets
+        try:
+            return send_sets(self.delivery, chat_id or self.chat_id, toto_data, reply_to_message_id)
+        except Exception as e:
+            print(f"Error sending sets: {e}")
+            return False
 
-    def run_toto_generator(self, sets_count, numbers_per_set=6, user_id=None, message_id=None):
+    def run_toto_generator(self, sets_count, numbers_per_set=6, user_id=None, message_id=None, chat_id=None,
+                           constraints=None):
         """Generate TOTO numbers and handle results"""
         try:
             print(f"Generating {sets_count} sets of {numbers_per_set} TOTO numbers...")
 
             # Generate numbers directly (no subprocess!)
-            result = self.generator.generate_multiple_sets(int(sets_count), int(numbers_per_set))
+            request_id = f"{chat_id or self.chat_id}:{message_id}" if message_id else None
+            with self.metrics.time('generate'):
+                try:
+                    result = self.generator.generate_multiple_sets(int(sets_count), int(numbers_per_set),
+                                                                   request_id=request_id, constraints=constraints)
+                except ValueError as e:
+                    # Constraints nothing satisfies, or nolast before any draw was scraped
+                    self.send_response(f"⚠️ {e}", reply_to_message_id=message_id, chat_id=chat_id)
+                    return True
+            self.metrics.inc('sets_generated', result['total_sets'])
 
             # Format and send to Telegram
-            message = self.format_telegram_message(result)
-            self.send_response(message, reply_to_message_id=message_id)
+            self.send_sets(result, reply_to_message_id=message_id, chat_id=chat_id)
+
+            # Persistence is only loaded by runs that actually generate numbers
+            from save_file import save_to_google_sheets
+            from ticket_store import get_ticket_store
 
             # Save to Google Sheets if we have user info
             if user_id and message_id:
@@ -140,6 +173,16 @@ class TelegramListener:
                 save_to_google_sheets(formatted_sets, user_id, message_id)
                 #print("saved to Google Sheet!")
 
+            try:
+                numbers_sets = [set_data['numbers'] for set_data in result['sets']]
+                store = get_ticket_store()
+                store.add_tickets(numbers_sets, user_id or "Unknown", message_id, chat_id or self.chat_id)
+                if 'request_id' in result:
+                    store.add_seeded_request(result['request_id'], result['seed'], result['total_sets'],
+                                             result['numbers_per_set'], user_id or "Unknown", chat_id or self.chat_id)
+            except Exception as e:
+                print(f"Warning: Could not save to local store: {e}")
+
             print("TOTO generation completed successfully")
             return True
 
@@ -160,80 +203,261 @@ class TelegramListener:
         processed_any = False
 
         for update in new_messages:
-            if 'message' not in update:
-                continue
+            if self.handle_update(update):
+                processed_any = True
+            self.save_last_update_id(update['update_id'] + 1)
 
-            message = update['message']
+        self.ledger.maybe_compact()
+        return processed_any
 
-            if str(message['chat']['id']) != str(self.chat_id):
-                continue
+    def is_allowed_chat(self, chat_id):
+        """Check if the bot should answer messages from this chat"""
+        return str(chat_id) in Config.get_allowed_chat_ids()
 
-            message_text = message.get('text', '').strip()
-            message_id = message.get('message_id')
-            message_date = message.get('date', 0)
-            user = message.get('from', {})
-            user_id = str(user.get('id', 'Unknown'))
-            user_name = user.get('first_name', 'User')
+    def handle_update(self, update, check_age=True):
+        """Handle a single Telegram update. Returns True if a TOTO request was processed"""
+        self.metrics.inc('telegram_updates')
+        if 'message' not in update:
+            return False
 
-            if not message_text:
-                continue
+        message = update['message']
+        chat_id = message['chat']['id']
 
-            if not self.is_recent_message(message_date):
-                print(f"Skipping old message: '{message_text}'")
-                continue
+        if not self.is_allowed_chat(chat_id):
+            return False
+
+        message_text = message.get('text', '').strip()
+        message_id = message.get('message_id')
+        message_date = message.get('date', 0)
+        user = message.get('from', {})
+        user_id = str(user.get('id', 'Unknown'))
+        user_name = user.get('first_name', 'User')
+
+        if not message_text:
+            return False
+
+        if check_age and not self.is_recent_message(message_date):
+            print(f"Skipping old message: '{message_text}'")
+            return False
 
-            print(f"New message from {user_name}: '{message_text}'")
-            
+        if not self.ledger.claim(chat_id, message_id, update.get('update_id')):
+            print(f"Skipping message {message_id} in chat {chat_id}: already handled")
+            self.metrics.inc('telegram_duplicates')
+            return False
+
+        status = 'failed'
+        try:
+            processed = self._handle_message(message_text, message_id, chat_id, user_id, user_name)
+            status = 'done'
+            return processed
+        finally:
+            self.ledger.complete(chat_id, message_id, status)
+
+    def _handle_message(self, message_text, message_id, chat_id, user_id, user_name):
+        print(f"New message from {user_name}: '{message_text}'")
+
+        if message_text.startswith('/stats'):
+            return self.send_stats(message_text, message_id, chat_id)
+
+        if message_text.startswith('/wheel'):
+            return self.send_wheel(message_text, message_id, chat_id)
+
+        with self.metrics.time('parse'):
             valid_request = self.is_valid_toto_request(message_text)
-            
-            if valid_request:
-                sets_count = valid_request['sets']
-                numbers_per_set = valid_request['numbers_per_set']
-                num_word = "set" if sets_count == 1 else "sets"
-                num_word2 = "number" if numbers_per_set == 6 else "numbers"
-                
-                self.send_response(
-                    f"Got it! Generating {sets_count} {num_word} with {numbers_per_set} {num_word2} each...",
-                    reply_to_message_id=message_id
-                )
-
-                success = self.run_toto_generator(sets_count, numbers_per_set, user_id, message_id)
-
-                if success:
-                    processed_any = True
-                    print(f"Successfully processed request for {sets_count} sets of {numbers_per_set} numbers")
-                else:
-                    self.send_response(
-                        "Sorry, there was an error generating your numbers. Please try again!",
-                        reply_to_message_id=message_id
-                    )
-            else:
-                help_text = """🎲 *TOTO Generator Bot*
 
-Send me a request in this format:
-\`<sets\>` or \`<sets\> \<6|7\>\`
+        if valid_request:
+            sets_count = valid_request['sets']
+            numbers_per_set = valid_request['numbers_per_set']
+            num_word = "set" if sets_count == 1 else "sets"
+            num_word2 = "number" if numbers_per_set == 6 else "numbers"
+
+            self.send_response(
+                f"Got it! Generating {sets_count} {num_word} with {numbers_per_set} {num_word2} each...",
+                reply_to_message_id=message_id,
+                chat_id=chat_id
+            )
+
+            success = self.run_toto_generator(sets_count, numbers_per_set, user_id, message_id, chat_id=chat_id,
+                                              constraints=valid_request.get('constraints'))
+
+            if success:
+                print(f"Successfully processed request for {sets_count} sets of {numbers_per_set} numbers")
+                return True
+
+            self.send_response(
+                "Sorry, there was an error generating your numbers. Please try again!",
+                reply_to_message_id=message_id,
+                chat_id=chat_id
+            )
+        else:
+            self.send_response(HELP_TEXT, reply_to_message_id=message_id, chat_id=chat_id)
 
-*Examples:*
-- \`1\` → 1 set of 6 numbers (standard)
-- \`3\` → 3 sets of 6 numbers
-- \`2 7\` → 2 sets of 7 numbers (System 7)
-- \`5 7\` → 5 sets of 7 numbers
+        return False
 
-\`<sets\>`: 1-10 (how many sets)
-\`<6|7\>`: 6 or 7 numbers per set (optional, default: 6)"""
+    def send_stats(self, message_text, message_id=None, chat_id=None):
+        """Reply to '/stats' or '/stats <window>' with draw statistics"""
+        from ticket_store import get_ticket_store
+        from toto_stats import DrawStatistics, format_stats_message
+        try:
+            parts = message_text.split()
+            window = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else None
+            if window not in Config.STATS_WINDOWS:
+                window = None
+            stats = DrawStatistics.from_store(get_ticket_store())
+            self.send_response(format_stats_message(stats, window), reply_to_message_id=message_id, chat_id=chat_id)
+            return True
+        except Exception as e:
+            print(f"Error building statistics: {e}")
+            return False
 
-                self.send_response(help_text, reply_to_message_id=message_id)
+    def send_wheel(self, message_text, message_id=None, chat_id=None):
+        """Reply to '/wheel <numbers...> [tickets=N] [t=2|3|4]' with a coverage-optimised wheel"""
+        from wheel_designer import WheelDesigner, format_wheel_message, parse_wheel_request
+        request = parse_wheel_request(message_text)
+        if not request:
+            self.send_response(WHEEL_HELP_TEXT, reply_to_message_id=message_id, chat_id=chat_id)
+            return False
+        try:
+            result = WheelDesigner(request['pool'], request['tickets'], request['t']).design()
+            self.send_response(format_wheel_message(result), reply_to_message_id=message_id, chat_id=chat_id)
+            return True
+        except Exception as e:
+            print(f"Error designing wheel: {e}")
+            return False
 
-        return processed_any
+    def get_updates(self, offset=0, timeout=Config.LONG_POLL_TIMEOUT):
+        """Long-poll getUpdates from offset. Returns a list of updates, or None on error"""
+        try:
+            params = {
+                'offset': offset,
+                'limit': 100,
+                'timeout': timeout,
+                'allowed_updates': json.dumps(['message'])
+            }
+            with self.metrics.time('telegram_get_updates'):
+                response = self.delivery.session.get(f"{self.api_url}/getUpdates", params=params, timeout=timeout + 10)
 
+            if response.status_code == 200:
+                data = response.json()
+                if data.get('ok'):
+                    return data.get('result', [])
+            print(f"getUpdates failed: {response.status_code}")
+        except Exception as e:
+            print(f"Error getting updates: {e}")
+        return None
+
+    async def run_daemon(self, max_concurrency=Config.DAEMON_MAX_CONCURRENCY):
+        """Long-running mode: long-poll getUpdates with offset and handle updates for many
+        chats concurrently (at most max_concurrency at once, one at a time per chat).
+        Stops cleanly on SIGINT/SIGTERM after in-flight updates are finished."""
+        # asyncio is only needed by the daemon, so the one-shot cron check doesn't import it
+        import asyncio
+        import signal
+        from concurrent.futures import ThreadPoolExecutor
+
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=max_concurrency + 1))
+
+        stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except NotImplementedError:
+                pass  # Signal handlers are not available on Windows event loops
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+        chat_locks = {}
+        in_flight = {}  # update_id -> task, until the update has been handled
+        next_offset = acked = self.get_last_update_id()
+        stop_wait = asyncio.ensure_future(stop.wait())
+
+        def ack_offset():
+            # Only updates that have finished are acknowledged (to Telegram and in the ledger),
+            # so a crash or kill loses nothing that was still being handled
+            return min(in_flight) if in_flight else next_offset
+
+        print(f"Listening for Telegram updates (offset={next_offset}, concurrency={max_concurrency})...")
+
+        while not stop.is_set():
+            poll = asyncio.ensure_future(asyncio.to_thread(self.get_updates, ack_offset()))
+            await asyncio.wait({poll, stop_wait}, return_when=asyncio.FIRST_COMPLETED)
+            if not poll.done():
+                # Updates from an unfinished poll are not acknowledged, so Telegram redelivers them
+                break
+
+            updates = poll.result()
+            if updates is None:
+                await asyncio.sleep(Config.DAEMON_ERROR_BACKOFF)
+                continue
+
+            # Updates below next_offset are in flight or done, redelivered until acknowledged
+            new_updates = [update for update in updates if update['update_id'] >= next_offset]
+            for update in new_updates:
+                update_id = update['update_id']
+                next_offset = max(next_offset, update_id + 1)
+                await semaphore.acquire()
+                task = asyncio.create_task(self._handle_update_async(update, semaphore, chat_locks))
+                in_flight[update_id] = task
+                task.add_done_callback(lambda _, update_id=update_id: in_flight.pop(update_id, None))
+
+            if ack_offset() != acked:
+                acked = ack_offset()
+                self.save_last_update_id(acked)
+            self.metrics.maybe_flush()
+            self.ledger.maybe_compact()
+            if updates and not new_updates:
+                # Only redeliveries of unfinished updates: wait for one to finish before polling again
+                await asyncio.wait(set(in_flight.values()) | {stop_wait}, return_when=asyncio.FIRST_COMPLETED)
+
+        print(f"Shutting down, waiting for {len(in_flight)} in-flight updates...")
+        if in_flight:
+            await asyncio.gather(*in_flight.values(), return_exceptions=True)
+        stop_wait.cancel()
+        self.save_last_update_id(next_offset)
+        print(f"Delivery stats: {self.delivery.stats()}")
+
+    async def _handle_update_async(self, update, semaphore, chat_locks):
+        import asyncio
+        chat_id = update.get('message', {}).get('chat', {}).get('id')
+        # chat_locks[chat_id] = [lock, updates holding or waiting for it]; dropped when unused
+        entry = chat_locks.get(chat_id)
+        if entry is None:
+            entry = chat_locks[chat_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await asyncio.to_thread(self.handle_update, update, False)
+        except Exception as e:
+            print(f"Error handling update {update.get('update_id')}: {e}")
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del chat_locks[chat_id]
+            semaphore.release()
 
-def main():
+
+def main(argv=None):
     """Main function - CHECK ONLY, NO FALLBACK GENERATION"""
+    argv = sys.argv[1:] if argv is None else argv
     if not os.getenv('TELEGRAM_BOT_TOKEN') or not os.getenv('TELEGRAM_CHAT_ID'):
         print("Missing Telegram credentials")
         sys.exit(1)
 
     listener = TelegramListener()
+
+    if "--webhook" in argv:
+        from telegram_webhook import WebhookServer, set_webhook
+        server = WebhookServer(listener)
+        if Config.WEBHOOK_URL and not set_webhook(listener.delivery, Config.WEBHOOK_URL):
+            print("Warning: Could not register the webhook with Telegram")
+        server.serve_forever()
+        return
+
+    if "--daemon" in argv:
+        import asyncio
+        asyncio.run(listener.run_daemon())
+        return
+
     had_messages = listener.process_telegram_messages()
 
     if not had_messages:
@@ -0,0 +1,171 @@
+# telegram_webhook.py
+import hmac
+import json
+import queue
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import Config
+from toto_metrics import get_metrics
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class WebhookServer:
+    """Receives Telegram updates pushed to a webhook instead of polling getUpdates.
+
+    Each POST is checked against the secret token, put on a bounded queue and answered
+    with 200 straight away, so Telegram never waits for number generation or replies.
+    A pool of worker threads runs TelegramListener.handle_update. Updates are sharded by
+    chat, so each chat is answered in order. When the queues are full the server answers
+    503, and Telegram delivers the update again later."""
+
+    def __init__(self, listener, host=Config.WEBHOOK_HOST, port=Config.WEBHOOK_PORT, path=Config.WEBHOOK_PATH,
+                 secret_token=Config.WEBHOOK_SECRET, workers=Config.WEBHOOK_WORKERS,
+                 queue_size=Config.WEBHOOK_QUEUE_SIZE):
+        if not secret_token:
+            raise ValueError("A webhook secret token is required (TELEGRAM_WEBHOOK_SECRET)")
+        self.listener = listener
+        self.path = path
+        self.secret_token = secret_token.encode()
+        self.metrics = get_metrics()
+        self.queues = [queue.Queue(maxsize=max(1, queue_size // workers)) for _ in range(workers)]
+        self.workers = [
+            threading.Thread(target=self._work, args=(q,), name=f"webhook-worker-{i}", daemon=True)
+            for i, q in enumerate(self.queues)
+        ]
+        self.server = _Server((host, port), _Handler, self)
+
+    @property
+    def address(self):
+        return self.server.server_address[:2]
+
+    def check_secret(self, token):
+        return hmac.compare_digest((token or '').encode(), self.secret_token)
+
+    def submit(self, update):
+        """Queue an update for its chat's worker. Returns False if that queue is full"""
+        chat_id = update.get('message', {}).get('chat', {}).get('id')
+        shard = self.queues[hash(chat_id) % len(self.queues)]
+        try:
+            shard.put_nowait(update)
+        except queue.Full:
+            self.metrics.inc('webhook_queue_full')
+            return False
+        self.metrics.inc('webhook_received')
+        return True
+
+    def queue_depth(self):
+        return sum(q.qsize() for q in self.queues)
+
+    def _work(self, updates):
+        while True:
+            update = updates.get()
+            if update is None:
+                break
+            try:
+                with self.metrics.time('webhook_handle'):
+                    self.listener.handle_update(update, check_age=False)
+            except Exception as e:
+                print(f"Error handling update {update.get('update_id')}: {e}")
+            finally:
+                self.metrics.maybe_flush()
+                self.listener.ledger.maybe_compact()
+
+    def serve_forever(self):
+        """Serve until SIGINT/SIGTERM, then finish the queued updates"""
+        for worker in self.workers:
+            worker.start()
+
+        def stop(signum, frame):
+            # shutdown() waits for serve_forever to return, so it can't run in this thread
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, stop)
+
+        host, port = self.address
+        print(f"Listening for Telegram webhooks on http://{host}:{port}{self.path} ({len(self.workers)} workers)...")
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            print(f"Shutting down, finishing {self.queue_depth()} queued updates...")
+            for updates in self.queues:
+                updates.put(None)
+            for worker in self.workers:
+                worker.join()
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, handler, webhook):
+        self.webhook = webhook
+        super().__init__(address, handler)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        webhook = self.server.webhook
+        # Path, secret and size are checked before the body is read; the unread body then
+        # can't be parsed as the next request, so those replies close the connection
+        if self.path.split('?', 1)[0] != webhook.path:
+            self._reply(404, close=True)
+            return
+        if not webhook.check_secret(self.headers.get(SECRET_HEADER)):
+            webhook.metrics.inc('webhook_rejected')
+            self._reply(403, close=True)
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            self._reply(400, close=True)
+            return
+        if not 0 <= length <= Config.WEBHOOK_MAX_BODY_BYTES:
+            self._reply(413, close=True)
+            return
+
+        body = self.rfile.read(length)
+        try:
+            update = json.loads(body)
+        except ValueError:
+            self._reply(400)
+            return
+        if not isinstance(update, dict):
+            self._reply(400)
+            return
+
+        self._reply(200 if webhook.submit(update) else 503)
+
+    def _reply(self, status, close=False):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        if status == 503:
+            self.send_header('Retry-After', '1')
+        if close:
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def set_webhook(delivery, url, secret_token=Config.WEBHOOK_SECRET, max_connections=Config.WEBHOOK_MAX_CONNECTIONS):
+    """Register the webhook URL with Telegram (this stops getUpdates polling)"""
+    payload = {
+        'url': url,
+        'secret_token': secret_token,
+        'max_connections': max_connections,
+        'allowed_updates': ['message'],
+    }
+    return delivery.call('setWebhook', payload) is not None
+
+
+def delete_webhook(delivery):
+    """Remove the webhook so getUpdates polling works again"""
+    return delivery.call('deleteWebhook', {}) is not None
@@ -0,0 +1,293 @@
+# ticket_store.py
+import os
+import sqlite3
+import threading
+from array import array
+from datetime import date, datetime, timezone
+from config import Config
+from toto_sets import TicketMasks, from_bitmask, to_bitmask
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tickets (
+    id INTEGER PRIMARY KEY,
+    created_at INTEGER NOT NULL,
+    user_id TEXT NOT NULL,
+    chat_id TEXT,
+    message_id INTEGER,
+    numbers_per_set INTEGER NOT NULL,
+    mask INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tickets_user_created ON tickets (user_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_tickets_created ON tickets (created_at);
+
+CREATE TABLE IF NOT EXISTS draws (
+    draw_date TEXT PRIMARY KEY,
+    mask INTEGER NOT NULL,
+    additional INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS seeded_requests (
+    request_id TEXT PRIMARY KEY,
+    seed TEXT NOT NULL,
+    created_at INTEGER NOT NULL,
+    user_id TEXT NOT NULL,
+    chat_id TEXT,
+    sets INTEGER NOT NULL,
+    numbers_per_set INTEGER NOT NULL
+);
+"""
+
+
+def to_timestamp(value):
+    """Convert a datetime, date, ISO string or unix timestamp to unix seconds (UTC)"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+def to_draw_date(value):
+    """Normalise a draw date (date, datetime or string) to 'YYYY-MM-DD'"""
+    if isinstance(value, (date, datetime)):
+        return value.strftime("%Y-%m-%d")
+    return str(value)[:10]
+
+
+class TicketStore:
+    """Embedded SQLite (WAL) store for generated tickets and scraped draw results.
+    Sets are stored as 49-bit bitmasks; tickets are indexed by (user_id, created_at) and created_at,
+    draws by draw_date."""
+
+    def __init__(self, path=Config.STORE_FILE):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=Config.STORE_BUSY_TIMEOUT, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def add_tickets(self, tickets, user_id="Unknown", message_id=None, chat_id=None, created_at=None):
+        """Bulk insert sets (number lists, or a TicketMasks/TicketRanks array) in one transaction.
+        Returns the number of rows inserted"""
+        created = to_timestamp(created_at) if created_at is not None else int(datetime.now(timezone.utc).timestamp())
+        user_id = str(user_id)
+        chat_id = str(chat_id) if chat_id is not None else None
+
+        if isinstance(tickets, TicketMasks):
+            numbers_per_set = tickets.numbers_per_set
+            masks = tickets.masks
+        elif hasattr(tickets, 'to_masks'):
+            numbers_per_set = tickets.numbers_per_set
+            masks = tickets.to_masks().masks
+        else:
+            tickets = list(tickets)
+            numbers_per_set = None
+            masks = [to_bitmask(numbers) for numbers in tickets]
+
+        rows = (
+            (created, user_id, chat_id, message_id, numbers_per_set or mask.bit_count(), mask)
+            for mask in masks
+        )
+        with self.lock, self.conn:
+            cursor = self.conn.executemany(
+                "INSERT INTO tickets (created_at, user_id, chat_id, message_id, numbers_per_set, mask) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            return cursor.rowcount
+
+    def iter_tickets(self, user_id=None, since=None, until=None, batch_size=10000):
+        """Yield ticket dicts, optionally for one user and a [since, until) time range, oldest first"""
+        where, params = self._ticket_filter(user_id, since, until)
+        with self.lock:
+            cursor = self.conn.execute(
+                "SELECT id, created_at, user_id, chat_id, message_id, mask FROM tickets"
+                f"{where} ORDER BY created_at, id",
+                params
+            )
+        while True:
+            with self.lock:
+                rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for ticket_id, created, user, chat, message_id, mask in rows:
+                yield {
+                    'id': ticket_id,
+                    'created_at': datetime.fromtimestamp(created, tz=timezone.utc),
+                    'user_id': user,
+                    'chat_id': chat,
+                    'message_id': message_id,
+                    'numbers': from_bitmask(mask)
+                }
+
+    def tickets_for_user(self, user_id, since=None, until=None):
+        """All tickets for a user, optionally since a date/datetime"""
+        return list(self.iter_tickets(user_id, since, until))
+
+    def fetch_ticket_masks(self, user_id=None, since=None, until=None):
+        """Load tickets in column form for bulk processing.
+        Returns (ticket_ids array('q'), owner_index array('I'), owners [(user_id, chat_id)], masks array('Q'))"""
+        where, params = self._ticket_filter(user_id, since, until)
+        ticket_ids = array('q')
+        owner_index = array('I')
+        masks = array('Q')
+        owners = []
+        owner_lookup = {}
+        with self.lock:
+            cursor = self.conn.execute(f"SELECT id, user_id, chat_id, mask FROM tickets{where} ORDER BY id", params)
+            for ticket_id, user, chat, mask in cursor:
+                owner = owner_lookup.get((user, chat))
+                if owner is None:
+                    owner = owner_lookup[(user, chat)] = len(owners)
+                    owners.append((user, chat))
+                ticket_ids.append(ticket_id)
+                owner_index.append(owner)
+                masks.append(mask)
+        return ticket_ids, owner_index, owners, masks
+
+    def iter_ticket_rows(self, after_id=0, batch_size=10000):
+        """Yield batches of raw ticket rows with id > after_id, in id order:
+        (id, created_at, user_id, chat_id, message_id, numbers_per_set, mask)"""
+        with self.lock:
+            cursor = self.conn.execute(
+                "SELECT id, created_at, user_id, chat_id, message_id, numbers_per_set, mask FROM tickets "
+                "WHERE id > ? ORDER BY id",
+                (after_id,)
+            )
+        while True:
+            with self.lock:
+                rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+
+    def draw_rows(self):
+        """Raw draw rows (draw_date, mask, additional), oldest first"""
+        with self.lock:
+            return self.conn.execute("SELECT draw_date, mask, additional FROM draws ORDER BY draw_date").fetchall()
+
+    def count_tickets(self, user_id=None, since=None, until=None):
+        where, params = self._ticket_filter(user_id, since, until)
+        with self.lock:
+            return self.conn.execute(f"SELECT COUNT(*) FROM tickets{where}", params).fetchone()[0]
+
+    def add_draws(self, draws):
+        """Insert draws given as (draw_date, winning_numbers, additional_number); existing dates are kept.
+        Returns the number of new draws"""
+        rows = [
+            (to_draw_date(draw_date), to_bitmask(numbers), int(additional))
+            for draw_date, numbers, additional in draws
+        ]
+        with self.lock, self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO draws (draw_date, mask, additional) VALUES (?, ?, ?)",
+                rows
+            )
+            return self.conn.total_changes - before
+
+    def draws_between(self, start=None, end=None):
+        """Draws with start <= draw_date <= end, oldest first"""
+        clauses = []
+        params = []
+        if start is not None:
+            clauses.append("draw_date >= ?")
+            params.append(to_draw_date(start))
+        if end is not None:
+            clauses.append("draw_date <= ?")
+            params.append(to_draw_date(end))
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT draw_date, mask, additional FROM draws{where} ORDER BY draw_date",
+                params
+            ).fetchall()
+        return [
+            {'draw_date': draw_date, 'numbers': from_bitmask(mask), 'additional': additional}
+            for draw_date, mask, additional in rows
+        ]
+
+    def count_draws(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM draws").fetchone()[0]
+
+    def latest_draw_date(self):
+        with self.lock:
+            return self.conn.execute("SELECT MAX(draw_date) FROM draws").fetchone()[0]
+
+    def previous_draw_date(self, draw_date):
+        """Date of the draw before draw_date, or None"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT MAX(draw_date) FROM draws WHERE draw_date < ?", (to_draw_date(draw_date),)
+            ).fetchone()[0]
+
+    def add_seeded_request(self, request_id, seed, sets, numbers_per_set, user_id="Unknown", chat_id=None,
+                           created_at=None):
+        """Record a seeded request: with its seed, (request_id, sets, numbers_per_set) is enough to
+        regenerate every set. Returns False if the request was already recorded"""
+        created = to_timestamp(created_at) if created_at is not None else int(datetime.now(timezone.utc).timestamp())
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO seeded_requests "
+                "(request_id, seed, created_at, user_id, chat_id, sets, numbers_per_set) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (str(request_id), seed, created, str(user_id), str(chat_id) if chat_id is not None else None,
+                 sets, numbers_per_set)
+            )
+            return cursor.rowcount == 1
+
+    def seeded_request(self, request_id):
+        """The recorded seeded request as a dict, or None"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT request_id, seed, created_at, user_id, chat_id, sets, numbers_per_set "
+                "FROM seeded_requests WHERE request_id = ?",
+                (str(request_id),)
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ('request_id', 'seed', 'created_at', 'user_id', 'chat_id', 'sets', 'numbers_per_set')
+        return dict(zip(keys, row))
+
+    def _ticket_filter(self, user_id, since, until):
+        clauses = []
+        params = []
+        if user_id is not None:
+            clauses.append("user_id = ?")
+            params.append(str(user_id))
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(to_timestamp(since))
+        if until is not None:
+            clauses.append("created_at < ?")
+            params.append(to_timestamp(until))
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_ticket_store():
+    """Shared TicketStore for the process"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = TicketStore()
+        return _store
@@ -0,0 +1,348 @@
+# toto.py
+"""Single command line entry point for the TOTO tools:
+
+    python toto.py generate [sets] [numbers_per_set]
+    python toto.py generate --bulk N [numbers_per_set]
+    python toto.py count [sum=A-B] [odd=N] [high=N] [maxrun=N] [include=..] [exclude=..] [nolast]
+    python toto.py listen [--daemon | --webhook]
+    python toto.py scrape [--backfill]
+    python toto.py check [--date YYYY-MM-DD] [--send] [--columnar]
+    python toto.py stats [--window N] [--json] [--columnar]
+    python toto.py export [--full] [--dir DIR]
+    python toto.py regenerate REQUEST_ID [--set N]
+    python toto.py metrics [--json]
+    python toto.py wheel|simulate|backtest|bench|loadtest [options]
+
+Each command imports what it needs only when it runs, so short-lived cron runs (like the
+15-minute listener check) don't pay for loading every module. --profile-startup prints where
+the start-up time of a run went."""
+import builtins
+import sys
+import time
+
+_START = time.perf_counter()
+
+
+class ImportProfiler:
+    """Times the modules loaded while installed; each module is charged its own time,
+    excluding the modules it imports in turn"""
+
+    def __init__(self):
+        self.times = {}
+        self.stack = []
+        self.original_import = None
+
+    def install(self):
+        self.original_import = builtins.__import__
+        builtins.__import__ = self._import
+
+    def uninstall(self):
+        builtins.__import__ = self.original_import
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return self.original_import(name, globals, locals, fromlist, level)
+        self.stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return self.original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            children = self.stack.pop()
+            self.times[name] = self.times.get(name, 0.0) + elapsed - children
+            if self.stack:
+                self.stack[-1] += elapsed
+
+    def total(self):
+        return sum(self.times.values())
+
+
+def process_age():
+    """Seconds since this process was started (Linux only, 10 ms resolution), or None"""
+    try:
+        import os
+        with open('/proc/self/stat') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def print_startup_profile(command, profiler, interpreter_seconds, command_seconds):
+    print(f"\nStartup profile for '{command}':")
+    if interpreter_seconds is not None:
+        print(f"  interpreter start  {interpreter_seconds * 1000:8.1f} ms")
+    print(f"  imports            {profiler.total() * 1000:8.1f} ms ({len(profiler.times)} modules)")
+    print(f"  command            {command_seconds * 1000:8.1f} ms (imports included)")
+    print(f"  total              {(time.perf_counter() - _START) * 1000:8.1f} ms since toto.py started")
+    print("  slowest imports:")
+    for name, seconds in sorted(profiler.times.items(), key=lambda item: -item[1])[:10]:
+        print(f"    {name:30} {seconds * 1000:8.1f} ms")
+
+
+def cmd_generate(args):
+    import main
+    main.main(args.input, bulk=args.bulk)
+
+
+def cmd_listen(args):
+    import telegram_listener
+    telegram_listener.main(['--daemon'] if args.daemon else ['--webhook'] if args.webhook else [])
+
+
+def cmd_scrape(args):
+    import importlib
+    result_bot = importlib.import_module('web-scraper')
+    result_bot.ResultBot().run(backfill=args.backfill)
+
+
+def cmd_check(args):
+    from prize_checker import PrizeChecker, format_summary_message
+    from ticket_store import get_ticket_store
+
+    store = get_ticket_store()
+    draw_date = args.date or store.latest_draw_date()
+    draws = store.draws_between(draw_date, draw_date) if draw_date else []
+    if not draws:
+        print(f"No stored draw for {draw_date or 'any date'}; run 'toto.py scrape' first")
+        return 1
+
+    draw = draws[0]
+    previous_draw_date = store.previous_draw_date(draw['draw_date'])
+    if args.send:
+        import importlib
+        result_bot = importlib.import_module('web-scraper')
+        result_bot.ResultBot().send_prize_summaries(store, draw['draw_date'], draw['numbers'], draw['additional'])
+        return 0
+
+    if args.columnar:
+        from toto_columnar import ColumnarHistory
+        with ColumnarHistory() as history:
+            summaries = PrizeChecker(store, history).check_draw(draw['draw_date'], draw['numbers'],
+                                                                draw['additional'], previous_draw_date)
+    else:
+        summaries = PrizeChecker(store).check_draw(draw['draw_date'], draw['numbers'], draw['additional'],
+                                                   previous_draw_date)
+    if not summaries:
+        print(f"No tickets for the draw on {draw['draw_date']}")
+    for summary in summaries:
+        print(f"[chat {summary['chat_id']}]")
+        print(format_summary_message(summary, draw['draw_date'], draw['numbers'], draw['additional']))
+        print()
+    return 0
+
+
+def cmd_stats(args):
+    import json
+    from ticket_store import get_ticket_store
+    from toto_stats import DrawStatistics, format_stats_message
+
+    if args.columnar:
+        from toto_columnar import ColumnarHistory
+        with ColumnarHistory() as history:
+            stats = DrawStatistics.from_history(history)
+    else:
+        stats = DrawStatistics.from_store(get_ticket_store())
+    if args.json:
+        print(json.dumps(stats.summary(args.window), indent=2))
+    else:
+        print(format_stats_message(stats, args.window))
+
+
+def cmd_count(args):
+    from toto_constraints import Constraints
+    from toto_generator import TotoGenerator
+    from toto_sets import COMBINATIONS
+
+    try:
+        constraints = Constraints.parse(args.constraints)
+        if constraints is None:
+            print(f"Invalid constraints: {' '.join(args.constraints)}")
+            return 1
+        start = time.perf_counter()
+        count = TotoGenerator().count_combinations(constraints)
+    except ValueError as e:
+        print(e)
+        return 1
+    print(f"{count:,} of {COMBINATIONS:,} combinations ({count / COMBINATIONS:.2%}) match "
+          f"{constraints.describe() or 'no constraints'} [{(time.perf_counter() - start) * 1000:.1f} ms]")
+    return 0
+
+
+def cmd_export(args):
+    from config import Config
+    from ticket_store import get_ticket_store
+    from toto_columnar import export_history
+
+    start = time.perf_counter()
+    directory = args.dir or Config.EXPORT_DIR
+    manifest = export_history(get_ticket_store(), directory, full=args.full)
+    print(f"Exported {manifest['tickets']} tickets and {manifest['draws']} draws to {directory} "
+          f"in {time.perf_counter() - start:.2f}s")
+
+
+def cmd_regenerate(args):
+    from ticket_store import get_ticket_store
+    from toto_seeded import SeededGenerator
+
+    request = get_ticket_store().seeded_request(args.request_id)
+    if request is None:
+        print(f"No seeded request '{args.request_id}' in the store")
+        return 1
+    generator = SeededGenerator()
+    if generator.fingerprint != request['seed']:
+        print(f"Request '{args.request_id}' was generated with seed {request['seed']}, "
+              f"but TOTO_GENERATOR_SEED is {generator.fingerprint}")
+        return 1
+
+    indexes = [args.set - 1] if args.set else range(request['sets'])
+    for index in indexes:
+        numbers = generator.numbers(request['request_id'], index, request['numbers_per_set'])
+        print(f"Set {index + 1}: {' - '.join(map(str, numbers))}")
+    return 0
+
+
+def cmd_metrics(args):
+    import json
+    from toto_metrics import load_totals
+
+    totals = load_totals()
+    if args.json:
+        print(json.dumps({
+            'stages': {stage: histogram.summary() for stage, histogram in sorted(totals['histograms'].items())},
+            'counters': totals['counters'],
+        }, indent=2))
+        return
+
+    print(f"{'stage':24} {'count':>8} {'mean ms':>9} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for stage, histogram in sorted(totals['histograms'].items()):
+        summary = histogram.summary()
+        print(f"{stage:24} {summary['count']:>8} " + " ".join(
+            f"{summary[key] * 1000:>9.2f}" for key in ('mean', 'p50', 'p90', 'p99', 'max')))
+    for name, count in sorted(totals['counters'].items()):
+        print(f"{name:24} {count:>8}")
+
+
+def cmd_wheel(args):
+    import wheel_designer
+    wheel_designer.main(args.args)
+
+
+def cmd_simulate(args):
+    import toto_simulator
+    toto_simulator.main(args.args)
+
+
+def cmd_backtest(args):
+    import toto_backtest
+    toto_backtest.main(args.args)
+
+
+def cmd_bench(args):
+    import benchmark
+    benchmark.main(args.args)
+
+
+def cmd_loadtest(args):
+    import load_test
+    load_test.main(args.args)
+
+
+def build_parser():
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="toto.py", description="Singapore TOTO number generator and results bot")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Print interpreter, import and command timings when the command finishes")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="Generate numbers and send them to the configured chat")
+    generate.add_argument("input", nargs="*",
+                          help="'<sets>' or '<sets> <numbers_per_set>', then optional constraints (default: 1 set)")
+    generate.add_argument("--bulk", type=int, help="Generate N sets (no 10-set limit); many are sent as a CSV file")
+    generate.set_defaults(handler=cmd_generate)
+
+    listen = commands.add_parser("listen", help="Answer pending Telegram requests")
+    mode = listen.add_mutually_exclusive_group()
+    mode.add_argument("--daemon", action="store_true", help="Keep long-polling instead of checking once")
+    mode.add_argument("--webhook", action="store_true", help="Serve a webhook that Telegram pushes updates to")
+    listen.set_defaults(handler=cmd_listen)
+
+    scrape = commands.add_parser("scrape", help="Fetch new draw results, announce them and check tickets")
+    scrape.add_argument("--backfill", action="store_true", help="Fetch the full draw history")
+    scrape.set_defaults(handler=cmd_scrape)
+
+    check = commands.add_parser("check", help="Check stored tickets against a stored draw")
+    check.add_argument("--date", help="Draw date YYYY-MM-DD (default: latest stored draw)")
+    check.add_argument("--send", action="store_true", help="Send the summaries to Telegram instead of printing")
+    check.add_argument("--columnar", action="store_true", help="Read tickets from the columnar export")
+    check.set_defaults(handler=cmd_check)
+
+    stats = commands.add_parser("stats", help="Print draw statistics")
+    stats.add_argument("--window", type=int, help="Only the last N draws (one of the configured windows)")
+    stats.add_argument("--json", action="store_true", help="Print the raw summary as JSON")
+    stats.add_argument("--columnar", action="store_true", help="Read draws from the columnar export")
+    stats.set_defaults(handler=cmd_stats)
+
+    count = commands.add_parser("count", help="Count the 6-number combinations that satisfy constraints")
+    count.add_argument("constraints", nargs="*", help="sum=A-B odd=N high=N maxrun=N include=.. exclude=.. nolast")
+    count.set_defaults(handler=cmd_count)
+
+    export = commands.add_parser("export", help="Export tickets and draws to memory-mappable .npy columns")
+    export.add_argument("--full", action="store_true", help="Rewrite the export instead of appending new tickets")
+    export.add_argument("--dir", help="Export directory (default: data/export)")
+    export.set_defaults(handler=cmd_export)
+
+    regenerate = commands.add_parser("regenerate", help="Reproduce the sets of a seeded request from its id")
+    regenerate.add_argument("request_id", help="'<chat_id>:<message_id>' for Telegram requests")
+    regenerate.add_argument("--set", type=int, help="Only set N (1-based)")
+    regenerate.set_defaults(handler=cmd_regenerate)
+
+    metrics = commands.add_parser("metrics", help="Print the recorded per-stage timings and counters")
+    metrics.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    metrics.set_defaults(handler=cmd_metrics)
+
+    for name, handler, help_text in [
+        ("wheel", cmd_wheel, "Design a coverage-optimised wheel (see wheel_designer.py --help)"),
+        ("simulate", cmd_simulate, "Monte Carlo simulation of a strategy (see toto_simulator.py --help)"),
+        ("backtest", cmd_backtest, "Replay strategies against the stored draws (see toto_backtest.py --help)"),
+        ("bench", cmd_bench, "Run the benchmarks (see benchmark.py --help)"),
+        ("loadtest", cmd_loadtest, "Offline load test of the listener (see load_test.py --help)"),
+    ]:
+        # Options are passed through to the tool's own parser
+        command = commands.add_parser(name, help=help_text, add_help=False)
+        command.set_defaults(handler=handler, passthrough=True)
+
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    profiler = None
+    if "--profile-startup" in argv:
+        interpreter_seconds = process_age()
+        if interpreter_seconds is not None:
+            interpreter_seconds -= time.perf_counter() - _START
+        profiler = ImportProfiler()
+        profiler.install()
+
+    parser = build_parser()
+    args, extra = parser.parse_known_args(argv)
+    if getattr(args, 'passthrough', False):
+        args.args = extra
+    elif extra:
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+    command_start = time.perf_counter()
+    try:
+        status = args.handler(args)
+    finally:
+        if profiler:
+            profiler.uninstall()
+            print_startup_profile(args.command, profiler, interpreter_seconds, time.perf_counter() - command_start)
+    return status or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,335 @@
+# toto_backtest.py
+import argparse
+import random
+import re
+import statistics
+import sys
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from config import Config
+from prize_checker import TicketColumns, system_prize_lines
+from toto_sets import from_bitmask, to_bitmask
+from toto_simulator import _WIN_TABLE, _draw_columns, build_strategy as build_fixed_tickets, chunk_seed
+from toto_system import system_lines
+
+STRATEGIES = ('random', 'constrained', 'frequency', 'wheel', 'system')
+PRIZE_CODES = range(6, 14)  # match code = 2 * matched + additional_matched; prizes need 3+ matched
+# Byte lanes of per-draw counts overflow past 255 tickets, so they are flushed in blocks
+_LANE_BLOCK = 255
+_CODE_TABLES = {code: bytes(1 if value == code else 0 for value in range(256)) for code in PRIZE_CODES}
+_NONZERO = re.compile(rb'[^\x00]')
+
+
+def load_draws(store=None, history=None):
+    """Historical draws, oldest first, as (dates, winning bitmasks array('Q'), additional numbers array('B')).
+    Reads the columnar export when given, else the ticket store that ResultBot fills"""
+    dates = []
+    winning = array('Q')
+    additional = array('B')
+    if history is not None:
+        for draw_date, numbers, additional_number in history.iter_draws():
+            dates.append(draw_date)
+            winning.append(to_bitmask(numbers))
+            additional.append(additional_number)
+        return dates, winning, additional
+    if store is None:
+        from ticket_store import get_ticket_store
+        store = get_ticket_store()
+    for draw_date, mask, additional_number in store.draw_rows():
+        dates.append(draw_date)
+        winning.append(mask)
+        additional.append(additional_number)
+    return dates, winning, additional
+
+
+class Strategy:
+    """What a strategy plays in each draw: the same `tickets` (bitmasks) every draw, or the
+    tickets `choose(draw_index, number_counts, rng)` picks using only the draws before it"""
+
+    def __init__(self, name, tickets=None, choose=None, seed=0):
+        self.name = name
+        self.tickets = tickets
+        self.choose = choose
+        self.seed = seed
+
+
+def _frequency_tickets(tickets, numbers_per_set):
+    """Tickets drawn with each number weighted by 1 + its count in the draws so far"""
+    numbers = range(1, Config.NUMBER_RANGE[1] + 1)
+
+    def choose(index, counts, rng):
+        chosen = []
+        for _ in range(tickets):
+            weights = [counts[number] + 1 for number in numbers]
+            mask = 0
+            while mask.bit_count() < numbers_per_set:
+                cumulative = list(accumulate(weights))
+                position = bisect_right(cumulative, rng.random() * cumulative[-1])
+                mask |= 1 << position
+                weights[position] = 0
+            chosen.append(mask)
+        return chosen
+    return choose
+
+
+def build_strategy(name, seed=0, tickets=1, numbers_per_set=Config.NUMBERS_PER_SET, pool=None, t=3,
+                   constraints=None, winning=None):
+    """Strategy for `name`. random, system and wheel tickets come from toto_simulator; constrained
+    tickets are sampled uniformly from the combination index ('nolast' re-samples every draw
+    without the previous draw's numbers); frequency re-picks every draw from the draws so far"""
+    label = f"{name}#{seed}"
+    if name in ('random', 'system'):
+        return Strategy(label, build_fixed_tickets(name, seed, tickets, numbers_per_set), seed=seed)
+    if name == 'wheel':
+        if not pool:
+            raise ValueError("The wheel strategy needs a pool of numbers (--pool)")
+        return Strategy(label, build_fixed_tickets(name, seed, tickets, numbers_per_set, pool, t), seed=seed)
+    if name == 'frequency':
+        return Strategy(label, choose=_frequency_tickets(tickets, numbers_per_set), seed=seed)
+    if name == 'constrained':
+        from toto_constraints import Constraints, get_combination_index
+        constraints = constraints or Constraints()
+        index = get_combination_index()
+        if not constraints.exclude_last_draw:
+            rng = random.Random(chunk_seed(seed, 'strategy'))
+            return Strategy(label, index.sample(constraints, tickets, rng), seed=seed)
+
+        def choose(draw_index, counts, rng):
+            exclude = set(constraints.exclude)
+            if draw_index:
+                exclude.update(set(from_bitmask(winning[draw_index - 1])) - constraints.include)
+            return index.sample(Constraints(constraints.sum_range, constraints.odd, constraints.high,
+                                            constraints.max_run, constraints.include, exclude), tickets, rng)
+        return Strategy(label, choose=choose, seed=seed)
+    raise ValueError(f"Unknown strategy: {name}")
+
+
+class Backtester:
+    """Replays strategies against the historical draws.
+
+    Fixed tickets are scored as a tickets x draws matrix, one ticket at a time against byte
+    lanes of the draws (a byte per draw, as in toto_simulator), in chunks of
+    BACKTEST_CHUNK_DRAWS draws to bound memory. Strategies that re-pick every draw are scored
+    per draw across their tickets with prize_checker.TicketColumns."""
+
+    def __init__(self, dates, winning, additional, chunk_draws=Config.BACKTEST_CHUNK_DRAWS):
+        self.dates = dates
+        self.winning = winning
+        self.additional = additional
+        self.chunk_draws = chunk_draws
+        self.chunks = []
+        for start in range(0, len(dates), chunk_draws):
+            stop = min(len(dates), start + chunk_draws)
+            additional_masks = array('Q', [1 << (number - 1) for number in additional[start:stop]])
+            self.chunks.append((start, stop, _draw_columns(winning[start:stop], stop - start),
+                                _draw_columns(additional_masks, stop - start)))
+
+    def run(self, strategy, per_draw=False):
+        """Backtest one strategy. With per_draw, the result has a 'per_draw' list with each
+        draw's winning lines per group, winnings and cumulative return"""
+        draws = len(self.dates)
+        # histograms[size][code] = ticket-draws with that match code
+        histograms = {}
+        draw_codes = {} if per_draw else None
+        if strategy.tickets is not None:
+            winning_draws, lines_per_draw = self._run_fixed(strategy.tickets, histograms, draw_codes)
+            cost = draws * lines_per_draw * Config.TICKET_PRICE
+            draw_cost = [lines_per_draw * Config.TICKET_PRICE] * draws
+        else:
+            winning_draws, draw_lines = self._run_adaptive(strategy, histograms, draw_codes)
+            cost = sum(draw_lines) * Config.TICKET_PRICE
+            lines_per_draw = sum(draw_lines) / draws if draws else 0
+            draw_cost = [lines * Config.TICKET_PRICE for lines in draw_lines]
+
+        group_lines = {group: 0 for group in range(1, 8)}
+        for size, histogram in histograms.items():
+            for code, count in histogram.items():
+                for group, lines in system_prize_lines(size, code >> 1, code & 1).items():
+                    group_lines[group] += lines * count
+        winnings = sum(Config.PRIZE_AMOUNTS[group] * lines for group, lines in group_lines.items())
+        ticket_draws = sum(sum(histogram.values()) for histogram in histograms.values())
+        result = {
+            'strategy': strategy.name,
+            'draws': draws,
+            'lines_per_draw': lines_per_draw,
+            'group_lines': group_lines,
+            'winning_draws': winning_draws,
+            'hit_rate': winning_draws / draws if draws else 0.0,
+            'winning_tickets': ticket_draws,
+            'cost': cost,
+            'winnings': winnings,
+            'roi': (winnings - cost) / cost if cost else 0.0,
+        }
+        if per_draw:
+            result['per_draw'] = self._per_draw_rows(draw_codes, draw_cost)
+        return result
+
+    def _run_fixed(self, tickets, histograms, draw_codes):
+        winning_draws = 0
+        for start, stop, winning_columns, additional_columns in self.chunks:
+            count = stop - start
+            any_win = 0
+            lanes = {}
+            for i, ticket in enumerate(tickets):
+                numbers = from_bitmask(ticket)
+                total = 0
+                extra = 0
+                for number in numbers:
+                    total += winning_columns[number]
+                    extra += additional_columns[number]
+                codes = ((total << 1) + extra).to_bytes(count, 'little')
+                histogram = histograms.setdefault(len(numbers), {})
+                for code in PRIZE_CODES:
+                    hits = codes.count(code)
+                    if hits:
+                        histogram[code] = histogram.get(code, 0) + hits
+                        if draw_codes is not None:
+                            key = (len(numbers), code)
+                            lanes[key] = lanes.get(key, 0) + int.from_bytes(codes.translate(_CODE_TABLES[code]), 'little')
+                any_win |= int.from_bytes(codes.translate(_WIN_TABLE), 'little')
+                if draw_codes is not None and (i + 1) % _LANE_BLOCK == 0:
+                    self._flush_lanes(lanes, start, count, draw_codes)
+            if draw_codes is not None:
+                self._flush_lanes(lanes, start, count, draw_codes)
+            winning_draws += count - any_win.to_bytes(count, 'little').count(0)
+        return winning_draws, sum(system_lines(ticket.bit_count()) for ticket in tickets)
+
+    @staticmethod
+    def _flush_lanes(lanes, start, count, draw_codes):
+        for key, lane in lanes.items():
+            data = lane.to_bytes(count, 'little')
+            for match in _NONZERO.finditer(data):
+                per_draw = draw_codes.setdefault(start + match.start(), {})
+                per_draw[key] = per_draw.get(key, 0) + data[match.start()]
+        lanes.clear()
+
+    def _run_adaptive(self, strategy, histograms, draw_codes):
+        rng = random.Random(chunk_seed(strategy.seed, 'backtest'))
+        counts = [0] * (Config.NUMBER_RANGE[1] + 1)
+        winning_draws = 0
+        draw_lines = []
+        for index in range(len(self.dates)):
+            tickets = strategy.choose(index, counts, rng)
+            numbers = from_bitmask(self.winning[index])
+            codes = TicketColumns(array('Q', tickets)).match_codes(numbers, self.additional[index])
+            won = False
+            for ticket, code in zip(tickets, codes):
+                if code < PRIZE_CODES.start:
+                    continue
+                won = True
+                size = ticket.bit_count()
+                histogram = histograms.setdefault(size, {})
+                histogram[code] = histogram.get(code, 0) + 1
+                if draw_codes is not None:
+                    per_draw = draw_codes.setdefault(index, {})
+                    per_draw[(size, code)] = per_draw.get((size, code), 0) + 1
+            winning_draws += won
+            draw_lines.append(sum(system_lines(ticket.bit_count()) for ticket in tickets))
+            for number in numbers:
+                counts[number] += 1
+        return winning_draws, draw_lines
+
+    def _per_draw_rows(self, draw_codes, draw_cost):
+        rows = []
+        total_cost = 0
+        total_winnings = 0
+        for index, draw_date in enumerate(self.dates):
+            group_lines = {}
+            for (size, code), count in draw_codes.get(index, {}).items():
+                for group, lines in system_prize_lines(size, code >> 1, code & 1).items():
+                    group_lines[group] = group_lines.get(group, 0) + lines * count
+            winnings = sum(Config.PRIZE_AMOUNTS[group] * lines for group, lines in group_lines.items())
+            total_cost += draw_cost[index]
+            total_winnings += winnings
+            rows.append({
+                'date': draw_date,
+                'group_lines': group_lines,
+                'cost': draw_cost[index],
+                'winnings': winnings,
+                'cumulative_roi': (total_winnings - total_cost) / total_cost if total_cost else 0.0,
+            })
+        return rows
+
+
+def print_result(result):
+    groups = "  ".join(f"G{group}:{lines}" for group, lines in result['group_lines'].items() if lines)
+    print(f"{result['strategy']:16} hit rate {result['hit_rate']:7.2%}  cost ${result['cost']:>9,.0f}  "
+          f"won ${result['winnings']:>11,.0f}  ROI {result['roi']:+8.1%}  {groups or 'no prizes'}")
+
+
+def print_per_draw(result):
+    print(f"\n{result['strategy']}: per draw")
+    print(f"{'date':12} {'groups':24} {'cost':>6} {'won':>10} {'cum. ROI':>9}")
+    for row in result['per_draw']:
+        groups = " ".join(f"G{group}x{lines}" for group, lines in sorted(row['group_lines'].items()))
+        print(f"{row['date']:12} {groups or '-':24} {row['cost']:>6,.0f} {row['winnings']:>10,.0f} "
+              f"{row['cumulative_roi']:>+9.1%}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backtest TOTO strategies against the stored historical draws")
+    parser.add_argument("--strategy", choices=STRATEGIES, action="append",
+                        help="Strategy to replay (repeat for several; default: random)")
+    parser.add_argument("--repeat", type=int, default=1, help="Independent seeds per strategy")
+    parser.add_argument("--tickets", type=int, default=1, help="Tickets (or System entries) per draw")
+    parser.add_argument("--system-size", type=int, default=7, help="Numbers per System entry")
+    parser.add_argument("--pool", help="Comma-separated pool for the wheel strategy")
+    parser.add_argument("--t", type=int, default=3, help="Wheel subset size")
+    parser.add_argument("--constraints", default="", help="Constraints for 'constrained', e.g. 'sum=100-150 odd=3'")
+    parser.add_argument("--since", help="Only draws on or after YYYY-MM-DD")
+    parser.add_argument("--per-draw", action="store_true", help="Print every draw's result")
+    parser.add_argument("--columnar", action="store_true", help="Read draws from the columnar export")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.columnar:
+        from toto_columnar import ColumnarHistory
+        with ColumnarHistory() as history:
+            dates, winning, additional = load_draws(history=history)
+    else:
+        dates, winning, additional = load_draws()
+    if args.since:
+        first = bisect_left(dates, args.since[:10])
+        dates, winning, additional = dates[first:], winning[first:], additional[first:]
+    if not dates:
+        print("No stored draws to backtest against; run 'toto.py scrape --backfill' first")
+        sys.exit(1)
+
+    constraints = None
+    if args.constraints:
+        from toto_constraints import Constraints
+        constraints = Constraints.parse(args.constraints.split())
+        if constraints is None:
+            parser.error(f"invalid constraints: {args.constraints}")
+    pool = [int(n) for n in args.pool.split(',')] if args.pool else None
+
+    start = time.perf_counter()
+    backtester = Backtester(dates, winning, additional)
+    results = []
+    for name in args.strategy or ['random']:
+        for i in range(args.repeat):
+            numbers_per_set = args.system_size if name == 'system' else Config.NUMBERS_PER_SET
+            strategy = build_strategy(name, args.seed + i, args.tickets, numbers_per_set, pool, args.t,
+                                      constraints, winning)
+            results.append(backtester.run(strategy, per_draw=args.per_draw))
+    seconds = time.perf_counter() - start
+
+    print(f"Backtest over {len(dates):,} draws ({dates[0]} to {dates[-1]})\n")
+    if len(results) <= Config.BACKTEST_MAX_LISTED:
+        for result in results:
+            print_result(result)
+    for name in args.strategy or ['random']:
+        rois = [result['roi'] for result in results if result['strategy'].startswith(f"{name}#")]
+        if len(rois) > 1:
+            print(f"{name:16} {len(rois)} runs: ROI median {statistics.median(rois):+.1%}, "
+                  f"best {max(rois):+.1%}, worst {min(rois):+.1%}")
+    if args.per_draw:
+        for result in results[:Config.BACKTEST_MAX_LISTED]:
+            print_per_draw(result)
+    print(f"\n{len(results)} strategies x {len(dates):,} draws in {seconds:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+# toto_columnar.py
+import ast
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from config import Config
+from toto_sets import from_bitmask
+
+# Columns are plain NumPy .npy files (format 1.0), so numpy.load(path, mmap_mode='r') reads them too
+NPY_MAGIC = b'\x93NUMPY\x01\x00'
+NPY_HEADER_SIZE = 128  # Fixed, so the row count can be patched in place when appending
+EXPORT_VERSION = 1
+
+# Column name -> (array typecode, .npy descr)
+TICKET_COLUMNS = {
+    'id': ('q', '<i8'),
+    'created_at': ('q', '<i8'),
+    'owner': ('I', '<u4'),
+    'message_id': ('q', '<i8'),
+    'numbers_per_set': ('B', '|u1'),
+    'mask': ('Q', '<u8'),
+}
+DRAW_COLUMNS = {
+    'date': ('I', '<u4'),  # YYYYMMDD
+    'mask': ('Q', '<u8'),
+    'additional': ('B', '|u1'),
+}
+
+
+def _npy_header(descr, rows):
+    header = f"{{'descr': '{descr}', 'fortran_order': False, 'shape': ({rows},), }}"
+    header = header.ljust(NPY_HEADER_SIZE - len(NPY_MAGIC) - 2 - 1) + "\n"
+    return NPY_MAGIC + struct.pack('<H', len(header)) + header.encode('latin1')
+
+
+def _to_file_order(values):
+    if sys.byteorder == 'big' and values.itemsize > 1:
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values
+
+
+class NpyColumn:
+    """A one-dimensional .npy file, memory-mapped read-only. `values` is a memoryview over
+    the mapped file (no copy); slice it to scan a chunk"""
+
+    def __init__(self, path, rows=None):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(NPY_MAGIC) - 2] != NPY_MAGIC[:-2]:
+            raise ValueError(f"{path} is not a .npy file")
+        header_len = struct.unpack_from('<H', self.map, len(NPY_MAGIC))[0]
+        offset = len(NPY_MAGIC) + 2 + header_len
+        header = ast.literal_eval(self.map[len(NPY_MAGIC) + 2:offset].decode('latin1'))
+        typecode = {descr: code for code, descr in list(TICKET_COLUMNS.values()) + list(DRAW_COLUMNS.values())}[header['descr']]
+        count = header['shape'][0] if rows is None else min(rows, header['shape'][0])
+        self.itemsize = array(typecode).itemsize
+        self.view = memoryview(self.map)[offset:offset + count * self.itemsize]
+        if sys.byteorder == 'big' and self.itemsize > 1:
+            # Rare: the file is little-endian, so big-endian hosts get a swapped copy
+            values = array(typecode, self.view.tobytes())
+            values.byteswap()
+            self.values = memoryview(values)
+        else:
+            self.values = self.view.cast(typecode)
+
+    def __len__(self):
+        return len(self.values)
+
+    def close(self):
+        self.values.release()
+        self.view.release()
+        try:
+            self.map.close()
+        except BufferError:
+            pass  # A caller still holds a slice; the mapping is closed when that is released
+
+
+class _ColumnAppender:
+    """Appends rows to a .npy column, discarding anything past `rows` (an interrupted append)"""
+
+    def __init__(self, path, typecode, descr, rows):
+        self.descr = descr
+        self.typecode = typecode
+        self.rows = rows
+        exists = os.path.exists(path)
+        self.file = open(path, 'r+b' if exists else 'w+b')
+        if not exists:
+            self.file.write(_npy_header(descr, 0))
+        self.file.truncate(NPY_HEADER_SIZE + rows * array(typecode).itemsize)
+        self.file.seek(0, os.SEEK_END)
+
+    def write(self, values):
+        _to_file_order(values).tofile(self.file)
+        self.rows += len(values)
+
+    def close(self):
+        self.file.seek(0)
+        self.file.write(_npy_header(self.descr, self.rows))
+        self.file.close()
+
+
+def export_history(store, directory=Config.EXPORT_DIR, full=False, batch_size=Config.EXPORT_BATCH_ROWS):
+    """Export the store's tickets and draws to columnar .npy files in `directory`.
+    Tickets are appended incrementally (only rows newer than the last export) unless full
+    is set; draws are rewritten. Returns the manifest"""
+    tickets_dir = os.path.join(directory, 'tickets')
+    draws_dir = os.path.join(directory, 'draws')
+    os.makedirs(tickets_dir, exist_ok=True)
+    os.makedirs(draws_dir, exist_ok=True)
+    manifest_path = os.path.join(directory, 'manifest.json')
+
+    manifest = None if full else _load_manifest(directory)
+    if manifest is None:
+        manifest = {'version': EXPORT_VERSION, 'tickets': 0, 'last_ticket_id': 0,
+                    'tickets_sorted_by_created_at': True, 'last_created_at': None, 'draws': 0}
+        owners = []
+    else:
+        with open(os.path.join(tickets_dir, 'owners.json')) as f:
+            owners = [tuple(owner) for owner in json.load(f)]
+    owner_lookup = {owner: index for index, owner in enumerate(owners)}
+
+    appenders = {
+        name: _ColumnAppender(os.path.join(tickets_dir, f"{name}.npy"), typecode, descr, manifest['tickets'])
+        for name, (typecode, descr) in TICKET_COLUMNS.items()
+    }
+    last_created_at = manifest['last_created_at']
+    sorted_by_created = manifest['tickets_sorted_by_created_at']
+    try:
+        for rows in store.iter_ticket_rows(manifest['last_ticket_id'], batch_size):
+            columns = {name: array(typecode) for name, (typecode, _) in TICKET_COLUMNS.items()}
+            for ticket_id, created_at, user_id, chat_id, message_id, numbers_per_set, mask in rows:
+                owner = owner_lookup.get((user_id, chat_id))
+                if owner is None:
+                    owner = owner_lookup[(user_id, chat_id)] = len(owners)
+                    owners.append((user_id, chat_id))
+                if last_created_at is not None and created_at < last_created_at:
+                    sorted_by_created = False
+                last_created_at = created_at
+                columns['id'].append(ticket_id)
+                columns['created_at'].append(created_at)
+                columns['owner'].append(owner)
+                columns['message_id'].append(message_id if message_id is not None else -1)
+                columns['numbers_per_set'].append(numbers_per_set)
+                columns['mask'].append(mask)
+            for name, values in columns.items():
+                appenders[name].write(values)
+            manifest['last_ticket_id'] = rows[-1][0]
+    finally:
+        for appender in appenders.values():
+            appender.close()
+
+    manifest['tickets'] = appenders['id'].rows
+    manifest['last_created_at'] = last_created_at
+    manifest['tickets_sorted_by_created_at'] = sorted_by_created
+
+    draw_columns = {name: array(typecode) for name, (typecode, _) in DRAW_COLUMNS.items()}
+    for draw_date, mask, additional in store.draw_rows():
+        draw_columns['date'].append(int(draw_date[:10].replace('-', '')))
+        draw_columns['mask'].append(mask)
+        draw_columns['additional'].append(additional)
+    for name, (typecode, descr) in DRAW_COLUMNS.items():
+        path = os.path.join(draws_dir, f"{name}.npy")
+        with open(f"{path}.tmp", 'wb') as f:
+            f.write(_npy_header(descr, len(draw_columns[name])))
+            _to_file_order(draw_columns[name]).tofile(f)
+        os.replace(f"{path}.tmp", path)
+    manifest['draws'] = len(draw_columns['date'])
+    manifest['exported_at'] = int(time.time())
+
+    # The manifest is written last: readers never see rows beyond its counts
+    _write_json(os.path.join(tickets_dir, 'owners.json'), owners)
+    _write_json(manifest_path, manifest)
+    return manifest
+
+
+def _load_manifest(directory):
+    try:
+        with open(os.path.join(directory, 'manifest.json')) as f:
+            manifest = json.load(f)
+        return manifest if manifest.get('version') == EXPORT_VERSION else None
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, data):
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump(data, f)
+    os.replace(f"{path}.tmp", path)
+
+
+class ColumnarHistory:
+    """Read-only, memory-mapped view of an export. Opening it costs a few mmap calls however
+    long the history is; scans walk zero-copy memoryview slices chunk by chunk."""
+
+    def __init__(self, directory=Config.EXPORT_DIR):
+        self.directory = directory
+        self.manifest = _load_manifest(directory)
+        if self.manifest is None:
+            raise FileNotFoundError(f"No columnar export in {directory}; run 'toto.py export' first")
+        with open(os.path.join(directory, 'tickets', 'owners.json')) as f:
+            self.owners = [tuple(owner) for owner in json.load(f)]
+        self.tickets = {
+            name: NpyColumn(os.path.join(directory, 'tickets', f"{name}.npy"), self.manifest['tickets'])
+            for name in TICKET_COLUMNS
+        }
+        self.draws = {
+            name: NpyColumn(os.path.join(directory, 'draws', f"{name}.npy"), self.manifest['draws'])
+            for name in DRAW_COLUMNS
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        for column in list(self.tickets.values()) + list(self.draws.values()):
+            column.close()
+
+    @property
+    def ticket_count(self):
+        return len(self.tickets['id'])
+
+    @property
+    def draw_count(self):
+        return len(self.draws['date'])
+
+    def ticket_range(self, since=None, until=None):
+        """(start, stop) rows of the tickets created in [since, until) (unix seconds).
+        Binary search when the export is in creation order, otherwise the full range"""
+        if not self.manifest['tickets_sorted_by_created_at']:
+            return 0, self.ticket_count
+        created_at = self.tickets['created_at'].values
+        start = bisect_left(created_at, since) if since is not None else 0
+        stop = bisect_left(created_at, until) if until is not None else self.ticket_count
+        return start, max(start, stop)
+
+    def iter_ticket_chunks(self, since=None, until=None, columns=('id', 'owner', 'mask'),
+                           chunk_rows=Config.EXPORT_CHUNK_ROWS):
+        """Yield (start_row, {column: memoryview}) chunks of the tickets created in [since, until)"""
+        start, stop = self.ticket_range(since, until)
+        filtered = not self.manifest['tickets_sorted_by_created_at'] and (since is not None or until is not None)
+        for chunk_start in range(start, stop, chunk_rows):
+            chunk_stop = min(stop, chunk_start + chunk_rows)
+            chunk = {name: self.tickets[name].values[chunk_start:chunk_stop] for name in columns}
+            if filtered:
+                chunk = self._filter_chunk(chunk, chunk_start, chunk_stop, since, until)
+            yield chunk_start, chunk
+
+    def _filter_chunk(self, chunk, chunk_start, chunk_stop, since, until):
+        created_at = self.tickets['created_at'].values[chunk_start:chunk_stop]
+        keep = [
+            i for i, created in enumerate(created_at)
+            if (since is None or created >= since) and (until is None or created < until)
+        ]
+        return {name: memoryview(array(values.format, [values[i] for i in keep])) for name, values in chunk.items()}
+
+    def iter_draws(self):
+        """Yield (draw_date 'YYYY-MM-DD', numbers, additional), oldest first"""
+        dates = self.draws['date'].values
+        masks = self.draws['mask'].values
+        additional = self.draws['additional'].values
+        for i in range(len(dates)):
+            date = str(dates[i])
+            yield f"{date[:4]}-{date[4:6]}-{date[6:]}", from_bitmask(masks[i]), additional[i]
@@ -0,0 +1,391 @@
+# toto_constraints.py
+import mmap
+import os
+import random
+import struct
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from itertools import combinations
+from math import comb
+from config import Config
+from toto_sets import COMBINATIONS, MAX_NUMBER, from_bitmask, to_bitmask
+
+PICK = Config.NUMBERS_PER_SET
+MIN_SUM = PICK * (PICK + 1) // 2                       # 1+2+...+6 = 21
+MAX_SUM = sum(range(MAX_NUMBER - PICK + 1, MAX_NUMBER + 1))  # 44+...+49 = 279
+SUM_SPAN = MAX_SUM - MIN_SUM + 1
+# Feature key = ((odd * 7 + high) * 6 + max_run - 1) * SUM_SPAN + sum - MIN_SUM. Sum is innermost,
+# so a sum range within one (odd, high, max_run) is one contiguous slice of the index
+NUM_KEYS = (PICK + 1) * (PICK + 1) * PICK * SUM_SPAN
+
+INDEX_MAGIC = b'TOTC'
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct('<4sIII')  # magic, version, number of keys, number of combinations
+_OFFSETS_BYTES = 4 * (NUM_KEYS + 1)
+_MASKS_OFFSET = (INDEX_HEADER.size + _OFFSETS_BYTES + 7) & ~7
+
+
+def combination_features(numbers):
+    """(sum, odd count, high count, longest run of consecutive numbers) of a set"""
+    numbers = sorted(numbers)
+    longest = run = 1
+    for previous, number in zip(numbers, numbers[1:]):
+        run = run + 1 if number == previous + 1 else 1
+        longest = max(longest, run)
+    odd = sum(number & 1 for number in numbers)
+    high = sum(number >= Config.CONSTRAINT_HIGH_FROM for number in numbers)
+    return sum(numbers), odd, high, longest
+
+
+def feature_key(total, odd, high, longest):
+    return ((odd * (PICK + 1) + high) * PICK + longest - 1) * SUM_SPAN + total - MIN_SUM
+
+
+def _range(value, low, high, name):
+    """Normalise None, an int or a (min, max) pair to an inclusive (min, max) within [low, high].
+    Raises ValueError if nothing in [low, high] is left"""
+    if value is None:
+        return low, high
+    if isinstance(value, int):
+        value = (value, value)
+    result = max(low, value[0]), min(high, value[1])
+    if result[0] > result[1]:
+        raise ValueError(f"{name} must be a range within {low}-{high}")
+    return result
+
+
+class Constraints:
+    """Filters for 6-number sets. Ranges are inclusive (min, max) pairs or a single int;
+    max_run is the longest allowed run of consecutive numbers. exclude_last_draw is resolved
+    to numbers by the caller (TotoGenerator) and added to exclude"""
+
+    def __init__(self, sum_range=None, odd=None, high=None, max_run=None, include=(), exclude=(),
+                 exclude_last_draw=False):
+        self.sum_range = _range(sum_range, MIN_SUM, MAX_SUM, "sum")
+        self.odd = _range(odd, 0, PICK, "odd")
+        self.high = _range(high, 0, PICK, "high")
+        self.max_run = PICK if max_run is None else max(1, min(PICK, max_run))
+        self.include = frozenset(include)
+        self.exclude = frozenset(exclude)
+        self.exclude_last_draw = exclude_last_draw
+        numbers = self.include | self.exclude
+        if any(not 1 <= number <= MAX_NUMBER for number in numbers):
+            raise ValueError(f"Numbers must be between 1 and {MAX_NUMBER}")
+        if self.include & self.exclude:
+            raise ValueError("A number can't be both included and excluded")
+        if len(self.include) > PICK:
+            raise ValueError(f"At most {PICK} numbers can be included")
+
+    @classmethod
+    def parse(cls, tokens):
+        """Build constraints from 'key=value' tokens:
+        sum=100-150  odd=3  high=2-4  maxrun=2  include=7,13  exclude=1,2  nolast"""
+        options = {}
+        for token in tokens:
+            key, _, value = token.lower().partition('=')
+            try:
+                if key == 'nolast' and not value:
+                    options['exclude_last_draw'] = True
+                elif key in ('sum', 'odd', 'high') and value:
+                    low, _, high = value.partition('-')
+                    options['sum_range' if key == 'sum' else key] = (int(low), int(high or low))
+                elif key == 'maxrun' and value:
+                    options['max_run'] = int(value)
+                elif key in ('include', 'exclude') and value:
+                    options[key] = [int(number) for number in value.split(',')]
+                else:
+                    return None
+            except ValueError:
+                return None
+        return cls(**options)
+
+    @property
+    def has_features(self):
+        return (self.sum_range != (MIN_SUM, MAX_SUM) or self.odd != (0, PICK) or self.high != (0, PICK)
+                or self.max_run < PICK)
+
+    def matches(self, numbers):
+        mask = to_bitmask(numbers)
+        if mask & self.exclude_mask or mask & self.include_mask != self.include_mask:
+            return False
+        return self.matches_features(combination_features(numbers))
+
+    def matches_features(self, features):
+        total, odd, high, longest = features
+        return (self.sum_range[0] <= total <= self.sum_range[1] and self.odd[0] <= odd <= self.odd[1]
+                and self.high[0] <= high <= self.high[1] and longest <= self.max_run)
+
+    @property
+    def include_mask(self):
+        return to_bitmask(self.include)
+
+    @property
+    def exclude_mask(self):
+        return to_bitmask(self.exclude)
+
+    def describe(self):
+        parts = []
+        if self.sum_range != (MIN_SUM, MAX_SUM):
+            parts.append(f"sum {_format_range(self.sum_range)}")
+        if self.odd != (0, PICK):
+            parts.append(f"{_format_range(self.odd)} odd")
+        if self.high != (0, PICK):
+            parts.append(f"{_format_range(self.high)} high (≥{Config.CONSTRAINT_HIGH_FROM})")
+        if self.max_run < PICK:
+            parts.append(f"runs of at most {self.max_run}")
+        if self.include:
+            parts.append(f"with {', '.join(map(str, sorted(self.include)))}")
+        if self.exclude:
+            parts.append(f"without {', '.join(map(str, sorted(self.exclude)))}")
+        if self.exclude_last_draw:
+            parts.append("no numbers from the last draw")
+        return "; ".join(parts)
+
+
+def _format_range(value):
+    return str(value[0]) if value[0] == value[1] else f"{value[0]}-{value[1]}"
+
+
+def build_index(path=Config.COMBINATION_INDEX_FILE):
+    """Write the combination index: every 6-of-49 set as a bitmask, grouped by feature key,
+    plus the offset of each key's group. Takes a while but only ever runs once"""
+    start = time.perf_counter()
+    print(f"Building the combination index ({COMBINATIONS:,} sets, one-off)...")
+    counts = array('I', bytes(4 * NUM_KEYS))
+    for key, _ in _iter_keyed_masks():
+        counts[key] += 1
+
+    offsets = array('I', bytes(4 * (NUM_KEYS + 1)))
+    for key in range(NUM_KEYS):
+        offsets[key + 1] = offsets[key] + counts[key]
+    positions = array('I', offsets[:NUM_KEYS])
+    masks = array('Q', bytes(8 * COMBINATIONS))
+    for key, mask in _iter_keyed_masks():
+        masks[positions[key]] = mask
+        positions[key] += 1
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if sys.byteorder == 'big':
+        offsets.byteswap()
+        masks.byteswap()
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, NUM_KEYS, COMBINATIONS))
+        offsets.tofile(f)
+        f.write(bytes(_MASKS_OFFSET - f.tell()))
+        masks.tofile(f)
+    os.replace(temp_path, path)
+    print(f"Combination index written to {path} in {time.perf_counter() - start:.1f}s")
+
+
+def _iter_keyed_masks():
+    """Yield (feature key, bitmask) for every 6-number combination, with the features
+    accumulated number by number instead of recomputed for each set"""
+    high_from = Config.CONSTRAINT_HIGH_FROM
+    n = MAX_NUMBER
+    for a in range(1, n - 4):
+        s1, o1, h1, m1 = a, a & 1, a >= high_from, 1 << (a - 1)
+        for b in range(a + 1, n - 3):
+            r2 = 2 if b == a + 1 else 1
+            s2, o2, h2, m2, l2 = s1 + b, o1 + (b & 1), h1 + (b >= high_from), m1 | 1 << (b - 1), r2
+            for c in range(b + 1, n - 2):
+                r3 = r2 + 1 if c == b + 1 else 1
+                s3, o3, h3, m3, l3 = s2 + c, o2 + (c & 1), h2 + (c >= high_from), m2 | 1 << (c - 1), max(l2, r3)
+                for d in range(c + 1, n - 1):
+                    r4 = r3 + 1 if d == c + 1 else 1
+                    s4, o4, h4, m4, l4 = s3 + d, o3 + (d & 1), h3 + (d >= high_from), m3 | 1 << (d - 1), max(l3, r4)
+                    for e in range(d + 1, n):
+                        r5 = r4 + 1 if e == d + 1 else 1
+                        s5, o5, h5, m5, l5 = s4 + e, o4 + (e & 1), h4 + (e >= high_from), m4 | 1 << (e - 1), max(l4, r5)
+                        # The first f (e + 1) extends the current run; the others start a new one
+                        f = e + 1
+                        yield feature_key(s5 + f, o5 + (f & 1), h5 + (f >= high_from), max(l5, r5 + 1)), m5 | 1 << (f - 1)
+                        for f in range(e + 2, n + 1):
+                            yield feature_key(s5 + f, o5 + (f & 1), h5 + (f >= high_from), l5), m5 | 1 << (f - 1)
+
+
+class CombinationIndex:
+    """Memory-mapped index of all 6-of-49 sets grouped by (odd, high, max_run, sum).
+    Any mix of feature constraints selects at most 7 * 7 * 6 contiguous slices, so matching
+    sets are counted from the offsets alone and sampled uniformly with one bisect.
+    Included or excluded numbers are checked on the sampled sets, or counted exactly with
+    byte-lane columns over the selected slices (see prize_checker.TicketColumns)."""
+
+    def __init__(self, path=Config.COMBINATION_INDEX_FILE, build=True):
+        self.path = path
+        if not os.path.exists(path):
+            if not build:
+                raise ValueError("Constrained sets aren't available yet: the combination index "
+                                 "is built with 'toto.py count'")
+            build_index(path)
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, keys, count = INDEX_HEADER.unpack_from(self.map, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION or keys != NUM_KEYS or count != COMBINATIONS:
+            raise ValueError(f"{path} is not a combination index; delete it to rebuild")
+        self.offsets = array('I', self.map[INDEX_HEADER.size:INDEX_HEADER.size + _OFFSETS_BYTES])
+        if sys.byteorder == 'big':
+            self.offsets.byteswap()
+        self.masks = memoryview(self.map)[_MASKS_OFFSET:_MASKS_OFFSET + 8 * COMBINATIONS].cast('Q')
+
+    def close(self):
+        self.masks.release()
+        self.map.close()
+
+    def _mask_at(self, position):
+        mask = self.masks[position]
+        if sys.byteorder == 'big':
+            mask = int.from_bytes(mask.to_bytes(8, 'big'), 'little')
+        return mask
+
+    def segments(self, constraints):
+        """(start, stop) slices of the index holding the sets that satisfy the feature constraints"""
+        low_sum, high_sum = constraints.sum_range
+        segments = []
+        for odd in range(constraints.odd[0], constraints.odd[1] + 1):
+            for high in range(constraints.high[0], constraints.high[1] + 1):
+                for longest in range(1, constraints.max_run + 1):
+                    first = feature_key(low_sum, odd, high, longest)
+                    last = feature_key(high_sum, odd, high, longest)
+                    start, stop = self.offsets[first], self.offsets[last + 1]
+                    if stop > start:
+                        segments.append((start, stop))
+        return segments
+
+    def count(self, constraints):
+        """Exact number of 6-number sets satisfying the constraints"""
+        if not constraints.include and not constraints.exclude:
+            return sum(stop - start for start, stop in self.segments(constraints))
+        pool = _enumeration_pool(constraints)
+        if pool is not None:
+            return len(pool)
+        wanted = _wanted_code(constraints)
+        return sum(codes.count(wanted) for _, codes in self._iter_codes(constraints))
+
+    def _iter_codes(self, constraints):
+        """Yield (index position, codes) chunks over the selected slices, with a byte per set:
+        8 * included numbers present + excluded numbers present (at most 54)"""
+        from prize_checker import TicketColumns
+        numbers = sorted(constraints.include) + sorted(constraints.exclude)
+        for start, stop in self.segments(constraints):
+            for chunk_start in range(start, stop, Config.CONSTRAINT_CHUNK_ROWS):
+                columns = TicketColumns(self.masks[chunk_start:min(stop, chunk_start + Config.CONSTRAINT_CHUNK_ROWS)])
+                code = 0
+                for number in numbers:
+                    code += columns.column(number) << 3 if number in constraints.include else columns.column(number)
+                yield chunk_start, code.to_bytes(columns.count, 'little')
+
+    def matching_positions(self, constraints):
+        """Index positions of every set satisfying the constraints, found with the same
+        byte-lane pass as count()"""
+        wanted = _wanted_code(constraints)
+        positions = array('I')
+        for chunk_start, codes in self._iter_codes(constraints):
+            i = codes.find(wanted)
+            while i >= 0:
+                positions.append(chunk_start + i)
+                i = codes.find(wanted, i + 1)
+        return positions
+
+    def matching_masks(self, constraints):
+        """Bitmasks of every set satisfying the constraints, as an array('Q')"""
+        pool = _enumeration_pool(constraints)
+        if pool is not None:
+            return array('Q', pool)
+        if constraints.include or constraints.exclude:
+            return array('Q', [self._mask_at(position) for position in self.matching_positions(constraints)])
+        masks = array('Q')
+        for start, stop in self.segments(constraints):
+            masks.frombytes(self.masks[start:stop].tobytes())
+        if sys.byteorder == 'big':
+            masks.byteswap()
+        return masks
+
+    def sample(self, constraints, count, rng=random):
+        """`count` independent, uniformly drawn bitmasks of sets satisfying the constraints.
+        Raises ValueError if no set does"""
+        pool = _enumeration_pool(constraints)
+        if pool is not None:
+            if not pool:
+                raise ValueError("No combination satisfies these constraints")
+            return [pool[rng.randrange(len(pool))] for _ in range(count)]
+
+        segments = self.segments(constraints)
+        cumulative = []
+        total = 0
+        for start, stop in segments:
+            total += stop - start
+            cumulative.append(total)
+        if not total:
+            raise ValueError("No combination satisfies these constraints")
+
+        include_mask = constraints.include_mask
+        exclude_mask = constraints.exclude_mask
+        masks = []
+        positions = None
+        for _ in range(count):
+            if positions is None:
+                for _ in range(Config.CONSTRAINT_MAX_REJECTIONS):
+                    r = rng.randrange(total)
+                    segment = bisect_right(cumulative, r)
+                    start = segments[segment][0]
+                    mask = self._mask_at(start + r - (cumulative[segment - 1] if segment else 0))
+                    if not mask & exclude_mask and mask & include_mask == include_mask:
+                        masks.append(mask)
+                        break
+                else:
+                    # Too few matches for rejection: list them all and sample from the list
+                    positions = self.matching_positions(constraints)
+                    if not positions:
+                        raise ValueError("No combination satisfies these constraints")
+            if positions is not None:
+                masks.append(self._mask_at(positions[rng.randrange(len(positions))]))
+        return masks
+
+
+def _wanted_code(constraints):
+    """Code byte (see CombinationIndex._iter_codes) of a set with every included number and no excluded one"""
+    return bytes([8 * len(constraints.include)])
+
+
+def _enumeration_pool(constraints):
+    """All matching bitmasks when the included/excluded numbers leave few enough sets to list
+    directly (None otherwise)"""
+    if not constraints.include and not constraints.exclude:
+        return None
+    rest = [number for number in range(1, MAX_NUMBER + 1)
+            if number not in constraints.include and number not in constraints.exclude]
+    needed = PICK - len(constraints.include)
+    if comb(len(rest), needed) > Config.CONSTRAINT_ENUMERATE_MAX:
+        return None
+    include = sorted(constraints.include)
+    pool = []
+    for others in combinations(rest, needed):
+        numbers = include + list(others)
+        if constraints.matches_features(combination_features(numbers)):
+            pool.append(to_bitmask(numbers))
+    return pool
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_combination_index(build=True):
+    """Shared CombinationIndex for the process. A missing index is built on first use unless
+    build is False (request handlers), then ValueError is raised instead"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = CombinationIndex(build=build)
+        return _index
+
+
+def sample_sets(constraints, count, rng=random, build=True):
+    """`count` uniformly drawn sets (sorted number lists) satisfying the constraints"""
+    return [from_bitmask(mask) for mask in get_combination_index(build).sample(constraints, count, rng)]
@@ -1,49 +1,229 @@
 # toto_generator.py
 import random
 import json
+import sys
+import time
+from array import array
 from datetime import datetime
+from math import comb
 from config import Config
+from toto_sets import TicketMasks, TicketRanks, bitmask_to_rank, from_bitmask, rank, to_bitmask
+from toto_system import SYSTEM_SIZES, iter_system_lines, system_cost, system_lines
+from unique_registry import get_registry
 import re
 
 
 class TotoGenerator:
-    def __init__(self):
-        pass  # No longer needs Telegram credentials here
+    def __init__(self, seed=None, build_index=True):
+        # build_index=False: constrained requests fail instead of building the combination
+        # index (about 20 s) while a user waits; see toto_constraints.get_combination_index
+        self.build_index = build_index
+        # With a seed (or TOTO_GENERATOR_SEED) sets for a request id are reproducible
+        seed = Config.GENERATOR_SEED if seed is None else seed
+        if seed is not None:
+            from toto_seeded import SeededGenerator
+            self.seeded = SeededGenerator(seed)
+        else:
+            self.seeded = None
 
-    def generate_toto_numbers(self, numbers_per_set=Config.NUMBERS_PER_SET):
-        """Generate unique random numbers from 1-49 for Singapore Toto"""
+    def generate_toto_numbers(self, numbers_per_set=Config.NUMBERS_PER_SET, encoding=None):
+        """Generate unique random numbers from 1-49 for Singapore Toto.
+        encoding: None for a sorted list, 'rank' for the colex rank or 'bitmask' for a bitmask"""
         min_num, max_num = Config.NUMBER_RANGE
         numbers = random.sample(range(min_num, max_num + 1), numbers_per_set)
+        if encoding == 'rank':
+            return rank(numbers)
+        if encoding == 'bitmask':
+            return to_bitmask(numbers)
         numbers.sort()
         return numbers
 
-    def generate_multiple_sets(self, count=1, numbers_per_set=Config.NUMBERS_PER_SET):
-        """Generate multiple sets of Toto numbers"""
+    def resolve_constraints(self, constraints):
+        """Constraints with exclude_last_draw turned into the latest stored draw's numbers"""
+        if not constraints.exclude_last_draw:
+            return constraints
+        from ticket_store import get_ticket_store
+        from toto_constraints import Constraints
+        store = get_ticket_store()
+        latest = store.latest_draw_date()
+        if latest is None:
+            raise ValueError("There is no stored draw to exclude yet")
+        last_numbers = store.draws_between(latest, latest)[0]['numbers']
+        return Constraints(constraints.sum_range, constraints.odd, constraints.high, constraints.max_run,
+                           constraints.include, constraints.exclude | set(last_numbers), exclude_last_draw=True)
+
+    def generate_constrained(self, count, constraints, rng=random, unique=False):
+        """`count` 6-number sets drawn uniformly from the sets that satisfy `constraints`
+        (a toto_constraints.Constraints). With unique, only sets never issued before are
+        returned and they are claimed in the registry. Raises ValueError if none are left"""
+        from toto_constraints import sample_sets
+        constraints = self.resolve_constraints(constraints)
+        if not unique:
+            return sample_sets(constraints, count, rng, self.build_index)
+
+        from toto_constraints import get_combination_index
+        index = get_combination_index(self.build_index)
+        registry = get_registry()
+        sets = []
+        matches = None
+        for _ in range(Config.CONSTRAINT_CLAIM_ROUNDS):
+            claimed = len(sets)
+            for numbers in sample_sets(constraints, count - len(sets), rng, self.build_index):
+                # Sets already issued (or drawn twice in this round) are resampled
+                if registry.add(numbers):
+                    sets.append(numbers)
+            if len(sets) == count:
+                return sets
+            if len(sets) == claimed and matches is None:
+                matches = index.count(constraints)
+            if matches is not None and matches <= Config.CONSTRAINT_ENUMERATE_MAX:
+                break
+
+        if matches is None:
+            matches = index.count(constraints)
+        if matches > Config.CONSTRAINT_ENUMERATE_MAX:
+            raise ValueError("Couldn't find enough unused sets satisfying these constraints, please try again")
+        # Few matches, mostly issued already: draw from the ones that are still free
+        free = [mask for mask in index.matching_masks(constraints) if bitmask_to_rank(mask) not in registry]
+        while len(sets) < count and free:
+            i = rng.randrange(len(free))
+            free[i], free[-1] = free[-1], free[i]
+            numbers = from_bitmask(free.pop())
+            if registry.add(numbers):
+                sets.append(numbers)
+        if len(sets) < count:
+            raise ValueError("The sets satisfying these constraints have all been issued already")
+        return sets
+
+    def count_combinations(self, constraints):
+        """Exact number of 6-number sets that satisfy `constraints`"""
+        from toto_constraints import get_combination_index
+        return get_combination_index(self.build_index).count(self.resolve_constraints(constraints))
+
+    def generate_multiple_sets(self, count=1, numbers_per_set=Config.NUMBERS_PER_SET, unique=None, request_id=None,
+                               constraints=None):
+        """Generate multiple sets of Toto numbers.
+        unique: never repeat a 6-number set across all history (defaults to Config.UNIQUE_ACROSS_HISTORY)
+        request_id: with a seeded generator, the sets are derived from (seed, request_id, set index)
+        and the result carries 'request_id' and 'seed' so they can be regenerated later
+        constraints: only draw 6-number sets that satisfy these (see toto_constraints.Constraints)"""
         if count > 10:
             count = 10
         elif count < 1:
             count = 1
 
-        # Validate numbers_per_set (6 or 7 for TOTO)
-        if numbers_per_set not in [6, 7]:
+        # Validate numbers_per_set (6 for Ordinary, 7-12 for System entries)
+        if numbers_per_set not in SYSTEM_SIZES:
+            numbers_per_set = Config.NUMBERS_PER_SET
+
+        if unique is None:
+            unique = Config.UNIQUE_ACROSS_HISTORY
+
+        # The registry tracks 6-number combinations, so System entries are never restricted
+        seeded = None
+        if constraints is not None:
             numbers_per_set = Config.NUMBERS_PER_SET
+            if self.seeded and request_id is not None:
+                print(f"Warning: constrained sets are not seeded; request {request_id} can't be regenerated")
+            generated = self.generate_constrained(count, constraints, unique=unique)
+        elif unique and numbers_per_set == Config.NUMBERS_PER_SET:
+            generated = get_registry().claim_sets(count)
+        elif self.seeded and request_id is not None:
+            generated = self.seeded.generate_sets(request_id, count, numbers_per_set)
+            seeded = {"request_id": str(request_id), "seed": self.seeded.fingerprint}
+        else:
+            generated = [self.generate_toto_numbers(numbers_per_set) for _ in range(count)]
 
         sets = []
-        for i in range(count):
-            numbers = self.generate_toto_numbers(numbers_per_set)
+        for i, numbers in enumerate(generated):
             sets.append({
                 "set": i + 1,
                 "numbers": numbers,
                 "formatted": " - ".join(map(str, numbers))
             })
 
-        return {
+        result = {
             "total_sets": count,
             "numbers_per_set": numbers_per_set,
+            "lines_per_set": system_lines(numbers_per_set),
+            "total_cost": count * system_cost(numbers_per_set),
             "date": datetime.now().strftime("%Y-%m-%d"),
             "sets": sets
         }
-        
+        if seeded:
+            result.update(seeded)
+        if constraints is not None:
+            result["constraints"] = constraints.describe()
+        return result
+
+    def expand_system_set(self, numbers):
+        """Lazily expand a System entry into its 6-number lines (only when explicitly needed)"""
+        return iter_system_lines(numbers)
+
+    def generate_bulk(self, count, numbers_per_set=Config.NUMBERS_PER_SET, batch_size=Config.BULK_BATCH_SIZE,
+                      encoding='bitmask', request_id=None, start=0):
+        """Generate a large number of sets as a compact array: TicketMasks (8 bytes per set)
+        or, with encoding='rank', TicketRanks (4 bytes per set).
+        Unlike generate_multiple_sets there is no upper limit on count.
+        With a seeded generator and a request_id, sets start .. start+count-1 of that request
+        are returned, so bulk runs can be split across workers by start offset."""
+        if numbers_per_set not in SYSTEM_SIZES:
+            numbers_per_set = Config.NUMBERS_PER_SET
+
+        if self.seeded and request_id is not None:
+            return self.seeded.generate_bulk(request_id, count, numbers_per_set, start, encoding)
+
+        tickets = TicketRanks(numbers_per_set) if encoding == 'rank' else TicketMasks(numbers_per_set)
+        for batch in self.iter_bulk_batches(count, numbers_per_set, batch_size, encoding):
+            tickets.extend(batch)
+        return tickets
+
+    def iter_bulk_batches(self, count, numbers_per_set=Config.NUMBERS_PER_SET, batch_size=Config.BULK_BATCH_SIZE,
+                          encoding='bitmask'):
+        """Yield batches of at most batch_size sets until count sets are produced.
+        Batches are array('Q') bitmasks, or array('I') ranks with encoding='rank'."""
+        if encoding == 'rank':
+            yield from self._iter_rank_batches(count, numbers_per_set, batch_size)
+            return
+
+        min_num, max_num = Config.NUMBER_RANGE
+        span = max_num - min_num + 1
+        bits = (span - 1).bit_length()
+        getrandbits = random.getrandbits
+
+        remaining = max(count, 0)
+        while remaining > 0:
+            size = min(batch_size, remaining)
+            batch = array('Q', bytes(8 * size))
+            for i in range(size):
+                # Rejection sampling of distinct bit positions is uniform over all
+                # combinations and avoids random.sample's per-call overhead
+                mask = 0
+                picked = 0
+                while picked < numbers_per_set:
+                    position = getrandbits(bits)
+                    if position < span:
+                        bit = 1 << position
+                        if not mask & bit:
+                            mask |= bit
+                            picked += 1
+                batch[i] = mask << (min_num - 1)
+            remaining -= size
+            yield batch
+
+    def _iter_rank_batches(self, count, numbers_per_set, batch_size):
+        # Every rank in range(C(49, k)) is exactly one combination, so a uniform
+        # rank is a uniform set and needs no rejection step
+        min_num, max_num = Config.NUMBER_RANGE
+        total = comb(max_num - min_num + 1, numbers_per_set)
+        randbelow = random.randrange
+
+        remaining = max(count, 0)
+        while remaining > 0:
+            size = min(batch_size, remaining)
+            remaining -= size
+            yield array('I', [randbelow(total) for _ in range(size)])
+
     def user_input_test(self):
         print("Testing user input.... Please enter user input: ")
         user_input = input()
@@ -51,11 +231,15 @@ class TotoGenerator:
         return user_input
 
     def parse_user_input(self, text):
-        """Parse user input to get number of sets (1-10) and numbers per set (6 or 7).
-        Format: '<sets>' or '<sets> <6|7>'
-        Examples: '5' -> 5 sets of 6, '3 7' -> 3 sets of 7 numbers
-        Returns: dict with 'sets' and 'numbers_per_set' or None if invalid"""
+        """Parse user input to get number of sets (1-10) and numbers per set (6, or 7-12 for System entries).
+        Format: '<sets>' or '<sets> <6-12>', optionally followed by constraints for 6-number sets
+        Examples: '5' -> 5 sets of 6, '3 7' -> 3 System 7 entries,
+        '5 sum=100-150 odd=3 nolast' -> 5 sets with constraints
+        Returns: dict with 'sets' and 'numbers_per_set' (and 'constraints' if given) or None if invalid"""
         text = text.strip()
+        parts = text.split()
+        if len(parts) > 1 and ('=' in text or 'nolast' in parts[1:]):
+            return self._parse_constrained_input(parts)
         
         # Single number: just sets, default to 6 numbers per set
         if text.isdigit():
@@ -70,13 +254,28 @@ class TotoGenerator:
             try:
                 sets = int(parts[0])
                 numbers_per_set = int(parts[1])
-                if 1 <= sets <= 10 and numbers_per_set in [6,7,8]:
+                if 1 <= sets <= 10 and numbers_per_set in SYSTEM_SIZES:
                     return {'sets': sets, 'numbers_per_set': numbers_per_set}
             except ValueError:
                 pass
         
         return None
 
+    def _parse_constrained_input(self, parts):
+        numeric = 2 if len(parts) > 1 and parts[1].isdigit() else 1
+        request = self.parse_user_input(" ".join(parts[:numeric]))
+        if not request or request['numbers_per_set'] != Config.NUMBERS_PER_SET:
+            return None
+        from toto_constraints import Constraints
+        try:
+            constraints = Constraints.parse(parts[numeric:])
+        except ValueError:
+            return None
+        if constraints is None:
+            return None
+        request['constraints'] = constraints
+        return request
+
 def main():
     print("Running tests for Toto generator")
     toto_generator = TotoGenerator()
@@ -94,5 +293,34 @@ def main():
     print(multi_set)
 
 
+def benchmark_bulk(count=200000):
+    """Compare generate_bulk throughput against the per-set dict loop of generate_multiple_sets"""
+    toto_generator = TotoGenerator()
+
+    start = time.perf_counter()
+    sets = []
+    for i in range(count):
+        numbers = toto_generator.generate_toto_numbers()
+        sets.append({
+            "set": i + 1,
+            "numbers": numbers,
+            "formatted": " - ".join(map(str, numbers))
+        })
+    loop_seconds = time.perf_counter() - start
+
+    print(f"Sets generated: {count}")
+    print(f"Loop: {count / loop_seconds:,.0f} sets/s")
+
+    for encoding in ['bitmask', 'rank']:
+        start = time.perf_counter()
+        tickets = toto_generator.generate_bulk(count, encoding=encoding)
+        bulk_seconds = time.perf_counter() - start
+        print(f"Bulk ({encoding}): {count / bulk_seconds:,.0f} sets/s ({loop_seconds / bulk_seconds:.1f}x), "
+              f"{tickets.nbytes / count:.0f} bytes/set")
+
+
 if __name__ == "__main__":
-    main()
+    if "--bench" in sys.argv:
+        benchmark_bulk()
+    else:
+        main()
@@ -0,0 +1,238 @@
+# toto_metrics.py
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from config import Config
+
+try:
+    # Serialises flushes from concurrent processes (Linux/macOS)
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Upper bounds in seconds of the latency buckets (Prometheus 'le' labels); the last bucket is +Inf
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; percentiles are interpolated within buckets"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.buckets[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other):
+        for i, count in enumerate(other.buckets):
+            self.buckets[i] += count
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def percentile(self, fraction):
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            if count and seen + count >= target:
+                lower = BUCKETS[i - 1] if i else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else self.max
+                return min(self.max, lower + (upper - lower) * (target - seen) / count)
+            seen += count
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else 0.0,
+            'p50': self.percentile(0.50),
+            'p90': self.percentile(0.90),
+            'p99': self.percentile(0.99),
+            'max': self.max,
+        }
+
+    def to_dict(self):
+        return {'buckets': self.buckets, 'count': self.count, 'sum': self.sum, 'max': self.max}
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls()
+        if len(data['buckets']) == len(histogram.buckets):
+            histogram.buckets = list(data['buckets'])
+            histogram.count = data['count']
+            histogram.sum = data['sum']
+            histogram.max = data['max']
+        return histogram
+
+
+class _Timer:
+    __slots__ = ('metrics', 'stage', 'start')
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+        if exc_type is not None:
+            self.metrics.inc(f"{self.stage}_errors")
+        return False
+
+
+class Metrics:
+    """Per-stage latency histograms and counters for this process.
+
+    flush() adds what was recorded since the last flush to the cumulative totals in
+    METRICS_JSON_FILE (so short cron runs add up) and rewrites METRICS_PROM_FILE in the
+    Prometheus text format for node_exporter's textfile collector. Metrics are flushed
+    at exit, and periodically by long-running processes via maybe_flush()."""
+
+    def __init__(self, json_path=Config.METRICS_JSON_FILE, prom_path=Config.METRICS_PROM_FILE,
+                 enabled=Config.METRICS_ENABLED):
+        self.json_path = json_path
+        self.prom_path = prom_path
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.last_flush = time.monotonic()
+
+    def time(self, stage):
+        """Context manager recording the duration of a stage (and an error count if it raises)"""
+        return _Timer(self, stage)
+
+    def observe(self, stage, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name, amount=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def summary(self):
+        """JSON-friendly summary of this process's metrics since the last flush"""
+        with self.lock:
+            return {
+                'stages': {stage: histogram.summary() for stage, histogram in sorted(self.histograms.items())},
+                'counters': dict(sorted(self.counters.items())),
+            }
+
+    def maybe_flush(self, interval=Config.METRICS_FLUSH_INTERVAL):
+        if time.monotonic() - self.last_flush >= interval:
+            self.flush()
+
+    def flush(self):
+        """Merge the pending metrics into the cumulative files"""
+        if not self.enabled:
+            return
+        with self.lock:
+            histograms, self.histograms = self.histograms, {}
+            counters, self.counters = self.counters, {}
+            self.last_flush = time.monotonic()
+        if not histograms and not counters:
+            return
+
+        directory = os.path.dirname(self.json_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        try:
+            with open(f"{self.json_path}.lock", 'a') as lock_file:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                totals = load_totals(self.json_path)
+                for stage, histogram in histograms.items():
+                    totals['histograms'].setdefault(stage, Histogram()).merge(histogram)
+                for name, count in counters.items():
+                    totals['counters'][name] = totals['counters'].get(name, 0) + count
+                self._write(totals)
+        except OSError as e:
+            print(f"Warning: Could not write metrics: {e}")
+
+    def _write(self, totals):
+        data = {
+            'updated_at': int(time.time()),
+            'stages': {stage: {**histogram.summary(), **histogram.to_dict()}
+                       for stage, histogram in sorted(totals['histograms'].items())},
+            'counters': dict(sorted(totals['counters'].items())),
+        }
+        write_atomic(self.json_path, json.dumps(data, indent=2))
+        write_atomic(self.prom_path, to_prometheus(totals['histograms'], totals['counters']))
+
+
+def load_totals(path=Config.METRICS_JSON_FILE):
+    """Cumulative histograms and counters from the JSON metrics file"""
+    totals = {'histograms': {}, 'counters': {}}
+    try:
+        with open(path) as f:
+            data = json.load(f)
+        totals['histograms'] = {stage: Histogram.from_dict(values) for stage, values in data['stages'].items()}
+        totals['counters'] = data['counters']
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Warning: Could not load metrics, starting again: {e}")
+    return totals
+
+
+def to_prometheus(histograms, counters):
+    """Prometheus text exposition of stage histograms and counters"""
+    lines = [
+        "# HELP toto_stage_seconds Duration of each processing stage",
+        "# TYPE toto_stage_seconds histogram",
+    ]
+    for stage, histogram in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ('+Inf',), histogram.buckets):
+            cumulative += count
+            lines.append(f'toto_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        lines.append(f'toto_stage_seconds_sum{{stage="{stage}"}} {histogram.sum}')
+        lines.append(f'toto_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+    for name, count in sorted(counters.items()):
+        lines.append(f"# TYPE toto_{name}_total counter")
+        lines.append(f"toto_{name}_total {count}")
+    return "\n".join(lines) + "\n"
+
+
+def write_atomic(path, text):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as f:
+        f.write(text)
+    os.replace(temp_path, path)
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """Shared Metrics for the process; flushed at exit"""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics()
+            atexit.register(_metrics.flush)
+        return _metrics
@@ -0,0 +1,194 @@
+# toto_scraper.py
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from html.parser import HTMLParser
+import requests
+from requests.adapters import HTTPAdapter
+from config import Config
+from toto_metrics import get_metrics
+
+
+class DrawTableParser(HTMLParser):
+    """Streaming parser that collects the sum-p1 cells of every table row.
+    Builds no document tree, so it is several times faster than BeautifulSoup on the history pages."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.rows = []
+        self.cells = None
+        self.cell_text = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'tr':
+            self.cells = []
+        elif tag == 'td' and self.cells is not None:
+            classes = (dict(attrs).get('class') or '').split()
+            self.cell_text = [] if 'sum-p1' in classes else None
+
+    def handle_endtag(self, tag):
+        if tag == 'td' and self.cell_text is not None:
+            self.cells.append(''.join(self.cell_text).strip())
+            self.cell_text = None
+        elif tag == 'tr' and self.cells is not None:
+            if len(self.cells) >= 3:
+                self.rows.append(self.cells)
+            self.cells = None
+
+    def handle_data(self, data):
+        if self.cell_text is not None:
+            self.cell_text.append(data)
+
+
+def parse_draws(html):
+    """Parse a history page into (draw_date, winning_numbers, additional_number) tuples, newest first"""
+    parser = DrawTableParser()
+    parser.feed(html)
+    parser.close()
+
+    draws = []
+    for date_str, winning_numbers, additional_number in (row[:3] for row in parser.rows):
+        try:
+            draw_date = datetime.strptime(date_str, '%Y-%m-%d')
+            numbers = [int(num) for num in winning_numbers.split(',')]
+            draws.append((draw_date, numbers, int(additional_number)))
+        except ValueError:
+            continue
+    draws.sort(key=lambda draw: draw[0], reverse=True)
+    return draws
+
+
+class DrawScraper:
+    """Fetches Toto draw history pages, concurrently but politely, with an on-disk page cache
+    revalidated through ETag/If-Modified-Since. With fixture_dir set, pages are read from
+    <fixture_dir>/page_<n>.html and nothing touches the network."""
+
+    def __init__(self, cache_dir=Config.SCRAPER_CACHE_DIR, fixture_dir=Config.SCRAPER_FIXTURE_DIR,
+                 max_workers=Config.SCRAPER_MAX_WORKERS, min_interval=Config.SCRAPER_MIN_INTERVAL):
+        self.cache_dir = cache_dir
+        self.fixture_dir = fixture_dir
+        self.max_workers = max_workers
+        self.min_interval = min_interval
+        self.throttle_lock = threading.Lock()
+        self.next_request_at = 0.0
+        self.session = None
+
+    def page_url(self, page):
+        # Page 1 too: the site's default page size differs, which would shift the page boundaries
+        return Config.SCRAPER_PAGE_URL.format(page=page)
+
+    def fetch_page(self, page):
+        """Return the HTML of a history page, or None if it does not exist"""
+        if self.fixture_dir:
+            path = os.path.join(self.fixture_dir, f"page_{page}.html")
+            if not os.path.exists(path):
+                return None
+            with open(path, encoding='utf-8') as f:
+                return f.read()
+        return self._fetch_cached(self.page_url(page))
+
+    def fetch_draws(self, page):
+        metrics = get_metrics()
+        with metrics.time('scrape_fetch'):
+            html = self.fetch_page(page)
+        metrics.inc('scrape_pages')
+        if not html:
+            return []
+        with metrics.time('scrape_parse'):
+            return parse_draws(html)
+
+    def scrape(self, known_latest=None, backfill=False):
+        """Return draws newer than known_latest (a date or 'YYYY-MM-DD'), oldest first.
+        Pages are only fetched until a known draw is reached; without known_latest only
+        the first page is fetched. With backfill, the full history is fetched in
+        concurrent batches of pages."""
+        if isinstance(known_latest, str):
+            known_latest = datetime.strptime(known_latest[:10], '%Y-%m-%d')
+        stop_at = None if backfill else known_latest
+
+        draws = {}
+        page = 1
+        while page <= Config.SCRAPER_MAX_PAGES:
+            if backfill and page > 1:
+                pages = list(range(page, min(page + self.max_workers, Config.SCRAPER_MAX_PAGES + 1)))
+                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    results = list(executor.map(self.fetch_draws, pages))
+            else:
+                pages = [page]
+                results = [self.fetch_draws(page)]
+
+            reached_end = False
+            for page_draws in results:
+                if not page_draws:
+                    reached_end = True
+                    break
+                for draw in page_draws:
+                    if stop_at is None or draw[0] > stop_at:
+                        draws[draw[0]] = draw
+                    else:
+                        reached_end = True
+                if reached_end:
+                    break
+
+            if reached_end or (stop_at is None and not backfill):
+                break
+            page = pages[-1] + 1
+
+        return [draws[draw_date] for draw_date in sorted(draws)]
+
+    def _throttle(self):
+        with self.throttle_lock:
+            now = time.monotonic()
+            wait = self.next_request_at - now
+            self.next_request_at = max(now, self.next_request_at) + self.min_interval
+        if wait > 0:
+            time.sleep(wait)
+
+    def _get_session(self):
+        if self.session is None:
+            self.session = requests.Session()
+            self.session.headers.update(Config.headers)
+            self.session.mount('https://', HTTPAdapter(pool_maxsize=self.max_workers))
+        return self.session
+
+    def _fetch_cached(self, url):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        key = hashlib.sha1(url.encode()).hexdigest()
+        body_path = os.path.join(self.cache_dir, f"{key}.html")
+        meta_path = os.path.join(self.cache_dir, f"{key}.json")
+
+        meta = {}
+        if os.path.exists(body_path) and os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+        self._throttle()
+        response = self._get_session().get(url, headers=headers, timeout=Config.SCRAPER_TIMEOUT)
+
+        if response.status_code == 304:
+            get_metrics().inc('scrape_not_modified')
+            with open(body_path, encoding='utf-8') as f:
+                return f.read()
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+
+        with open(body_path, 'w', encoding='utf-8') as f:
+            f.write(response.text)
+        with open(meta_path, 'w') as f:
+            json.dump({
+                'url': url,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified')
+            }, f)
+        return response.text
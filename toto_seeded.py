@@ -0,0 +1,99 @@
+# toto_seeded.py
+import hashlib
+import struct
+from array import array
+from math import comb
+from config import Config
+from toto_sets import MAX_NUMBER, MAX_RANKED_NUMBERS, TicketMasks, TicketRanks, from_bitmask, rank_to_bitmask
+
+_COUNTER = struct.Struct('<QI')  # set index, rejection attempt
+_SPACE = 1 << 64
+_PERSON = b'toto-set-v1'  # Changing this (or the hashing below) changes every seeded set
+
+
+def seed_key(seed):
+    """32-byte BLAKE2b key for a seed given as bytes, a string or an int"""
+    if isinstance(seed, int):
+        seed = str(seed)
+    if isinstance(seed, str):
+        seed = seed.encode()
+    return hashlib.blake2b(seed, digest_size=32, person=b'toto-seed').digest()
+
+
+def seed_fingerprint(seed):
+    """Short public id of a seed, stored with each request instead of the seed itself"""
+    return hashlib.blake2b(seed_key(seed), digest_size=8).hexdigest()
+
+
+class SeededGenerator:
+    """Counter-based generator. Set `index` of request `request_id` is a pure function of
+    (seed, request_id, index): the triple is hashed with keyed BLAKE2b and the 64-bit digest
+    is mapped onto a colex rank, rehashing in the rare case it falls in the biased tail.
+
+    Any set can be regenerated on its own in O(1), sets can be produced in any order or
+    split across processes, and the seed plus the request id is enough to reproduce a
+    whole request."""
+
+    def __init__(self, seed=None):
+        seed = Config.GENERATOR_SEED if seed is None else seed
+        if seed is None:
+            raise ValueError("A generator seed is required (TOTO_GENERATOR_SEED)")
+        self.key = seed_key(seed)
+        self.fingerprint = seed_fingerprint(seed)
+
+    def _request_hasher(self, request_id):
+        hasher = hashlib.blake2b(key=self.key, digest_size=8, person=_PERSON)
+        hasher.update(str(request_id).encode() + b'\0')
+        return hasher
+
+    @staticmethod
+    def _rank(hasher, index, total, limit):
+        attempt = 0
+        while True:
+            h = hasher.copy()
+            h.update(_COUNTER.pack(index, attempt))
+            value = int.from_bytes(h.digest(), 'little')
+            if value < limit:
+                return value % total
+            attempt += 1
+
+    @staticmethod
+    def _space(numbers_per_set):
+        total = comb(MAX_NUMBER, numbers_per_set)
+        # Digests at or above the largest multiple of total would favour the low ranks
+        return total, _SPACE - _SPACE % total
+
+    def rank(self, request_id, index, numbers_per_set=Config.NUMBERS_PER_SET):
+        """Colex rank of set `index` (0-based) of a request"""
+        total, limit = self._space(numbers_per_set)
+        return self._rank(self._request_hasher(request_id), index, total, limit)
+
+    def mask(self, request_id, index, numbers_per_set=Config.NUMBERS_PER_SET):
+        return rank_to_bitmask(self.rank(request_id, index, numbers_per_set), numbers_per_set)
+
+    def numbers(self, request_id, index, numbers_per_set=Config.NUMBERS_PER_SET):
+        """Sorted numbers of set `index` of a request"""
+        return from_bitmask(self.mask(request_id, index, numbers_per_set))
+
+    def generate_sets(self, request_id, count, numbers_per_set=Config.NUMBERS_PER_SET, start=0):
+        """Sets start .. start+count-1 of a request, as sorted number lists"""
+        return [from_bitmask(mask) for mask in self.iter_masks(request_id, count, numbers_per_set, start)]
+
+    def iter_masks(self, request_id, count, numbers_per_set=Config.NUMBERS_PER_SET, start=0):
+        total, limit = self._space(numbers_per_set)
+        hasher = self._request_hasher(request_id)
+        for index in range(start, start + count):
+            yield rank_to_bitmask(self._rank(hasher, index, total, limit), numbers_per_set)
+
+    def generate_bulk(self, request_id, count, numbers_per_set=Config.NUMBERS_PER_SET, start=0,
+                      encoding='bitmask'):
+        """Sets start .. start+count-1 as TicketMasks, or TicketRanks with encoding='rank'.
+        Workers can each take their own start offset; the result does not depend on the split"""
+        if encoding == 'rank' and numbers_per_set > MAX_RANKED_NUMBERS:
+            raise ValueError(f"Ranks only fit a uint32 for up to {MAX_RANKED_NUMBERS} numbers per set")
+        total, limit = self._space(numbers_per_set)
+        hasher = self._request_hasher(request_id)
+        ranks = [self._rank(hasher, index, total, limit) for index in range(start, start + count)]
+        if encoding == 'rank':
+            return TicketRanks(numbers_per_set, array('I', ranks))
+        return TicketMasks(numbers_per_set, array('Q', [rank_to_bitmask(value, numbers_per_set) for value in ranks]))
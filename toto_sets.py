@@ -0,0 +1,235 @@
+# toto_sets.py
+import struct
+import sys
+from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_right
+from math import comb
+from config import Config
+
+MAX_NUMBER = Config.NUMBER_RANGE[1]
+MAX_RANKED_NUMBERS = 9  # C(49, 9) is the largest binomial that still fits a uint32
+COMBINATIONS = comb(MAX_NUMBER, Config.NUMBERS_PER_SET)  # 13,983,816 for 6-of-49
+
+# _BINOM[k][n] == C(n, k); rows are sorted so unrank can bisect them. Rows go up to the
+# largest System entry: Python ints rank those too, they just don't fit TicketRanks
+_BINOM = [[comb(n, k) for n in range(MAX_NUMBER + 1)] for k in range(Config.MAX_SYSTEM_SIZE + 1)]
+
+FILE_MAGIC = b'TOTO'
+FILE_HEADER = struct.Struct('<4sBcBxQ')  # magic, version, typecode, numbers_per_set, count
+FILE_VERSION = 1
+
+
+def to_bitmask(numbers):
+    """Encode Toto numbers as a bitmask (bit n-1 is set for number n)"""
+    mask = 0
+    for number in numbers:
+        mask |= 1 << (number - 1)
+    return mask
+
+
+def from_bitmask(mask):
+    """Decode a bitmask back into a sorted list of numbers"""
+    numbers = []
+    while mask:
+        lowest = mask & -mask
+        numbers.append(lowest.bit_length())
+        mask ^= lowest
+    return numbers
+
+
+def rank(numbers):
+    """Combinatorial-number-system (colex) rank of a set, in range(C(49, len(numbers)))"""
+    value = 0
+    for i, number in enumerate(sorted(numbers), start=1):
+        value += _BINOM[i][number - 1]
+    return value
+
+
+def unrank(value, numbers_per_set=Config.NUMBERS_PER_SET):
+    """Inverse of rank: return the sorted numbers for a colex rank"""
+    numbers = [0] * numbers_per_set
+    for i in range(numbers_per_set, 0, -1):
+        row = _BINOM[i]
+        c = bisect_right(row, value) - 1
+        numbers[i - 1] = c + 1
+        value -= row[c]
+    return numbers
+
+
+def bitmask_to_rank(mask):
+    """Colex rank of a bitmask-encoded set"""
+    value = 0
+    i = 0
+    while mask:
+        lowest = mask & -mask
+        i += 1
+        value += _BINOM[i][lowest.bit_length() - 1]
+        mask ^= lowest
+    return value
+
+
+def rank_to_bitmask(value, numbers_per_set=Config.NUMBERS_PER_SET):
+    """Bitmask of the set with the given colex rank"""
+    mask = 0
+    for i in range(numbers_per_set, 0, -1):
+        row = _BINOM[i]
+        c = bisect_right(row, value) - 1
+        mask |= 1 << c
+        value -= row[c]
+    return mask
+
+
+def rank_many(sets):
+    """Rank an iterable of number lists into an array('I')"""
+    return array('I', map(rank, sets))
+
+
+def unrank_many(ranks, numbers_per_set=Config.NUMBERS_PER_SET):
+    """Unrank an iterable of ranks into a list of number lists"""
+    return [unrank(value, numbers_per_set) for value in ranks]
+
+
+def masks_to_ranks(masks):
+    """Convert an iterable of bitmasks into an array('I') of ranks"""
+    return array('I', map(bitmask_to_rank, masks))
+
+
+def ranks_to_masks(ranks, numbers_per_set=Config.NUMBERS_PER_SET):
+    """Convert an iterable of ranks into an array('Q') of bitmasks"""
+    return array('Q', [rank_to_bitmask(value, numbers_per_set) for value in ranks])
+
+
+def format_numbers(numbers):
+    """Format a set the same way generate_multiple_sets does"""
+    return " - ".join(map(str, numbers))
+
+
+class _TicketArray(ABC):
+    """Array-backed collection of Toto sets of a fixed size.
+    Sets are only decoded and formatted when they are actually shown."""
+
+    typecode = None
+
+    def __init__(self, numbers_per_set=Config.NUMBERS_PER_SET, values=None):
+        self.numbers_per_set = numbers_per_set
+        if isinstance(values, array) and values.typecode == self.typecode:
+            self.values = values
+        else:
+            self.values = array(self.typecode, values or ())
+
+    @abstractmethod
+    def _encode(self, numbers):
+        """Array value of a list of numbers"""
+
+    @abstractmethod
+    def _decode(self, value):
+        """Sorted numbers of an array value"""
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return type(self)(self.numbers_per_set, self.values[index])
+        return self._decode(self.values[index])
+
+    def __iter__(self):
+        for value in self.values:
+            yield self._decode(value)
+
+    def append(self, numbers):
+        self.values.append(self._encode(numbers))
+
+    def extend(self, values):
+        self.values.extend(values)
+
+    @property
+    def nbytes(self):
+        return len(self.values) * self.values.itemsize
+
+    def formatted(self, index):
+        """Formatted string for a single set"""
+        return format_numbers(self._decode(self.values[index]))
+
+    def iter_formatted(self):
+        """Yield the formatted string of every set"""
+        for value in self.values:
+            yield format_numbers(self._decode(value))
+
+    def iter_sets(self, start=0, stop=None):
+        """Yield set dicts in the generate_multiple_sets layout, built on demand"""
+        stop = len(self.values) if stop is None else min(stop, len(self.values))
+        for i in range(start, stop):
+            numbers = self._decode(self.values[i])
+            yield {
+                "set": i + 1,
+                "numbers": numbers,
+                "formatted": format_numbers(numbers)
+            }
+
+    def tofile(self, f):
+        """Write the collection to a binary file object (fixed header + raw little-endian values)"""
+        f.write(FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION, self.typecode.encode(),
+                                 self.numbers_per_set, len(self.values)))
+        values = self.values
+        if sys.byteorder == 'big':
+            values = array(self.typecode, values)
+            values.byteswap()
+        values.tofile(f)
+
+
+class TicketMasks(_TicketArray):
+    """Toto sets stored as uint64 bitmasks (8 bytes per set, any set size)"""
+
+    typecode = 'Q'
+
+    @property
+    def masks(self):
+        return self.values
+
+    def _encode(self, numbers):
+        return to_bitmask(numbers)
+
+    def _decode(self, value):
+        return from_bitmask(value)
+
+    def to_ranks(self):
+        return TicketRanks(self.numbers_per_set, masks_to_ranks(self.values))
+
+
+class TicketRanks(_TicketArray):
+    """Toto sets stored as uint32 colex ranks (4 bytes per set, up to 9 numbers per set)"""
+
+    typecode = 'I'
+
+    def __init__(self, numbers_per_set=Config.NUMBERS_PER_SET, values=None):
+        if numbers_per_set > MAX_RANKED_NUMBERS:
+            raise ValueError(f"Ranks only fit a uint32 for up to {MAX_RANKED_NUMBERS} numbers per set")
+        super().__init__(numbers_per_set, values)
+
+    @property
+    def ranks(self):
+        return self.values
+
+    def _encode(self, numbers):
+        return rank(numbers)
+
+    def _decode(self, value):
+        return unrank(value, self.numbers_per_set)
+
+    def to_masks(self):
+        return TicketMasks(self.numbers_per_set, ranks_to_masks(self.values, self.numbers_per_set))
+
+
+def read_tickets(f):
+    """Read a TicketMasks/TicketRanks collection written by tofile"""
+    magic, version, typecode, numbers_per_set, count = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+    if magic != FILE_MAGIC or version != FILE_VERSION:
+        raise ValueError("Not a Toto ticket file")
+    cls = TicketMasks if typecode == b'Q' else TicketRanks
+    values = array(cls.typecode)
+    values.fromfile(f, count)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return cls(numbers_per_set, values)
@@ -0,0 +1,206 @@
+# toto_simulator.py
+import argparse
+import hashlib
+import random
+import sys
+import time
+from array import array
+from multiprocessing import Pool
+from config import Config
+from prize_checker import _BIT_TABLES, system_prize_lines
+from toto_sets import to_bitmask
+from toto_system import system_lines
+from wheel_designer import WheelDesigner
+
+STRATEGIES = ('random', 'system', 'wheel')
+CODES = 14  # match code = 2 * matched + additional_matched, 0..13
+_WIN_TABLE = bytes(1 if code >= 6 else 0 for code in range(256))  # at least 3 matched
+
+
+def chunk_seed(seed, chunk):
+    """Seed of one chunk's RNG stream: depends only on (seed, chunk), never on the worker"""
+    return int.from_bytes(hashlib.sha256(f"{seed}:{chunk}".encode()).digest(), 'big')
+
+
+def build_strategy(strategy, seed=0, tickets=1, numbers_per_set=Config.NUMBERS_PER_SET, pool=None, t=3):
+    """Ticket bitmasks a strategy plays in every simulated draw"""
+    rng = random.Random(chunk_seed(seed, 'strategy'))
+    min_num, max_num = Config.NUMBER_RANGE
+    numbers = range(min_num, max_num + 1)
+    if strategy == 'random':
+        return [to_bitmask(rng.sample(numbers, Config.NUMBERS_PER_SET)) for _ in range(tickets)]
+    if strategy == 'system':
+        return [to_bitmask(rng.sample(numbers, numbers_per_set)) for _ in range(tickets)]
+    if strategy == 'wheel':
+        result = WheelDesigner(pool, tickets, t, seed=chunk_seed(seed, 'wheel')).design()
+        return [to_bitmask(ticket) for ticket in result['tickets']]
+    raise ValueError(f"Unknown strategy: {strategy}")
+
+
+def _draw_columns(masks, count):
+    """Byte-lane columns (one big int per number, a byte per draw) of an array('Q') of draws"""
+    if sys.byteorder == 'big':
+        masks = array('Q', masks)
+        masks.byteswap()
+    data = masks.tobytes()
+    columns = [0]
+    for bit in range(Config.NUMBER_RANGE[1]):
+        lane = data[bit >> 3::8].translate(_BIT_TABLES[bit & 7])
+        columns.append(int.from_bytes(lane, 'little'))
+    return columns
+
+
+def simulate_chunk(args):
+    """Simulate one chunk of draws. Returns (draws, {ticket_size: code histogram}, winning_draws)"""
+    tickets, seed, chunk, draws = args
+    getrandbits = random.Random(chunk_seed(seed, chunk)).getrandbits
+    picks = Config.NUMBERS_PER_SET
+    max_num = Config.NUMBER_RANGE[1]
+    bits = max_num.bit_length()
+
+    winning = array('Q', bytes(8 * draws))
+    additional = array('Q', bytes(8 * draws))
+    for i in range(draws):
+        mask = 0
+        picked = 0
+        while picked < picks:
+            position = getrandbits(bits)
+            if position < max_num and not mask >> position & 1:
+                mask |= 1 << position
+                picked += 1
+        while True:
+            position = getrandbits(bits)
+            if position < max_num and not mask >> position & 1:
+                break
+        winning[i] = mask
+        additional[i] = 1 << position
+
+    winning_columns = _draw_columns(winning, draws)
+    additional_columns = _draw_columns(additional, draws)
+
+    histograms = {}
+    any_win = 0
+    for ticket in tickets:
+        numbers = []
+        bits = ticket
+        while bits:
+            lowest = bits & -bits
+            numbers.append(lowest.bit_length())
+            bits ^= lowest
+        total = 0
+        extra = 0
+        for number in numbers:
+            total += winning_columns[number]
+            extra += additional_columns[number]
+        codes = ((total << 1) + extra).to_bytes(draws, 'little')
+        histogram = histograms.setdefault(len(numbers), [0] * CODES)
+        for code in range(CODES):
+            histogram[code] += codes.count(code)
+        any_win |= int.from_bytes(codes.translate(_WIN_TABLE), 'little')
+
+    winning_draws = draws - any_win.to_bytes(draws, 'little').count(0)
+    return draws, histograms, winning_draws
+
+
+class Simulator:
+    """Monte Carlo simulation of a strategy against random draws, sharded over a process pool.
+    The draws are split into fixed-size chunks, each with its own RNG stream seeded from
+    (seed, chunk index), and the per-chunk histograms are summed, so the result is the same
+    for any number of workers."""
+
+    def __init__(self, tickets, seed=0, workers=Config.SIM_WORKERS, chunk_size=Config.SIM_CHUNK_SIZE):
+        self.tickets = list(tickets)
+        self.seed = seed
+        self.workers = workers
+        self.chunk_size = chunk_size
+
+    def run(self, draws, progress=True):
+        chunks = [
+            (self.tickets, self.seed, chunk, min(self.chunk_size, draws - chunk * self.chunk_size))
+            for chunk in range((draws + self.chunk_size - 1) // self.chunk_size)
+        ]
+        histograms = {}
+        winning_draws = 0
+        done = 0
+        start = time.monotonic()
+        last_report = start
+
+        def merge(result):
+            nonlocal done, winning_draws, last_report
+            chunk_draws, chunk_histograms, chunk_winning = result
+            done += chunk_draws
+            winning_draws += chunk_winning
+            for size, histogram in chunk_histograms.items():
+                merged = histograms.setdefault(size, [0] * CODES)
+                for code, count in enumerate(histogram):
+                    merged[code] += count
+            now = time.monotonic()
+            if progress and (now - last_report >= Config.SIM_PROGRESS_INTERVAL or done == draws):
+                last_report = now
+                rate = done / max(now - start, 1e-9)
+                print(f"Simulated {done:,}/{draws:,} draws ({done / draws:.0%}), {rate:,.0f} draws/s")
+
+        if self.workers > 1:
+            with Pool(self.workers) as pool:
+                for result in pool.imap_unordered(simulate_chunk, chunks):
+                    merge(result)
+        else:
+            for chunk in chunks:
+                merge(simulate_chunk(chunk))
+
+        return self._summarise(draws, histograms, winning_draws, time.monotonic() - start)
+
+    def _summarise(self, draws, histograms, winning_draws, seconds):
+        group_lines = {group: 0 for group in range(1, 8)}
+        for size, histogram in histograms.items():
+            for code, count in enumerate(histogram):
+                if not count:
+                    continue
+                for group, lines in system_prize_lines(size, code >> 1, code & 1).items():
+                    group_lines[group] += lines * count
+
+        lines_per_draw = sum(system_lines(mask.bit_count()) for mask in self.tickets)
+        cost = draws * lines_per_draw * Config.TICKET_PRICE
+        winnings = sum(Config.PRIZE_AMOUNTS[group] * lines for group, lines in group_lines.items())
+        return {
+            'draws': draws,
+            'tickets': len(self.tickets),
+            'lines_per_draw': lines_per_draw,
+            'group_lines': group_lines,
+            'group_rates': {group: lines / draws for group, lines in group_lines.items()},
+            'winning_draw_rate': winning_draws / draws if draws else 0.0,
+            'cost': cost,
+            'winnings': winnings,
+            'expected_return': winnings / cost if cost else 0.0,
+            'seconds': seconds,
+            'draws_per_second': draws / seconds if seconds else 0.0,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Monte Carlo simulation of a TOTO strategy")
+    parser.add_argument("--strategy", choices=STRATEGIES, default='random')
+    parser.add_argument("--tickets", type=int, default=1, help="Tickets (or System entries) per draw")
+    parser.add_argument("--system-size", type=int, default=7, help="Numbers per System entry")
+    parser.add_argument("--pool", help="Comma-separated pool for the wheel strategy")
+    parser.add_argument("--t", type=int, default=3, help="Wheel subset size")
+    parser.add_argument("--draws", type=int, default=1000000)
+    parser.add_argument("--workers", type=int, default=Config.SIM_WORKERS)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    pool = [int(n) for n in args.pool.split(',')] if args.pool else None
+    tickets = build_strategy(args.strategy, args.seed, args.tickets, args.system_size, pool, args.t)
+    result = Simulator(tickets, seed=args.seed, workers=args.workers).run(args.draws)
+
+    print(f"\nStrategy: {args.strategy}, {result['tickets']} ticket(s), {result['lines_per_draw']} line(s) per draw")
+    for group, lines in result['group_lines'].items():
+        print(f"Group {group}: {lines:,} lines ({result['group_rates'][group]:.3e} per draw)")
+    print(f"Draws with any prize: {result['winning_draw_rate']:.4%}")
+    print(f"Cost: ${result['cost']:,}  Winnings: ${result['winnings']:,}  "
+          f"Expected return: {result['expected_return']:.2%}")
+    print(f"{result['draws']:,} draws in {result['seconds']:.1f}s ({result['draws_per_second']:,.0f} draws/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+# toto_stats.py
+import heapq
+import json
+import os
+import threading
+from collections import deque
+from itertools import combinations
+from math import comb
+from config import Config
+from toto_sets import from_bitmask, to_bitmask
+
+MAX_NUMBER = Config.NUMBER_RANGE[1]
+LOW_MAX = MAX_NUMBER // 2  # 1-24 count as low, 25-49 as high
+SNAPSHOT_VERSION = 1
+
+
+def pair_index(a, b):
+    """Position of the pair a < b in a flat array of all C(49, 2) pairs"""
+    return comb(b - 1, 2) + (a - 1)
+
+
+def triple_index(a, b, c):
+    """Position of the triple a < b < c in a flat array of all C(49, 3) triples"""
+    return comb(c - 1, 3) + comb(b - 1, 2) + (a - 1)
+
+
+def _pair_from_index(index):
+    b = 2
+    while comb(b, 2) <= index:
+        b += 1
+    return index - comb(b - 1, 2) + 1, b
+
+
+def _triple_from_index(index):
+    c = 3
+    while comb(c, 3) <= index:
+        c += 1
+    a, b = _pair_from_index(index - comb(c - 1, 3))
+    return a, b, c
+
+
+class DrawStatistics:
+    """Number frequency and pattern statistics over the draw history, kept as running
+    aggregates: add_draw updates everything in constant time, so nothing is recomputed
+    over the full history and queries only read the aggregates."""
+
+    def __init__(self, windows=Config.STATS_WINDOWS):
+        self.windows = tuple(sorted(windows))
+        self.draw_count = 0
+        self.last_draw_date = None
+        self.frequency = [0] * (MAX_NUMBER + 1)
+        self.additional_frequency = [0] * (MAX_NUMBER + 1)
+        self.last_seen = [None] * (MAX_NUMBER + 1)
+        self.pair_counts = [0] * comb(MAX_NUMBER, 2)
+        self.triple_counts = [0] * comb(MAX_NUMBER, 3)
+        self.sum_histogram = {}
+        self.odd_histogram = [0] * 7
+        self.low_histogram = [0] * 7
+        self.recent_masks = deque(maxlen=max(self.windows) if self.windows else 0)
+        self.window_frequency = {size: [0] * (MAX_NUMBER + 1) for size in self.windows}
+
+    def add_draw(self, draw_date, numbers, additional_number=None):
+        """Fold one draw into every aggregate"""
+        numbers = sorted(numbers)
+        index = self.draw_count
+        self.draw_count += 1
+        self.last_draw_date = str(draw_date)[:10]
+
+        for number in numbers:
+            self.frequency[number] += 1
+            self.last_seen[number] = index
+        if additional_number:
+            self.additional_frequency[additional_number] += 1
+
+        for a, b in combinations(numbers, 2):
+            self.pair_counts[pair_index(a, b)] += 1
+        for a, b, c in combinations(numbers, 3):
+            self.triple_counts[triple_index(a, b, c)] += 1
+
+        total = sum(numbers)
+        self.sum_histogram[total] = self.sum_histogram.get(total, 0) + 1
+        self.odd_histogram[sum(number & 1 for number in numbers)] += 1
+        self.low_histogram[sum(number <= LOW_MAX for number in numbers)] += 1
+
+        # Rolling windows: add the new draw, drop the one that falls out of each window
+        for size in self.windows:
+            counts = self.window_frequency[size]
+            for number in numbers:
+                counts[number] += 1
+            if len(self.recent_masks) >= size:
+                for number in from_bitmask(self.recent_masks[-size]):
+                    counts[number] -= 1
+        self.recent_masks.append(to_bitmask(numbers))
+
+    def gaps(self):
+        """Draws since each number was last drawn (None if never drawn), keyed by number"""
+        return {
+            number: None if self.last_seen[number] is None else self.draw_count - 1 - self.last_seen[number]
+            for number in range(1, MAX_NUMBER + 1)
+        }
+
+    def hot_numbers(self, count=6, window=None):
+        """Most frequent numbers as (number, hits), over all draws or one of the rolling windows"""
+        counts = self.frequency if window is None else self.window_frequency[window]
+        return heapq.nlargest(count, ((number, counts[number]) for number in range(1, MAX_NUMBER + 1)),
+                              key=lambda item: item[1])
+
+    def cold_numbers(self, count=6, window=None):
+        """Least frequent numbers as (number, hits)"""
+        counts = self.frequency if window is None else self.window_frequency[window]
+        return heapq.nsmallest(count, ((number, counts[number]) for number in range(1, MAX_NUMBER + 1)),
+                               key=lambda item: item[1])
+
+    def overdue_numbers(self, count=6):
+        """Numbers with the longest gap since they were last drawn, as (number, gap)"""
+        gaps = [(number, self.draw_count if gap is None else gap) for number, gap in self.gaps().items()]
+        return heapq.nlargest(count, gaps, key=lambda item: item[1])
+
+    def top_pairs(self, count=5):
+        """Most frequent pairs as ((a, b), hits)"""
+        best = heapq.nlargest(count, range(len(self.pair_counts)), key=self.pair_counts.__getitem__)
+        return [(_pair_from_index(index), self.pair_counts[index]) for index in best]
+
+    def top_triples(self, count=5):
+        """Most frequent triples as ((a, b, c), hits)"""
+        best = heapq.nlargest(count, range(len(self.triple_counts)), key=self.triple_counts.__getitem__)
+        return [(_triple_from_index(index), self.triple_counts[index]) for index in best]
+
+    def pair_count(self, a, b):
+        a, b = sorted((a, b))
+        return self.pair_counts[pair_index(a, b)]
+
+    def summary(self, window=None):
+        """Plain dict of the headline statistics, for the API and the Telegram command"""
+        return {
+            'draws': self.draw_count,
+            'last_draw_date': self.last_draw_date,
+            'window': window,
+            'hot': self.hot_numbers(window=window),
+            'cold': self.cold_numbers(window=window),
+            'overdue': self.overdue_numbers(),
+            'top_pairs': self.top_pairs(),
+            'top_triples': self.top_triples(3),
+            'sum_histogram': dict(sorted(self.sum_histogram.items())),
+            'odd_histogram': list(self.odd_histogram),
+            'low_histogram': list(self.low_histogram),
+        }
+
+    def to_dict(self):
+        return {
+            'version': SNAPSHOT_VERSION,
+            'windows': list(self.windows),
+            'draw_count': self.draw_count,
+            'last_draw_date': self.last_draw_date,
+            'frequency': self.frequency,
+            'additional_frequency': self.additional_frequency,
+            'last_seen': self.last_seen,
+            'pair_counts': self.pair_counts,
+            'triple_counts': self.triple_counts,
+            'sum_histogram': self.sum_histogram,
+            'odd_histogram': self.odd_histogram,
+            'low_histogram': self.low_histogram,
+            'recent_masks': list(self.recent_masks),
+            'window_frequency': {str(size): counts for size, counts in self.window_frequency.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls(data['windows'])
+        stats.draw_count = data['draw_count']
+        stats.last_draw_date = data['last_draw_date']
+        stats.frequency = data['frequency']
+        stats.additional_frequency = data['additional_frequency']
+        stats.last_seen = data['last_seen']
+        stats.pair_counts = data['pair_counts']
+        stats.triple_counts = data['triple_counts']
+        stats.sum_histogram = {int(total): count for total, count in data['sum_histogram'].items()}
+        stats.odd_histogram = data['odd_histogram']
+        stats.low_histogram = data['low_histogram']
+        stats.recent_masks.extend(data['recent_masks'])
+        stats.window_frequency = {int(size): counts for size, counts in data['window_frequency'].items()}
+        return stats
+
+    def save(self, path=Config.STATS_SNAPSHOT_FILE):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Refreshes can run concurrently (webhook /stats, scraper), so each writes its own temp file
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(self.to_dict(), f)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path=Config.STATS_SNAPSHOT_FILE):
+        """Load a saved snapshot, or return empty statistics if there is none"""
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            if data.get('version') == SNAPSHOT_VERSION and tuple(data['windows']) == tuple(sorted(Config.STATS_WINDOWS)):
+                return cls.from_dict(data)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Warning: Could not load statistics snapshot: {e}")
+        return cls()
+
+    @classmethod
+    def from_store(cls, store, path=Config.STATS_SNAPSHOT_FILE):
+        """Snapshot from disk plus any draws the store has gained since; the snapshot is
+        saved again when it changed. Rebuilt from scratch if older draws were backfilled"""
+        stats = cls.load(path) if os.path.exists(path) else cls()
+        new_draws = [
+            draw for draw in store.draws_between(start=stats.last_draw_date)
+            if stats.last_draw_date is None or draw['draw_date'] > stats.last_draw_date
+        ]
+        if stats.draw_count + len(new_draws) != store.count_draws():
+            stats = cls()
+            new_draws = store.draws_between()
+        for draw in new_draws:
+            stats.add_draw(draw['draw_date'], draw['numbers'], draw['additional'])
+        if new_draws:
+            stats.save(path)
+        return stats
+
+    @classmethod
+    def from_history(cls, history):
+        """Statistics rebuilt from the draws of a ColumnarHistory export"""
+        stats = cls()
+        for draw_date, numbers, additional in history.iter_draws():
+            stats.add_draw(draw_date, numbers, additional)
+        return stats
+
+
+def format_stats_message(stats, window=None):
+    """Markdown Telegram message with the headline statistics"""
+    if not stats.draw_count:
+        return "📊 No draw history yet."
+
+    def numbers_with_counts(items):
+        return ", ".join(f"{number} ({hits})" for number, hits in items)
+
+    scope = f"last {window} draws" if window else f"{stats.draw_count} draws"
+    summary = stats.summary(window)
+    message = f"📊 *TOTO Statistics* ({scope}, up to {stats.last_draw_date})\n\n"
+    message += f"🔥 Hot: {numbers_with_counts(summary['hot'])}\n"
+    message += f"🧊 Cold: {numbers_with_counts(summary['cold'])}\n"
+    message += f"⏳ Overdue: {numbers_with_counts(summary['overdue'])}\n"
+    message += "👯 Top pairs: " + ", ".join(f"{a}-{b} ({hits})" for (a, b), hits in summary['top_pairs']) + "\n"
+    message += "🎯 Top triples: " + ", ".join(
+        f"{a}-{b}-{c} ({hits})" for (a, b, c), hits in summary['top_triples']) + "\n"
+
+    odd_split = max(range(7), key=lambda odd: summary['odd_histogram'][odd])
+    low_split = max(range(7), key=lambda low: summary['low_histogram'][low])
+    common_sum = max(summary['sum_histogram'], key=summary['sum_histogram'].get)
+    message += f"⚖️ Most common odd/even: {odd_split}/{6 - odd_split}, low/high: {low_split}/{6 - low_split}\n"
+    message += f"➕ Most common sum: {common_sum}"
+    return message
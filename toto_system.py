@@ -0,0 +1,53 @@
+# toto_system.py
+from itertools import combinations
+from math import comb
+from config import Config
+
+SYSTEM_SIZES = range(Config.NUMBERS_PER_SET, Config.MAX_SYSTEM_SIZE + 1)
+WINNING_NUMBERS = 6
+
+
+def system_lines(numbers_per_set):
+    """Number of 6-number lines a System entry stands for (System 12 is 924 lines)"""
+    return comb(numbers_per_set, Config.NUMBERS_PER_SET)
+
+
+def system_cost(numbers_per_set, price=Config.TICKET_PRICE):
+    """Cost of one System entry"""
+    return system_lines(numbers_per_set) * price
+
+
+def system_name(numbers_per_set):
+    return "Standard" if numbers_per_set == Config.NUMBERS_PER_SET else f"System {numbers_per_set}"
+
+
+def system_match_lines(numbers_per_set, matched, additional_matched):
+    """How many lines of a System entry hit j winning numbers (and b = 0/1 additional number),
+    given that the entry contains `matched` winning numbers and maybe the additional number.
+    Returns {(j, b): lines} from the closed form C(matched, j) * C(a, b) * C(others, 6 - j - b)
+    without expanding the entry."""
+    a = 1 if additional_matched else 0
+    others = numbers_per_set - matched - a
+    lines = {}
+    for j in range(min(matched, Config.NUMBERS_PER_SET) + 1):
+        for b in range(min(a, Config.NUMBERS_PER_SET - j) + 1):
+            count = comb(matched, j) * comb(a, b) * comb(others, Config.NUMBERS_PER_SET - j - b)
+            if count:
+                lines[(j, b)] = count
+    return lines
+
+
+def match_probability(numbers_per_set, matched, additional_matched):
+    """Probability that an entry of numbers_per_set numbers contains exactly `matched` winning
+    numbers and (or not) the additional number"""
+    min_num, max_num = Config.NUMBER_RANGE
+    total = max_num - min_num + 1
+    a = 1 if additional_matched else 0
+    others = total - WINNING_NUMBERS - 1
+    return (comb(WINNING_NUMBERS, matched) * comb(others, numbers_per_set - matched - a)
+            / comb(total, numbers_per_set))
+
+
+def iter_system_lines(numbers):
+    """Lazily expand a System entry into its explicit 6-number lines"""
+    return (list(line) for line in combinations(sorted(numbers), Config.NUMBERS_PER_SET))
@@ -0,0 +1,158 @@
+# unique_registry.py
+import mmap
+import os
+import random
+import struct
+import threading
+from contextlib import contextmanager
+from config import Config
+from toto_sets import COMBINATIONS, rank, unrank
+
+try:
+    # Cross-process locking (Linux/macOS); on other platforms only threads are serialised
+    import fcntl
+except ImportError:
+    fcntl = None
+
+HEADER = struct.Struct('<4sIQ')  # magic, version, number of combinations used
+MAGIC = b'TOTU'
+VERSION = 1
+BITMAP_BYTES = (COMBINATIONS + 7) // 8
+BLOCK_BYTES = 4096
+# Number of zero bits in each byte value
+_FREE_BITS = bytes(8 - bin(value).count('1') for value in range(256))
+
+
+class CombinationRegistry:
+    """Never-repeat registry: a memory-mapped bitmap with one bit per 6-of-49 combination
+    (about 1.7 MB), indexed by colex rank. Membership checks and inserts are O(1).
+    Claims take an exclusive file lock, so the listener and the scheduled run can share it."""
+
+    def __init__(self, path=Config.UNIQUE_BITMAP_FILE):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.thread_lock = threading.Lock()
+        self.file = open(path, 'a+b')
+        with self._locked():
+            self.file.seek(0, os.SEEK_END)
+            if self.file.tell() == 0:
+                self.file.write(HEADER.pack(MAGIC, VERSION, 0))
+                self.file.truncate(HEADER.size + BITMAP_BYTES)
+                self.file.flush()
+        self.map = mmap.mmap(self.file.fileno(), HEADER.size + BITMAP_BYTES)
+        magic, version, _ = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a combination registry")
+
+    def close(self):
+        self.map.flush()
+        self.map.close()
+        self.file.close()
+
+    @property
+    def used(self):
+        return HEADER.unpack_from(self.map, 0)[2]
+
+    @property
+    def free(self):
+        return COMBINATIONS - self.used
+
+    def __contains__(self, value):
+        """value is a colex rank or a list of 6 numbers"""
+        if not isinstance(value, int):
+            value = rank(value)
+        return bool(self.map[HEADER.size + (value >> 3)] >> (value & 7) & 1)
+
+    def add(self, value):
+        """Mark a combination as used. Returns False if it already was"""
+        if not isinstance(value, int):
+            value = rank(value)
+        with self._locked():
+            return self._set(value)
+
+    def claim(self, count, rng=random):
+        """Claim `count` combinations nobody has had before, uniformly among the free ones.
+        Returns their ranks"""
+        with self._locked():
+            if count > self.free:
+                raise ValueError("Not enough unused combinations left")
+            claimed = []
+            for _ in range(count):
+                if self.used / COMBINATIONS < Config.UNIQUE_REJECTION_MAX_FILL:
+                    # Mostly empty: a few random probes find a free combination
+                    while True:
+                        value = rng.randrange(COMBINATIONS)
+                        if self._set(value):
+                            break
+                else:
+                    value = self._select_free(rng.randrange(self.free))
+                    self._set(value)
+                claimed.append(value)
+            return claimed
+
+    def claim_sets(self, count, rng=random):
+        """Claim `count` unused combinations and return them as sorted number lists"""
+        return [unrank(value) for value in self.claim(count, rng)]
+
+    def _set(self, value):
+        offset = HEADER.size + (value >> 3)
+        bit = 1 << (value & 7)
+        byte = self.map[offset]
+        if byte & bit:
+            return False
+        self.map[offset] = byte | bit
+        HEADER.pack_into(self.map, 0, MAGIC, VERSION, self.used + 1)
+        return True
+
+    def _select_free(self, k):
+        """Rank of the k-th (0-based) free combination, found block by block"""
+        position = HEADER.size
+        end = HEADER.size + BITMAP_BYTES
+        while position < end:
+            block = self.map[position:min(position + BLOCK_BYTES, end)]
+            free_in_block = 8 * len(block) - int.from_bytes(block, 'little').bit_count()
+            if k < free_in_block:
+                break
+            k -= free_in_block
+            position += len(block)
+        for byte in block:
+            free_in_byte = _FREE_BITS[byte]
+            if k < free_in_byte:
+                for bit in range(8):
+                    if not byte >> bit & 1:
+                        if k == 0:
+                            value = (position - HEADER.size) * 8 + bit
+                            if value >= COMBINATIONS:
+                                raise ValueError("No free combination at this index")
+                            return value
+                        k -= 1
+            k -= free_in_byte
+            position += 1
+        raise ValueError("No free combination at this index")
+
+    @contextmanager
+    def _locked(self):
+        with self.thread_lock:
+            if fcntl:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Shared CombinationRegistry for the process"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = CombinationRegistry()
+        return _registry
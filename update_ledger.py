@@ -0,0 +1,144 @@
+# update_ledger.py
+import os
+import sqlite3
+import threading
+import time
+from config import Config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS processed_updates (
+    chat_id TEXT NOT NULL,
+    message_id INTEGER NOT NULL,
+    update_id INTEGER,
+    status TEXT NOT NULL,
+    claimed_at INTEGER NOT NULL,
+    finished_at INTEGER,
+    PRIMARY KEY (chat_id, message_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_processed_updates_claimed ON processed_updates (claimed_at);
+
+CREATE TABLE IF NOT EXISTS ledger_state (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+class UpdateLedger:
+    """Durable record of the Telegram updates this bot has handled, kept in the SQLite store.
+
+    - The getUpdates offset is saved here, so every run acknowledges what it has handled and
+      nothing is fetched twice.
+    - Each message is claimed by its (chat_id, message_id) before anything is generated,
+      saved or sent. Overlapping runs, webhook redeliveries and refetched updates are then
+      skipped rather than answered again.
+    - A claim whose handler died is released after LEDGER_CLAIM_TIMEOUT.
+    - Entries older than LEDGER_RETENTION_HOURS are compacted away. Telegram stops
+      redelivering updates after 24 hours."""
+
+    def __init__(self, path=Config.STORE_FILE):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=Config.STORE_BUSY_TIMEOUT, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.next_compact_check = 0
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def get_offset(self):
+        """Next update_id to ask getUpdates for (0 if nothing was acknowledged yet)"""
+        return self._get_state('offset', 0)
+
+    def ack(self, offset):
+        """Record that every update below `offset` has been handled; the offset never moves back"""
+        self._set_state('offset', offset, keep_max=True)
+
+    def claim(self, chat_id, message_id, update_id=None):
+        """Claim a message for processing. Returns False if it was already handled, or is being
+        handled by another worker or run"""
+        now = int(time.time())
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO processed_updates (chat_id, message_id, update_id, status, claimed_at) "
+                "VALUES (?, ?, ?, 'processing', ?) "
+                "ON CONFLICT (chat_id, message_id) DO UPDATE SET "
+                "update_id = excluded.update_id, claimed_at = excluded.claimed_at "
+                "WHERE status = 'processing' AND claimed_at < ?",
+                (str(chat_id), message_id, update_id, now, now - Config.LEDGER_CLAIM_TIMEOUT)
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, chat_id, message_id, status='done'):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE processed_updates SET status = ?, finished_at = ? WHERE chat_id = ? AND message_id = ?",
+                (status, int(time.time()), str(chat_id), message_id)
+            )
+
+    def status(self, chat_id, message_id):
+        """'processing', 'done', 'failed' or None if the message was never claimed"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT status FROM processed_updates WHERE chat_id = ? AND message_id = ?",
+                (str(chat_id), message_id)
+            ).fetchone()
+        return row[0] if row else None
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM processed_updates").fetchone()[0]
+
+    def compact(self, retention_hours=Config.LEDGER_RETENTION_HOURS):
+        """Delete entries claimed more than retention_hours ago. Returns the number deleted"""
+        now = int(time.time())
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "DELETE FROM processed_updates WHERE claimed_at < ?", (now - retention_hours * 3600,)
+            )
+        self._set_state('compacted_at', now)
+        return cursor.rowcount
+
+    def maybe_compact(self):
+        """Compact at most once per LEDGER_COMPACT_INTERVAL (shared by all processes)"""
+        if time.monotonic() < self.next_compact_check:
+            return
+        self.next_compact_check = time.monotonic() + 60
+        if time.time() - self._get_state('compacted_at', 0) >= Config.LEDGER_COMPACT_INTERVAL:
+            deleted = self.compact()
+            if deleted:
+                print(f"Compacted {deleted} old entries from the update ledger")
+
+    def _get_state(self, key, default):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM ledger_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_state(self, key, value, keep_max=False):
+        update = "max(value, excluded.value)" if keep_max else "excluded.value"
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO ledger_state (key, value) VALUES (?, ?) "
+                f"ON CONFLICT (key) DO UPDATE SET value = {update}",
+                (key, value)
+            )
+
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+
+def get_update_ledger():
+    """Shared UpdateLedger for the process"""
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = UpdateLedger()
+        return _ledger
@@ -1,36 +1,33 @@
-import requests
-from bs4 import BeautifulSoup
-from datetime import datetime
+import sys
 from config import Config
-import pytz
-
-url = Config.url
-headers = Config.headers
-response = requests.get(url, headers=headers)
-sg_tz = pytz.timezone('Asia/Singapore')
-current_sg_date = datetime.now(sg_tz).strftime("%Y-%m-%d")
+from prize_checker import PrizeChecker, format_summary_message
+from ticket_store import get_ticket_store, to_draw_date
+from toto_stats import DrawStatistics
+from telegram_delivery import get_delivery
+from toto_scraper import DrawScraper
 
 class ResultBot:
-    def __init__(self):
+    def __init__(self, fixture_dir=Config.SCRAPER_FIXTURE_DIR):
         self.bot_token = Config.BOT_TOKEN
         self.chat_id = Config.CHAT_ID
         self.api_url = Config.get_telegram_api_url()
+        self.scraper = DrawScraper(fixture_dir=fixture_dir)
+        self.delivery = get_delivery()
 
-    def send_telegram_message(self, message):
-        """Send message to Telegram"""
-        payload = {
-                'chat_id': self.chat_id,
-                'text': message,
-                'parse_mode': 'HTML'  # Allows HTML formatting
-        }
-
-        try:
-            response = requests.post(f"{self.api_url}/sendMessage", json=payload)
-            response.raise_for_status()
+    def send_telegram_message(self, message, chat_id=None):
+        """Send message to Telegram (to the configured chat unless chat_id is given)"""
+        # HTML parse mode allows HTML formatting
+        if self.delivery.send(chat_id or self.chat_id, message, 'HTML'):
             return True
-        except requests.RequestException as e:
-            print(f"Error sending message to Telegram: {e}")
-            return False
+        print("Error sending message to Telegram")
+        return False
+
+    def broadcast_message(self, message):
+        """Send a message to every subscribed chat"""
+        chat_ids = Config.get_subscriber_chat_ids()
+        delivered = self.delivery.broadcast(chat_ids, message, 'HTML')
+        print(f"Delivered results to {delivered}/{len(chat_ids)} chat(s)")
+        return delivered
 
     def format_results_message(self, date, winning_numbers, additional_number):
         """Format the lottery results into a nice Telegram message"""
@@ -43,66 +40,86 @@ class ResultBot:
     Good luck! 🍀"""
         return message
 
-    def web_scraper_tool(self):
-        soup = BeautifulSoup(response.text, 'html.parser')
-
-        # Find all rows in the tbody
-        rows = soup.find('tbody').find_all('tr')
-
-        latest_date = None
-        latest_winning_numbers = None
-        latest_additional_number = None
-
-        for row in rows:
-            # Get all sum-p1 cells in this row
-            sum_p1_cells = row.find_all('td', class_='sum-p1')
-
-            if len(sum_p1_cells) >= 3:  # Ensure we have date, winning numbers, and additional number
-                date_str = sum_p1_cells[0].get_text(strip=True)
-                winning_numbers = sum_p1_cells[1].get_text(strip=True)
-                additional_number = sum_p1_cells[2].get_text(strip=True)
-
-                # Parse the date
-                current_date = datetime.strptime(date_str, '%Y-%m-%d')
-
-                # Check if this is the latest date
-                if latest_date is None or current_date > latest_date:
-                    latest_date = current_date
-                    latest_winning_numbers = winning_numbers
-                    latest_additional_number = additional_number
+    def web_scraper_tool(self, backfill=False):
+        try:
+            store = get_ticket_store()
+            known_latest = store.latest_draw_date()
+        except Exception as e:
+            print(f"Warning: Could not open local store: {e}")
+            store = None
+            known_latest = None
+
+        new_draws = self.scraper.scrape(known_latest, backfill=backfill)
+
+        if store and new_draws:
+            try:
+                stored = store.add_draws(new_draws)
+                print(f"Stored {stored} new draw(s) locally")
+                DrawStatistics.from_store(store)
+            except Exception as e:
+                print(f"Warning: Could not save draws to local store: {e}")
+
+        # Backfilled history can include draws we already announced
+        if known_latest:
+            new_draws = [draw for draw in new_draws if draw[0].strftime('%Y-%m-%d') > known_latest]
 
         # Output result
-        if latest_winning_numbers:
-        #if latest_winning_numbers  and current_sg_date == latest_date:
-            latest_winning_numbers = latest_winning_numbers.replace(",", ", ")
+        if new_draws:
+        #if new_draws and Config.current_date() == latest_date:
+            latest_date, winning_numbers_list, additional_number_int = new_draws[-1]
+            latest_winning_numbers = ", ".join(map(str, winning_numbers_list))
             print(f"Latest date: {latest_date.strftime('%Y-%m-%d')}")
             print(f"Winning numbers: {latest_winning_numbers}")
-            print(f"Additional number: {latest_additional_number}")
+            print(f"Additional number: {additional_number_int}")
 
             message = self.format_results_message(
                 latest_date,
                 latest_winning_numbers,
-                latest_additional_number
+                additional_number_int
             )
 
-            self.send_telegram_message(message)
-
-            # Convert winning numbers to a list of integers
-            winning_numbers_list = [int(num.strip()) for num in latest_winning_numbers.split(',')]
-            additional_number_int = int(latest_additional_number)
+            self.broadcast_message(message)
 
             print(f"Winning numbers as list: {winning_numbers_list}")
             print(f"Additional number as integer: {additional_number_int}")
 
+            if store:
+                # On a fresh store only the latest draw is checked, not the whole first page
+                checked_draws = new_draws if known_latest else new_draws[-1:]
+                for draw_date, winning_numbers, additional_number in checked_draws:
+                    self.send_prize_summaries(store, draw_date, winning_numbers, additional_number)
+
+        elif known_latest:
+            print(f"No new draws since {known_latest}")
         else:
             print("No data found")
 
-    def run(self):
+    def send_prize_summaries(self, store, draw_date, winning_numbers, additional_number):
+        """Check the stored tickets for a draw and send each user a summary of their hits.
+        draw_date may be a datetime (fresh scrape) or a 'YYYY-MM-DD' string (stored draw)"""
+        try:
+            previous_draw_date = store.previous_draw_date(draw_date)
+            summaries = PrizeChecker(store).check_draw(draw_date, winning_numbers, additional_number,
+                                                       previous_draw_date)
+        except Exception as e:
+            print(f"Error checking tickets for {to_draw_date(draw_date)}: {e}")
+            return
+
+        print(f"Checked tickets of {len(summaries)} user(s) for {to_draw_date(draw_date)}")
+        futures = []
+        for summary in summaries:
+            message = format_summary_message(summary, draw_date, winning_numbers, additional_number)
+            futures.append(self.delivery.submit(summary['chat_id'], message, 'HTML'))
+        delivered = sum(1 for future in futures if future.result())
+        print(f"Delivered {delivered}/{len(futures)} prize summaries")
+
+    def run(self, backfill=False):
         """Main method to run the bot"""
         print("🤖 Starting TOTO Results Bot...")
-        self.web_scraper_tool()
+        self.web_scraper_tool(backfill=backfill)
+        print(f"Delivery stats: {self.delivery.stats()}")
 
 # Usage
 if __name__ == "__main__":
     bot = ResultBot()
-    bot.run()
\ No newline at end of file
+    bot.run(backfill="--backfill" in sys.argv)
\ No newline at end of file
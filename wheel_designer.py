@@ -0,0 +1,209 @@
+# wheel_designer.py
+import argparse
+import random
+import time
+from itertools import combinations
+from math import comb
+from config import Config
+from toto_sets import format_numbers
+
+
+def _positions(ticket):
+    """Sorted pool positions of the bits set in a ticket bitset"""
+    positions = []
+    while ticket:
+        low = ticket & -ticket
+        positions.append(low.bit_length() - 1)
+        ticket ^= low
+    return positions
+
+
+class WheelDesigner:
+    """Designs syndicate wheels: given a pool of chosen numbers and a ticket budget, picks 6-number
+    tickets that cover as many t-number subsets (pairs, triples or quads) of the pool as possible.
+
+    Tickets are bitsets over pool positions and every t-subset of the pool has a colex-rank index
+    into a coverage count array, so the gain of adding, removing or swapping a number is read off
+    a handful of array lookups. A greedy construction is followed by swap-based local search."""
+
+    def __init__(self, pool, tickets, t=3, seed=None, time_limit=Config.WHEEL_TIME_LIMIT):
+        self.pool = sorted(set(pool))
+        if len(self.pool) < Config.NUMBERS_PER_SET:
+            raise ValueError(f"Pool needs at least {Config.NUMBERS_PER_SET} numbers")
+        if not 2 <= t <= Config.NUMBERS_PER_SET:
+            raise ValueError("t must be between 2 and 6")
+        self.tickets_budget = max(1, tickets)
+        self.t = t
+        self.rng = random.Random(seed)
+        self.time_limit = time_limit
+        self.size = len(self.pool)
+        self.total_subsets = comb(self.size, t)
+        self.coverage = [0] * self.total_subsets
+        self.uncovered_per_number = [comb(self.size - 1, t - 1)] * self.size
+        self.covered = 0
+        self.binom = [[comb(n, k) for n in range(self.size)] for k in range(t + 1)]
+
+    def subset_index(self, positions):
+        """Colex rank of a sorted tuple of pool positions"""
+        binom = self.binom
+        index = 0
+        for i, position in enumerate(positions, start=1):
+            index += binom[i][position]
+        return index
+
+    def _subsets_with(self, ticket, position):
+        """Indexes of the t-subsets of ticket (a bitset of pool positions) that contain position"""
+        for rest in combinations(_positions(ticket & ~(1 << position)), self.t - 1):
+            yield self.subset_index(sorted(rest + (position,)))
+
+    def _cover(self, index, positions, delta):
+        count = self.coverage[index]
+        self.coverage[index] = count + delta
+        if count == 0 and delta > 0:
+            self.covered += 1
+            for position in positions:
+                self.uncovered_per_number[position] -= 1
+        elif count + delta == 0 and delta < 0:
+            self.covered -= 1
+            for position in positions:
+                self.uncovered_per_number[position] += 1
+
+    def _apply(self, ticket, delta):
+        for subset in combinations(_positions(ticket), self.t):
+            self._cover(self.subset_index(subset), subset, delta)
+
+    def _build_ticket(self):
+        ticket = 0
+        for _ in range(Config.NUMBERS_PER_SET):
+            chosen = _positions(ticket)
+            best_score = None
+            best = []
+            for position in range(self.size):
+                if ticket >> position & 1:
+                    continue
+                gain = 0
+                for rest in combinations(chosen, self.t - 1):
+                    if not self.coverage[self.subset_index(sorted(rest + (position,)))]:
+                        gain += 1
+                # Break ties towards numbers that still have many uncovered subsets
+                score = (gain, self.uncovered_per_number[position])
+                if best_score is None or score > best_score:
+                    best_score = score
+                    best = [position]
+                elif score == best_score:
+                    best.append(position)
+            ticket |= 1 << self.rng.choice(best)
+        return ticket
+
+    def _swap_gain(self, ticket, old, new):
+        loss = sum(1 for index in self._subsets_with(ticket, old) if self.coverage[index] == 1)
+        swapped = ticket ^ (1 << old) ^ (1 << new)
+        gain = sum(1 for index in self._subsets_with(swapped, new) if not self.coverage[index])
+        return gain - loss
+
+    def _local_search(self, tickets, deadline):
+        improved = True
+        while improved and time.monotonic() < deadline:
+            improved = False
+            for i in self.rng.sample(range(len(tickets)), len(tickets)):
+                ticket = tickets[i]
+                best_gain = 0
+                best_swap = None
+                for old in _positions(ticket):
+                    for new in range(self.size):
+                        if ticket >> new & 1:
+                            continue
+                        gain = self._swap_gain(ticket, old, new)
+                        if gain > best_gain:
+                            best_gain = gain
+                            best_swap = (old, new)
+                if best_swap:
+                    old, new = best_swap
+                    self._apply(ticket, -1)
+                    tickets[i] = ticket ^ (1 << old) ^ (1 << new)
+                    self._apply(tickets[i], 1)
+                    improved = True
+                if time.monotonic() >= deadline:
+                    break
+
+    def design(self):
+        """Return a dict with the tickets (number lists) and the coverage achieved"""
+        start = time.monotonic()
+        deadline = start + self.time_limit
+        budget = min(self.tickets_budget, comb(self.size, Config.NUMBERS_PER_SET))
+
+        tickets = []
+        for _ in range(budget):
+            if self.covered == self.total_subsets:
+                break
+            ticket = self._build_ticket()
+            self._apply(ticket, 1)
+            tickets.append(ticket)
+
+        self._local_search(tickets, deadline)
+
+        return {
+            'pool': self.pool,
+            't': self.t,
+            'tickets': [[self.pool[p] for p in _positions(ticket)] for ticket in tickets],
+            'covered': self.covered,
+            'total_subsets': self.total_subsets,
+            'coverage': self.covered / self.total_subsets,
+            'seconds': time.monotonic() - start,
+        }
+
+
+def format_wheel_message(result):
+    """Markdown Telegram message for a designed wheel"""
+    subset_name = {2: "pairs", 3: "triples", 4: "quads", 5: "quints", 6: "sextets"}[result['t']]
+    message = f"🎡 *TOTO Wheel* ({len(result['pool'])} numbers, {len(result['tickets'])} tickets)\n"
+    message += (f"📐 Covers {result['covered']}/{result['total_subsets']} {subset_name} "
+                f"({result['coverage']:.1%})\n\n")
+    for i, ticket in enumerate(result['tickets'], start=1):
+        message += f"*Ticket {i}:* `{format_numbers(ticket)}`\n"
+    return message.rstrip()
+
+
+def parse_wheel_request(text):
+    """Parse '/wheel <numbers...> [tickets=N] [t=2|3|4]'. Returns dict or None"""
+    parts = text.replace(',', ' ').split()[1:]
+    pool = []
+    options = {'tickets': Config.WHEEL_DEFAULT_TICKETS, 't': 3}
+    try:
+        for part in parts:
+            if '=' in part:
+                key, value = part.split('=', 1)
+                if key in options:
+                    options[key] = int(value)
+            else:
+                pool.append(int(part))
+    except ValueError:
+        return None
+
+    min_num, max_num = Config.NUMBER_RANGE
+    pool = sorted(set(pool))
+    if len(pool) < Config.NUMBERS_PER_SET or any(not min_num <= n <= max_num for n in pool):
+        return None
+    if not 1 <= options['tickets'] <= Config.WHEEL_MAX_TELEGRAM_TICKETS or options['t'] not in (2, 3, 4):
+        return None
+    return {'pool': pool, 'tickets': options['tickets'], 't': options['t']}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Design a coverage-optimised TOTO wheel")
+    parser.add_argument("--pool", required=True, help="Comma-separated pool numbers, e.g. 1,5,9,...")
+    parser.add_argument("--tickets", type=int, default=Config.WHEEL_DEFAULT_TICKETS)
+    parser.add_argument("--t", type=int, default=3, help="Subset size to cover (2=pairs, 3=triples, 4=quads)")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    pool = [int(n) for n in args.pool.split(',') if n.strip()]
+    result = WheelDesigner(pool, args.tickets, args.t, seed=args.seed).design()
+    for i, ticket in enumerate(result['tickets'], start=1):
+        print(f"Ticket {i}: {format_numbers(ticket)}")
+    print(f"Coverage: {result['covered']}/{result['total_subsets']} ({result['coverage']:.1%}) "
+          f"in {result['seconds']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()